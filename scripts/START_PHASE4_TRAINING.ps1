@@ -30,14 +30,11 @@ Write-Host "====================================================================
 Write-Host "STEP 1: PREPARE PHASE 4 DATASET"
 Write-Host "========================================================================"
 Write-Host ""
-Write-Host "This will process 40 samples from prepared_sources/vago_samples_selected"
+Write-Host "Incremental build from prepared_sources/vago_samples_selected"
+Write-Host "(transcriptions from <clip>.wav.txt, only new/changed clips are processed)"
 Write-Host ""
-Write-Host "IMPORTANT: You need to update transcriptions in prepare_phase4_dataset.py" -ForegroundColor Yellow
-Write-Host "           Listen to each audio file and update the TRANSCRIPTIONS dict" -ForegroundColor Yellow
-Write-Host ""
-Read-Host "Press Enter to continue if transcriptions are ready, or Ctrl+C to cancel"
 
-& $python scripts/prepare_phase4_dataset.py
+& $python scripts/build_phase4_dataset.py
 if ($LASTEXITCODE -ne 0) {
     Write-Host ""
     Write-Host "ERROR: Dataset preparation failed!" -ForegroundColor Red
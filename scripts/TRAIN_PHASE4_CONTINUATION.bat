@@ -29,11 +29,11 @@ echo ========================================================================
 echo STEP 1: PREPARE PHASE 4 DATASET
 echo ========================================================================
 echo.
-echo This will process 40 samples from prepared_sources/vago_samples_selected
+echo Incremental build from prepared_sources/vago_samples_selected
+echo (only new or changed clips are processed)
 echo.
-pause
 
-python scripts\prepare_phase4_dataset.py
+python scripts\build_phase4_dataset.py
 if %ERRORLEVEL% NEQ 0 (
     echo.
     echo ERROR: Dataset preparation failed!
@@ -0,0 +1,347 @@
+"""
+Artifact Store - Content-Addressed Model Files
+==============================================
+Local store for the XTTS base files (dvae.pth, mel_stats.pth, vocab.json, ...)
+that every script resolves by name instead of hard-coded download code and
+Windows paths.
+
+- files live once under models/store/objects/<sha256[:2]>/<sha256>, read-only
+- names map to hashes in models/store/index.json
+- downloads are streamed to disk (never held in memory) and hashed on the fly;
+  the first verified hash of a name is pinned in models/artifact_pins.json
+  (trust on first use) and every later fetch or mirror copy must match it
+- offline boxes: files are taken from mirror directories before the network
+  (ARTIFACT_MIRROR=dir1<pathsep>dir2, the old models/ folder and the TTS model cache)
+- `dedupe` replaces identical files in run directories with hard links to the store
+  (config.json is left alone: the Trainer rewrites it in place on resume)
+
+Usage:
+  from artifact_store import ArtifactStore
+  store = ArtifactStore()
+  dvae_path = store.path("dvae.pth")            # fetched + verified if missing
+
+  python scripts/artifact_store.py fetch                  # all known XTTS files
+  python scripts/artifact_store.py seed /mnt/usb/xtts     # import a mirror directory
+  python scripts/artifact_store.py export /mnt/usb/xtts   # write a mirror for another box
+  python scripts/artifact_store.py dedupe run/            # hard-link duplicate vocab/dvae/mel_stats files
+  python scripts/artifact_store.py verify
+"""
+
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import stat
+import sys
+import tempfile
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+STORE_ROOT = PROJECT_ROOT / "models" / "store"
+PINS_FILE = PROJECT_ROOT / "models" / "artifact_pins.json"
+MIRROR_ENV = "ARTIFACT_MIRROR"
+CHUNK_SIZE = 1024 * 1024
+
+XTTS_BASE_URL = "https://coqui.gateway.scarf.sh/hf-coqui/XTTS-v2/main"
+KNOWN_ARTIFACTS = {
+    name: f"{XTTS_BASE_URL}/{name}"
+    for name in ("dvae.pth", "mel_stats.pth", "vocab.json", "config.json", "speakers_xtts.pth")
+}
+# Never config.json - Trainer.copy_model_files reopens it with "w" on resume, which would truncate
+# the shared store object (as root) or fail on the read-only link
+DEDUPE_NAMES = tuple(name for name in KNOWN_ARTIFACTS if name != "config.json")
+
+
+class IntegrityError(Exception):
+    """A file's hash does not match its pinned hash"""
+
+
+def tts_cache_dir():
+    """Where TTS keeps downloaded models (the path the scripts used to hard-code)"""
+    if sys.platform == "win32":
+        base = Path(os.environ.get("LOCALAPPDATA", Path.home() / "AppData" / "Local"))
+    elif sys.platform == "darwin":
+        base = Path.home() / "Library" / "Application Support"
+    else:
+        base = Path(os.environ.get("XDG_DATA_HOME", Path.home() / ".local" / "share"))
+    return base / "tts" / "tts_models--multilingual--multi-dataset--xtts_v2"
+
+
+def default_mirrors():
+    mirrors = [Path(p) for p in os.environ.get(MIRROR_ENV, "").split(os.pathsep) if p]
+    return mirrors + [PROJECT_ROOT / "models", tts_cache_dir()]
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _read_json(path):
+    if path.exists():
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+
+def _write_json(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def _link_or_copy(source, target):
+    """Hard link source at target (atomic replace), copy if linking is not possible"""
+    tmp_path = target.with_name(target.name + ".tmp")
+    if tmp_path.exists():
+        tmp_path.unlink()
+    try:
+        os.link(source, tmp_path)
+    except OSError:
+        shutil.copyfile(source, tmp_path)
+    os.replace(tmp_path, target)
+
+
+class ArtifactStore:
+    """Name -> sha256 -> one read-only object file"""
+
+    def __init__(self, root=STORE_ROOT, mirrors=None, pins_file=PINS_FILE):
+        self.root = Path(root)
+        self.objects = self.root / "objects"
+        self.index_file = self.root / "index.json"
+        self.pins_file = Path(pins_file)
+        self.mirrors = default_mirrors() if mirrors is None else [Path(m) for m in mirrors]
+        self.index = _read_json(self.index_file)
+        self.pins = _read_json(self.pins_file)
+
+    def object_path(self, sha256):
+        return self.objects / sha256[:2] / sha256
+
+    def _check_pin(self, name, sha256, source):
+        pinned = self.pins.get(name)
+        if pinned is not None and pinned != sha256:
+            raise IntegrityError(f"{name} from {source} has sha256 {sha256}, pinned {pinned}")
+
+    def _record(self, name, sha256, size, source):
+        if name not in self.pins:
+            self.pins[name] = sha256  # trust on first use
+            _write_json(self.pins_file, self.pins)
+        self.index[name] = {"sha256": sha256, "size": size, "source": str(source),
+                            "added": datetime.datetime.now().isoformat(timespec="seconds")}
+        _write_json(self.index_file, self.index)
+
+    def _store_object(self, tmp_path, sha256):
+        """Move a verified temp file into objects/ (no-op if the content is already there)"""
+        target = self.object_path(sha256)
+        if target.exists():
+            tmp_path.unlink()
+        else:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.chmod(tmp_path, stat.S_IREAD | stat.S_IRGRP | stat.S_IROTH)  # linked copies must stay intact
+            os.replace(tmp_path, target)
+        return target
+
+    def _temp_file(self):
+        self.objects.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.objects, suffix=".part")
+        os.close(fd)
+        return Path(tmp)
+
+    def add_file(self, path, name=None):
+        """Import a local file under name (default: its file name). Returns the object path."""
+        path = Path(path)
+        name = name or path.name
+        sha256 = sha256_file(path)
+        self._check_pin(name, sha256, path)
+        target = self.object_path(sha256)
+        if not target.exists():
+            tmp_path = self._temp_file()
+            shutil.copyfile(path, tmp_path)
+            if sha256_file(tmp_path) != sha256:  # changed while copying
+                tmp_path.unlink()
+                raise IntegrityError(f"{path} changed while it was being copied")
+            self._store_object(tmp_path, sha256)
+        self._record(name, sha256, target.stat().st_size, path)
+        return target
+
+    def download(self, name, url):
+        """Stream url to disk, hashing as it arrives"""
+        import requests
+
+        print(f"   Downloading {name}...")
+        tmp_path = self._temp_file()
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with requests.get(url, stream=True, timeout=60) as response:
+                response.raise_for_status()
+                total = int(response.headers.get("Content-Length", 0))
+                next_report = 0.1
+                with open(tmp_path, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        f.write(chunk)
+                        digest.update(chunk)
+                        size += len(chunk)
+                        if total and size / total >= next_report:
+                            print(f"      {size / 1024**2:.0f} / {total / 1024**2:.0f} MB")
+                            next_report += 0.1
+                    f.flush()
+                    os.fsync(f.fileno())
+            if total and size != total:
+                raise IntegrityError(f"{name}: got {size} bytes, expected {total}")
+            sha256 = digest.hexdigest()
+            self._check_pin(name, sha256, url)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        target = self._store_object(tmp_path, sha256)
+        self._record(name, sha256, size, url)
+        print(f"   ✅ Downloaded: {name} ({size / 1024**2:.1f} MB, sha256 {sha256[:12]})")
+        return target
+
+    def mirror_candidates(self, name):
+        """Files that may hold name, in mirror order"""
+        pinned = self.pins.get(name)
+        for mirror in self.mirrors:
+            for candidate in (mirror / name, mirror / "objects" / pinned[:2] / pinned if pinned else None):
+                if candidate is not None and candidate.is_file():
+                    yield candidate
+
+    def path(self, name, url=None):
+        """Local path of an artifact: store -> mirrors -> download"""
+        entry = self.index.get(name)
+        if entry is not None and self.object_path(entry["sha256"]).exists():
+            return self.object_path(entry["sha256"])
+
+        for mirrored in self.mirror_candidates(name):
+            try:
+                target = self.add_file(mirrored, name)
+            except IntegrityError as e:  # stale or foreign copy - try the next source
+                print(f"   ⚠️  Skipping mirror copy: {e}")
+                continue
+            print(f"   ✅ {name} from mirror {mirrored.parent}")
+            return target
+
+        url = url or KNOWN_ARTIFACTS.get(name)
+        if url is None:
+            raise FileNotFoundError(f"{name} is not in the store or any mirror and has no download URL")
+        return self.download(name, url)
+
+    def verify(self):
+        """Re-hash every object. Returns the names whose object is missing or corrupt."""
+        bad = []
+        for name, entry in sorted(self.index.items()):
+            path = self.object_path(entry["sha256"])
+            ok = path.exists() and sha256_file(path) == entry["sha256"]
+            print(f"   {'✅' if ok else '❌'} {name} ({entry['sha256'][:12]})")
+            if not ok:
+                bad.append(name)
+        return bad
+
+    def export(self, mirror_dir):
+        """Write every named artifact to mirror_dir (for offline boxes)"""
+        mirror_dir = Path(mirror_dir)
+        mirror_dir.mkdir(parents=True, exist_ok=True)
+        for name, entry in self.index.items():
+            shutil.copyfile(self.object_path(entry["sha256"]), mirror_dir / name)
+            print(f"   ✅ {name}")
+
+    def _unshare(self, path):
+        """Replace a hard link to a store object with a private, writable copy"""
+        object_path = self.object_path(sha256_file(path))
+        if not (object_path.exists() and os.path.samefile(path, object_path)):
+            return
+        tmp_path = path.with_name(path.name + ".tmp")
+        shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, path)
+        print(f"   ✂️  {path} (private copy)")
+
+    def dedupe(self, directories, names=DEDUPE_NAMES):
+        """
+        Replace identical model files under directories with hard links to one
+        store object (a stored artifact, or a new unnamed object for files that
+        only repeat across runs). Returns bytes saved.
+        """
+        groups = {}
+        for directory in map(Path, directories):
+            for path in sorted(directory.rglob("*")):
+                if path.name == "config.json" and path.is_file() and path.stat().st_nlink > 1:
+                    self._unshare(path)  # linked by an earlier dedupe - give the run its own writable copy
+                elif path.name in names and path.is_file() and not path.is_symlink():
+                    groups.setdefault(sha256_file(path), []).append(path)
+
+        saved = 0
+        for sha256, paths in groups.items():
+            object_path = self.object_path(sha256)
+            if not object_path.exists():
+                if len(paths) < 2:
+                    continue
+                tmp_path = self._temp_file()
+                shutil.copyfile(paths[0], tmp_path)
+                self._store_object(tmp_path, sha256)
+            for path in paths:
+                if os.path.samefile(path, object_path):
+                    continue
+                size = path.stat().st_size
+                _link_or_copy(object_path, path)
+                saved += size
+                print(f"   🔗 {path} ({size / 1024:.0f} KB)")
+        return saved
+
+
+def resolve_model_file(name, directory=None, store=None):
+    """name from directory if it has one (e.g. a run's vocab.json), otherwise from the store"""
+    if directory is not None and (Path(directory) / name).exists():
+        return Path(directory) / name
+    return (store or ArtifactStore()).path(name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Content-addressed model artifact store")
+    sub = parser.add_subparsers(dest="command", required=True)
+    fetch = sub.add_parser("fetch", help="Fetch artifacts (default: all known XTTS files)")
+    fetch.add_argument("names", nargs="*")
+    add = sub.add_parser("add", help="Import a local file")
+    add.add_argument("file", type=Path)
+    add.add_argument("--name")
+    seed = sub.add_parser("seed", help="Import every file of a mirror directory")
+    seed.add_argument("mirror", type=Path)
+    export = sub.add_parser("export", help="Copy named artifacts to a mirror directory")
+    export.add_argument("mirror", type=Path)
+    dedupe = sub.add_parser("dedupe", help="Hard-link duplicate model files in run directories")
+    dedupe.add_argument("directories", nargs="+", type=Path)
+    sub.add_parser("verify", help="Re-hash every stored object")
+    sub.add_parser("list", help="Show named artifacts")
+    args = parser.parse_args()
+
+    store = ArtifactStore()
+    if args.command == "fetch":
+        for name in args.names or KNOWN_ARTIFACTS:
+            print(f"{name}: {store.path(name)}")
+    elif args.command == "add":
+        print(store.add_file(args.file, args.name))
+    elif args.command == "seed":
+        for path in sorted(p for p in args.mirror.iterdir() if p.is_file()):
+            store.add_file(path)
+            print(f"   ✅ {path.name}")
+    elif args.command == "export":
+        store.export(args.mirror)
+    elif args.command == "dedupe":
+        saved = store.dedupe(args.directories)
+        print(f"💾 {saved / 1024**2:.1f} MB saved")
+    elif args.command == "verify":
+        sys.exit(1 if store.verify() else 0)
+    elif args.command == "list":
+        for name, entry in sorted(store.index.items()):
+            print(f"{name:<24}{entry['size'] / 1024**2:>10.1f} MB  {entry['sha256'][:16]}  {entry['source']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+Audio I/O - Shared Audio Loading for Training and Inference
+===========================================================
+One replacement for TTS.tts.models.xtts.load_audio (torchaudio.load goes
+through torchcodec, which is broken on Windows with PyTorch nightly).
+Used by training, the eval service and inference instead of per-script
+monkey-patches.
+
+- soundfile reads straight to float32 (no float64 round trip)
+- optional memory-mapped reads for PCM/float WAV files (only the requested
+  frames are touched - cheap conditioning crops)
+- correct channel handling: (channels, samples), stereo is downmixed to mono
+- resampling with the same windowed-sinc kernel as torchaudio.functional.resample,
+  built once per (orig_sr, target_sr) and cached instead of per file
+- output is clipped to [-1, 1] like the original load_audio
+
+Usage:
+  import audio_io
+  audio_io.install()                     # before importing GPTTrainer / Xtts users
+  wav = audio_io.load_audio("a.wav", 22050)
+
+Benchmark (per-file load cost, old per-call resampler vs cached):
+  python scripts/audio_io.py benchmark prepared_sources/vago_samples_selected --sr 22050
+  python scripts/audio_io.py benchmark --synthetic 20
+"""
+
+import argparse
+import functools
+import math
+import os
+import struct
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+import torch
+
+LOWPASS_FILTER_WIDTH = 6  # torchaudio defaults
+ROLLOFF = 0.99
+
+_WAVE_FORMAT_PCM = 1
+_WAVE_FORMAT_IEEE_FLOAT = 3
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+_MMAP_DTYPES = {(_WAVE_FORMAT_PCM, 16): ("<i2", 1 / 32768), (_WAVE_FORMAT_PCM, 32): ("<i4", 1 / 2**31),
+                (_WAVE_FORMAT_IEEE_FLOAT, 32): ("<f4", 1.0)}
+
+
+# ----------------------------------------
+# Resampling
+# ----------------------------------------
+
+@functools.lru_cache(maxsize=32)
+def resample_kernel(orig_sr, target_sr):
+    """Windowed-sinc (Hann) polyphase kernel, as built by torchaudio.functional.resample"""
+    gcd = math.gcd(orig_sr, target_sr)
+    orig, new = orig_sr // gcd, target_sr // gcd
+    base_freq = min(orig, new) * ROLLOFF
+    width = math.ceil(LOWPASS_FILTER_WIDTH * orig / base_freq)
+    idx = torch.arange(-width, width + orig, dtype=torch.float64)[None, None] / orig
+    t = torch.arange(0, -new, -1, dtype=torch.float64)[:, None, None] / new + idx
+    t *= base_freq
+    t = t.clamp_(-LOWPASS_FILTER_WIDTH, LOWPASS_FILTER_WIDTH)
+    window = torch.cos(t * math.pi / LOWPASS_FILTER_WIDTH / 2) ** 2
+    t *= math.pi
+    kernel = torch.where(t == 0, torch.tensor(1.0, dtype=t.dtype), t.sin() / t)
+    kernel *= window * (base_freq / orig)
+    return kernel.to(torch.float32), width
+
+
+def resample(audio, orig_sr, target_sr, kernel=None):
+    """Resample (..., samples) float32 audio; kernel=None uses the cached kernel"""
+    if orig_sr == target_sr:
+        return audio
+    if kernel is None:
+        kernel = resample_kernel(orig_sr, target_sr)
+    kernel, width = kernel
+    gcd = math.gcd(orig_sr, target_sr)
+    orig, new = orig_sr // gcd, target_sr // gcd
+    shape = audio.shape
+    audio = audio.reshape(-1, shape[-1])
+    length = audio.shape[-1]
+    padded = torch.nn.functional.pad(audio, (width, width + orig))
+    out = torch.nn.functional.conv1d(padded[:, None], kernel.to(audio.device), stride=orig)
+    out = out.transpose(1, 2).reshape(audio.shape[0], -1)
+    out = out[..., :math.ceil(new * length / orig)]
+    return out.reshape(shape[:-1] + out.shape[-1:])
+
+
+# ----------------------------------------
+# Reading
+# ----------------------------------------
+
+@functools.lru_cache(maxsize=4096)
+def _wav_layout(path, mtime):
+    """(offset, frames, channels, sample_rate, dtype, scale) of a mmap-able WAV, else None"""
+    with open(path, "rb") as f:
+        header = f.read(12)
+        if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+            return None
+        fmt = None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                return None
+            chunk_id, size = chunk[:4], struct.unpack("<I", chunk[4:])[0]
+            if chunk_id == b"fmt ":
+                data = f.read(size)
+                tag, channels, sample_rate = struct.unpack("<HHI", data[:8])
+                bits = struct.unpack("<H", data[14:16])[0]
+                if tag == _WAVE_FORMAT_EXTENSIBLE and len(data) >= 26:
+                    tag = struct.unpack("<H", data[24:26])[0]
+                fmt = (tag, channels, sample_rate, bits)
+            elif chunk_id == b"data":
+                if fmt is None or (fmt[0], fmt[3]) not in _MMAP_DTYPES:
+                    return None
+                tag, channels, sample_rate, bits = fmt
+                dtype, scale = _MMAP_DTYPES[(tag, bits)]
+                return f.tell(), size // (channels * bits // 8), channels, sample_rate, dtype, scale
+            else:
+                f.seek(size + (size & 1), os.SEEK_CUR)  # chunks are word aligned
+
+
+def read_audio(path, start=0, frames=-1, mmap=False):
+    """float32 (samples, channels) array and its sample rate"""
+    path = str(path)
+    if mmap:
+        layout = _wav_layout(path, os.path.getmtime(path))
+        if layout is not None:
+            offset, total, channels, sample_rate, dtype, scale = layout
+            end = total if frames < 0 else min(total, start + frames)
+            data = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(total, channels))[start:end]
+            audio = data.astype(np.float32)
+            if scale != 1.0:
+                audio *= scale
+            return audio, sample_rate
+    # Other formats (24-bit PCM, FLAC, ...) go through libsndfile
+    audio, sample_rate = sf.read(path, start=start, frames=frames, dtype="float32", always_2d=True)
+    return audio, sample_rate
+
+
+def to_mono(audio):
+    """(channels, samples) -> (1, samples)"""
+    if audio.shape[0] == 1:
+        return audio
+    return audio.mean(dim=0, keepdim=True)
+
+
+def load_audio(audiopath, sampling_rate=None, mmap=False):
+    """
+    Drop-in for TTS.tts.models.xtts.load_audio: (1, samples) float32 mono
+    at sampling_rate (None keeps the file's rate), clipped to [-1, 1].
+    """
+    audio, sample_rate = read_audio(audiopath, mmap=mmap)
+    audio = to_mono(torch.from_numpy(np.ascontiguousarray(audio.T)))
+    if sampling_rate is not None and sample_rate != sampling_rate:
+        audio = resample(audio, sample_rate, sampling_rate)
+    return audio.clip_(-1, 1)
+
+
+def install(mmap=False):
+    """Route every TTS load_audio user (Xtts conditioning, XTTSDataset) through load_audio"""
+    import TTS.tts.layers.xtts.trainer.dataset as xtts_dataset
+    import TTS.tts.models.xtts as xtts_module
+
+    loader = functools.partial(load_audio, mmap=mmap) if mmap else load_audio
+    xtts_module.load_audio = loader
+    # dataset.py did `from TTS.tts.models.xtts import load_audio` - patch its copy too
+    xtts_dataset.load_audio = loader
+    return loader
+
+
+# ----------------------------------------
+# Benchmark
+# ----------------------------------------
+
+def legacy_load_audio(audiopath, sample_rate=22050):
+    """The old per-script loader: float64 read and a new resampler on every call"""
+    audio, sr = sf.read(audiopath)
+    audio = torch.FloatTensor(audio)
+    if audio.dim() == 1:
+        audio = audio.unsqueeze(0)
+    else:
+        audio = audio.transpose(0, 1)
+        if audio.shape[0] > 1:
+            audio = audio.mean(dim=0, keepdim=True)
+    if sr != sample_rate:
+        try:
+            import torchaudio.transforms as T
+            audio = T.Resample(sr, sample_rate)(audio)
+        except ImportError:
+            # Same work as constructing T.Resample: the kernel is rebuilt for every file
+            audio = resample(audio, sr, sample_rate, kernel=resample_kernel.__wrapped__(sr, sample_rate))
+    return audio
+
+
+def write_synthetic_files(directory, count, sample_rate=44100, seconds=8.0, channels=2):
+    """Stereo 16-bit WAVs at 44.1 kHz - the worst case the loaders see"""
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(count):
+        t = np.arange(int(sample_rate * seconds)) / sample_rate
+        tone = 0.3 * np.sin(2 * np.pi * (200 + 20 * i) * t)
+        audio = np.stack([tone + 0.01 * rng.standard_normal(t.size) for _ in range(channels)], axis=1)
+        path = Path(directory) / f"synthetic_{i:03d}.wav"
+        sf.write(path, audio.astype(np.float32), sample_rate, subtype="PCM_16")
+        paths.append(path)
+    return paths
+
+
+def benchmark(paths, sample_rate=22050, repeats=3):
+    loaders = {
+        "legacy (new resampler per call)": lambda p: legacy_load_audio(str(p), sample_rate),
+        "audio_io (cached kernel)": lambda p: load_audio(p, sample_rate),
+        "audio_io (cached kernel + mmap)": lambda p: load_audio(p, sample_rate, mmap=True),
+    }
+    for loader in loaders.values():
+        loader(paths[0])  # warm-up (kernel cache, page cache)
+
+    results = {}
+    for name, loader in loaders.items():
+        start = time.perf_counter()
+        for _ in range(repeats):
+            for path in paths:
+                loader(path)
+        results[name] = (time.perf_counter() - start) / (repeats * len(paths)) * 1000
+
+    reference = legacy_load_audio(str(paths[0]), sample_rate)
+    max_diff = (reference - load_audio(paths[0], sample_rate)).abs().max().item()
+    base = results["legacy (new resampler per call)"]
+    print(f"{'Loader':<36}{'ms/file':>10}{'Speedup':>10}")
+    for name, ms in results.items():
+        print(f"{name:<36}{ms:>10.2f}{base / ms:>9.2f}x")
+    print(f"\nMax difference vs legacy output: {max_diff:.2e}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared audio loading")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench = sub.add_parser("benchmark", help="Per-file load cost: legacy loader vs audio_io")
+    bench.add_argument("paths", nargs="*", help="WAV files or directories")
+    bench.add_argument("--sr", type=int, default=22050, help="Target sample rate")
+    bench.add_argument("--synthetic", type=int, default=0, help="Generate N stereo 44.1 kHz files instead")
+    bench.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("🔊 AUDIO LOADING BENCHMARK")
+    print("=" * 80)
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for item in map(Path, args.paths):
+            paths.extend(sorted(item.glob("*.wav")) if item.is_dir() else [item])
+        if args.synthetic:
+            paths.extend(write_synthetic_files(tmp, args.synthetic))
+        if not paths:
+            parser.error("no audio files (pass paths or --synthetic N)")
+        print(f"Files: {len(paths)}, target rate: {args.sr} Hz\n")
+        benchmark(paths, args.sr, args.repeats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+"""
+Batch Size Finder - Largest Batch That Fits + Gradient Accumulation
+===================================================================
+Probes the initialized Trainer before trainer.fit() instead of guessing
+BATCH_SIZE by trial and error:
+- builds batches from the longest training samples within max_wav_length /
+  max_text_length (worst case for padding)
+- runs forward/backward passes at growing batch sizes (1, 2, 4, ... then a
+  binary search) and measures peak memory and step time
+- memory for the AdamW state is added if the optimizer has none yet
+- stops before a batch is predicted to exceed the memory budget (CPU runs
+  can't recover from running out of RAM), CUDA OOMs are caught as well
+- picks grad_accum_steps so batch_size x grad_accum_steps reaches the
+  requested effective batch
+
+Results are cached per hardware + config (precision, gradient checkpointing,
+max_wav_length, trainable parameters, longest sample) in
+run/batch_size_cache.json, so later runs skip the probe.
+
+Usage (after the Trainer is created, before trainer.fit()):
+  plan = find_batch_plan(trainer, train_samples, effective_batch_size=4)
+  apply_batch_plan(trainer, plan)
+"""
+
+import hashlib
+import json
+import math
+import os
+import platform
+import time
+from pathlib import Path
+
+import soundfile as sf
+import torch
+
+from build_training_index import classify_sample
+from gpt_lora import find_gpt2
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+CACHE_PATH = PROJECT_ROOT / "run" / "batch_size_cache.json"
+MEMORY_FRACTION = 0.9  # of device memory (CUDA) or RAM available at start (CPU)
+MAX_BATCH_SIZE = 32
+PROBE_PASSES = 2  # the first pass is warm-up, the last one is timed
+
+
+def sample_duration(sample):
+    try:
+        info = sf.info(sample["audio_file"])
+        return info.frames / info.samplerate
+    except RuntimeError:
+        return 0.0
+
+
+def rank_by_length(samples):
+    """Samples sorted longest first by audio length (WAV header only), then text length"""
+    return sorted(samples, key=lambda s: (sample_duration(s), len(s["text"])), reverse=True)
+
+
+def longest_loadable(trainer, ranked, n):
+    """
+    The n longest samples XTTSDataset will actually load. Anything over
+    max_wav_length / max_text_length (or too short) is swapped for another
+    sample by the dataset - checked with the build_training_index rules.
+    """
+    model_args = trainer.config.model_args
+    tokenizer = trainer.model.xtts.tokenizer
+    loadable = []
+    for sample in ranked:
+        entry = classify_sample(sample, Path(), tokenizer, sample.get("language", "hu"),
+                                trainer.config.audio.sample_rate, model_args.max_wav_length, model_args.max_text_length)
+        if entry["status"] == "valid":
+            loadable.append(sample)
+            if len(loadable) == n:
+                break
+    return loadable
+
+
+def worst_case_samples(ranked, n):
+    """The n longest samples, repeated if there are fewer"""
+    return [ranked[i % len(ranked)] for i in range(n)]
+
+
+# ----------------------------------------
+# Memory measurement
+# ----------------------------------------
+
+def _proc_status_mb(field):
+    with open("/proc/self/status", 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+    raise KeyError(field)
+
+
+def reset_peak_memory(device):
+    if device.type == "cuda":
+        torch.cuda.reset_peak_memory_stats(device)
+        return
+    try:
+        # Linux: writing 5 to clear_refs resets the peak RSS (VmHWM)
+        with open("/proc/self/clear_refs", 'w', encoding='utf-8') as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def measure_peak_memory(device):
+    """Peak memory (MB) since reset_peak_memory"""
+    if device.type == "cuda":
+        return torch.cuda.max_memory_allocated(device) / 1024**2
+    try:
+        return _proc_status_mb("VmHWM")
+    except (OSError, KeyError):
+        from training_metrics import peak_memory_mb
+        return peak_memory_mb()
+
+
+def memory_budget_mb(device, fraction=MEMORY_FRACTION):
+    if device.type == "cuda":
+        return torch.cuda.get_device_properties(device).total_memory / 1024**2 * fraction
+    try:
+        with open("/proc/meminfo", 'r', encoding='utf-8') as f:
+            meminfo = {line.split(":")[0]: int(line.split()[1]) for line in f}
+        return (meminfo["MemAvailable"] / 1024 + _proc_status_mb("VmRSS")) * fraction
+    except (OSError, KeyError):
+        try:
+            import psutil
+            return (psutil.virtual_memory().available + psutil.Process().memory_info().rss) / 1024**2 * fraction
+        except ImportError:
+            return float("inf")
+
+
+def optimizer_state_mb(optimizer):
+    """AdamW keeps two fp32 tensors per trainable parameter - not allocated until the first step"""
+    params = [p for group in optimizer.param_groups for p in group["params"] if p.requires_grad]
+    if any(optimizer.state.get(p) for p in params):
+        return 0.0
+    return sum(2 * p.numel() * 4 for p in params) / 1024**2
+
+
+def is_out_of_memory(error):
+    return isinstance(error, torch.cuda.OutOfMemoryError) or "out of memory" in str(error).lower()
+
+
+# ----------------------------------------
+# Probing
+# ----------------------------------------
+
+def total_ram_gb():
+    try:
+        return round(os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 1024**3)
+    except (AttributeError, ValueError, OSError):
+        try:
+            import psutil
+            return round(psutil.virtual_memory().total / 1024**3)
+        except ImportError:
+            return None
+
+
+def hardware_key(device):
+    if device.type == "cuda":
+        props = torch.cuda.get_device_properties(device)
+        return {"device": props.name, "memory_gb": round(props.total_memory / 1024**3)}
+    return {"device": platform.processor() or platform.machine(), "cores": os.cpu_count(), "memory_gb": total_ram_gb()}
+
+
+def cache_key(trainer, device, longest):
+    config = trainer.config
+    model_args = config.model_args
+    trainable = sum(p.numel() for p in trainer.model.parameters() if p.requires_grad)
+    key = {
+        **hardware_key(device),
+        "torch": torch.__version__,
+        "precision": config.precision if config.mixed_precision else "fp32",
+        "gradient_checkpointing": find_gpt2(trainer.model).is_gradient_checkpointing,
+        "max_wav_length": model_args.max_wav_length,
+        "max_text_length": model_args.max_text_length,
+        "trainable_params": trainable,
+        "longest_sample": [round(sample_duration(longest), 2), len(longest["text"])],
+    }
+    digest = hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()[:16]
+    return digest, key
+
+
+def probe_batch(trainer, ranked, batch_size):
+    """Forward/backward on one worst-case batch. Returns (peak MB, seconds per pass)."""
+    device = next(trainer.model.parameters()).device
+    config = trainer.config
+    original = config.batch_size
+    config.batch_size = batch_size
+    try:
+        loader = trainer.model.get_data_loader(config, trainer.training_assets, False,
+                                               worst_case_samples(ranked, batch_size), False, 1)
+        batch = trainer.format_batch(next(iter(loader)))
+        reset_peak_memory(device)
+        seconds = 0.0
+        for _ in range(PROBE_PASSES):
+            start = time.perf_counter()
+            _, loss_dict = trainer._compute_loss(batch, trainer.model, trainer.criterion, config, None)
+            loss_dict["loss"].backward()
+            if device.type == "cuda":
+                torch.cuda.synchronize(device)
+            seconds = time.perf_counter() - start
+            del loss_dict
+        return measure_peak_memory(device), seconds
+    finally:
+        config.batch_size = original
+        trainer.model.zero_grad(set_to_none=True)
+        if device.type == "cuda":
+            torch.cuda.empty_cache()
+
+
+def search_batch_size(trainer, ranked, max_batch_size=MAX_BATCH_SIZE, fraction=MEMORY_FRACTION):
+    """Largest batch size whose peak memory (+ optimizer state) fits the budget"""
+    device = next(trainer.model.parameters()).device
+    budget = memory_budget_mb(device, fraction)
+    extra = optimizer_state_mb(trainer.optimizer)
+    probes = {}
+
+    def fits(batch_size):
+        if batch_size in probes:
+            return probes[batch_size]["fits"]
+        # Extrapolate from the two largest successful probes before trying (no OOM on CPU)
+        ok = sorted((b, p["peak_mb"]) for b, p in probes.items() if p["fits"])
+        if len(ok) >= 2:
+            (b1, m1), (b2, m2) = ok[-2:]
+            predicted = m2 + (m2 - m1) / (b2 - b1) * (batch_size - b2)
+            if predicted + extra > budget:
+                probes[batch_size] = {"fits": False, "predicted_mb": round(predicted, 1)}
+                print(f"   ✗ batch {batch_size}: predicted {predicted + extra:.0f} MB > budget {budget:.0f} MB")
+                return False
+        try:
+            peak, seconds = probe_batch(trainer, ranked, batch_size)
+        except (RuntimeError, torch.cuda.OutOfMemoryError) as e:
+            if not is_out_of_memory(e):
+                raise
+            probes[batch_size] = {"fits": False, "oom": True}
+            print(f"   ✗ batch {batch_size}: out of memory")
+            return False
+        ok = peak + extra <= budget
+        probes[batch_size] = {"fits": ok, "peak_mb": round(peak, 1), "seconds": round(seconds, 4),
+                              "samples_per_sec": round(batch_size / seconds, 3)}
+        mark = "✓" if ok else "✗"
+        print(f"   {mark} batch {batch_size}: {peak + extra:.0f} MB (budget {budget:.0f} MB), "
+              f"{batch_size / seconds:.2f} samples/s")
+        return ok
+
+    # Grow by doubling, then binary search between the last fit and the first failure
+    low, high = 0, None
+    batch_size = 1
+    while batch_size <= max_batch_size:
+        if not fits(batch_size):
+            high = batch_size
+            break
+        low = batch_size
+        batch_size *= 2
+    if high is None:
+        high = max_batch_size + 1
+        if low < max_batch_size and fits(max_batch_size):
+            low = max_batch_size
+    while high - low > 1:
+        middle = (low + high) // 2
+        if fits(middle):
+            low = middle
+        else:
+            high = middle
+    return low, {"budget_mb": round(budget, 1), "optimizer_state_mb": round(extra, 1),
+                 "probes": {str(b): p for b, p in sorted(probes.items())}}
+
+
+def plan_accumulation(max_batch_size, effective_batch_size):
+    """Fewest accumulation steps, then the smallest batch that still reaches the effective batch"""
+    grad_accum_steps = math.ceil(effective_batch_size / max_batch_size)
+    batch_size = math.ceil(effective_batch_size / grad_accum_steps)
+    return batch_size, grad_accum_steps
+
+
+def _load_cache(path):
+    if path.exists():
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+
+def _write_cache(path, cache):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def find_batch_plan(trainer, samples, effective_batch_size, max_batch_size=MAX_BATCH_SIZE,
+                    cache_path=CACHE_PATH, refresh=False):
+    """Batch size + grad accumulation for an effective batch, probed once per hardware/config"""
+    device = next(trainer.model.parameters()).device
+    ranked = longest_loadable(trainer, rank_by_length(samples), max_batch_size)
+    if not ranked:
+        raise ValueError("No training sample is within max_wav_length / max_text_length - nothing to probe with")
+    longest = ranked[0]
+    digest, key = cache_key(trainer, device, longest)
+    cache_path = Path(cache_path)
+    cache = _load_cache(cache_path)
+
+    if digest in cache and not refresh:
+        entry = cache[digest]
+        print(f"   ✅ Cached probe for this hardware/config ({entry['max_batch_size']} max, {entry['probed_at']})")
+    else:
+        print(f"   Probing with the longest samples ({sample_duration(longest):.1f}s audio)...")
+        max_fit, details = search_batch_size(trainer, ranked, max_batch_size)
+        if max_fit == 0:
+            raise RuntimeError("Even batch size 1 does not fit in memory - enable gradient checkpointing or bf16")
+        entry = dict(key=key, max_batch_size=max_fit, probed_at=time.strftime("%Y-%m-%d %H:%M"), **details)
+        cache[digest] = entry
+        _write_cache(cache_path, cache)
+
+    batch_size, grad_accum_steps = plan_accumulation(entry["max_batch_size"], effective_batch_size)
+    probe = entry["probes"].get(str(batch_size), {})
+    if "samples_per_sec" not in probe:
+        probe = entry["probes"][str(entry["max_batch_size"])]
+    # The probe skips the optimizer and data loading - treat it as an upper bound
+    samples_per_sec = probe["samples_per_sec"]
+    return {
+        "batch_size": batch_size,
+        "grad_accum_steps": grad_accum_steps,
+        "effective_batch_size": batch_size * grad_accum_steps,
+        "max_batch_size": entry["max_batch_size"],
+        "samples_per_sec": samples_per_sec,
+        "optimizer_steps_per_sec": samples_per_sec / (batch_size * grad_accum_steps),
+        "epoch_minutes": len(samples) / samples_per_sec / 60,
+        "cache_key": digest,
+    }
+
+
+def apply_batch_plan(trainer, plan):
+    """Use the plan for this run - the train loader is only built when fit() starts"""
+    trainer.config.batch_size = plan["batch_size"]
+    trainer.config.eval_batch_size = plan["batch_size"]
+    trainer.grad_accum_steps = plan["grad_accum_steps"]
+
+
+def print_batch_plan(plan):
+    print(f"   • Batch size: {plan['batch_size']} x {plan['grad_accum_steps']} accumulation steps "
+          f"= effective {plan['effective_batch_size']} (largest fitting batch: {plan['max_batch_size']})")
+    print(f"   • Expected throughput: ≤{plan['samples_per_sec']:.2f} samples/s, "
+          f"{plan['optimizer_steps_per_sec']:.3f} optimizer steps/s, ~{plan['epoch_minutes']:.1f} min/epoch")
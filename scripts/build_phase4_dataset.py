@@ -0,0 +1,306 @@
+"""
+Build Phase 4 Dataset - Incremental, Non-Interactive
+====================================================
+Single entry point that replaces the three manual steps
+(prepare_phase4_dataset.py -> update_metadata_from_txt.py -> fix_metadata_format.py).
+
+One streaming pass over prepared_sources/vago_samples_selected:
+- reads each clip's transcription from its <clip>.wav.txt file
+- resamples the clip to 22050 Hz mono (only if new or changed)
+- appends the row to metadata.csv in Coqui format (audio_file|text header)
+
+A manifest (dataset_phase4/manifest.json) records the source hashes and the
+processing parameters, so later runs only touch new or changed clips.
+No prompts - safe for unattended batch jobs.
+
+Usage:
+  python scripts/build_phase4_dataset.py            # incremental build
+  python scripts/build_phase4_dataset.py --force    # reprocess every clip
+"""
+
+import argparse
+import csv
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+# Paths
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+SOURCE_DIR = PROJECT_ROOT / "prepared_sources" / "vago_samples_selected"
+OUTPUT_DIR = PROJECT_ROOT / "dataset_phase4"
+MANIFEST_NAME = "manifest.json"
+METADATA_NAME = "metadata.csv"
+
+# Processing parameters - any change here invalidates every manifest entry
+PROCESSING_PARAMS = {
+    "target_sample_rate": 22050,  # XTTS-v2 training sample rate
+    "channels": 1,
+    "subtype": "PCM_16",
+    "resampler": "librosa",
+}
+
+CATEGORIES = ("excitement", "neutral", "question")
+CLIP_PATTERN = re.compile(r"^([a-z]+)(\d+)\.wav$")
+HASH_CHUNK_SIZE = 1 << 20  # 1 MB
+
+
+def extract_text_from_transcript(content):
+    """Extract spoken text from timestamped transcript content"""
+    lines = []
+    for line in content.split('\n'):
+        # Skip timestamp lines
+        if '-->' in line or '[Speaker' in line:
+            continue
+        # Skip stage directions like [közönség tapsol], [bevezető dallam]
+        if line.strip().startswith('[') and line.strip().endswith(']'):
+            continue
+        # Skip empty lines
+        if not line.strip():
+            continue
+
+        # Clean up any remaining stage directions within text
+        cleaned = re.sub(r'\[.*?\]', '', line).strip()
+        if cleaned:
+            lines.append(cleaned)
+
+    # Join all lines into single text
+    return ' '.join(lines).strip()
+
+
+def hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def params_fingerprint(params):
+    """Stable hash of the processing parameters"""
+    return hash_bytes(json.dumps(params, sort_keys=True).encode("utf-8"))
+
+
+def discover_clips(source_dir):
+    """List (category, index, path) for every known clip, in metadata order"""
+    clips = []
+    for path in source_dir.glob("*.wav"):
+        match = CLIP_PATTERN.match(path.name)
+        if not match or match.group(1) not in CATEGORIES:
+            continue
+        clips.append((CATEGORIES.index(match.group(1)), int(match.group(2)), match.group(1), path))
+    clips.sort()
+    return [(category, path) for _, _, category, path in clips]
+
+
+def load_manifest(manifest_path):
+    if not manifest_path.exists():
+        return {"version": 1, "params": {}, "params_sha256": None, "clips": {}}
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_metadata_rows(metadata_path):
+    """{audio_file: text} from an existing metadata.csv (empty if there is none)"""
+    if not metadata_path.exists():
+        return {}
+    with open(metadata_path, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f, delimiter='|')
+        next(reader, None)  # header
+        return {row[0]: row[1] for row in reader if len(row) >= 2}
+
+
+def write_atomic(path, data):
+    """Write bytes to path via a temp file + rename (never leaves a partial file)"""
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
+def output_is_current(entry, output_path, source_sha, params_sha):
+    """True if the manifest says this output was built from the same source and params"""
+    if not entry or not output_path.exists():
+        return False
+    if entry.get("source_sha256") != source_sha or entry.get("params_sha256") != params_sha:
+        return False
+    stat = output_path.stat()
+    return entry.get("output_size") == stat.st_size and entry.get("output_mtime_ns") == stat.st_mtime_ns
+
+
+def process_clip(source_bytes, output_path, params):
+    """Decode, downmix, resample and write one clip. Returns source duration in seconds."""
+    audio, sr = sf.read(io.BytesIO(source_bytes), dtype="float32")
+    duration = len(audio) / sr
+
+    # Downmix to mono - XTTS trains on single-channel audio
+    if audio.ndim > 1:
+        audio = audio.mean(axis=1)
+
+    target_sr = params["target_sample_rate"]
+    if sr != target_sr:
+        import librosa
+        audio = librosa.resample(audio, orig_sr=sr, target_sr=target_sr)
+
+    buffer = io.BytesIO()
+    sf.write(buffer, np.ascontiguousarray(audio), target_sr, subtype=params["subtype"], format="WAV")
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    write_atomic(output_path, buffer.getvalue())
+    return duration
+
+
+def build_dataset(source_dir, output_dir, force=False, params=PROCESSING_PARAMS):
+    """Run the incremental build. Returns a stats dict."""
+    manifest_path = output_dir / MANIFEST_NAME
+    metadata_path = output_dir / METADATA_NAME
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    manifest = load_manifest(manifest_path)
+    params_sha = params_fingerprint(params)
+    if manifest.get("params_sha256") != params_sha and manifest["clips"]:
+        print("⚠️  Processing parameters changed - every clip will be rebuilt")
+
+    old_clips = manifest["clips"]
+    old_rows = load_metadata_rows(metadata_path)
+    new_clips = {}
+    stats = {"processed": 0, "reused": 0, "skipped": 0, "failed": 0, "removed": 0, "clips": 0,
+             "total_duration": 0.0}
+
+    # Stream: one clip at a time, metadata rows are collected as we go
+    metadata_buffer = io.StringIO()
+    writer = csv.writer(metadata_buffer, delimiter='|', lineterminator='\n')
+    writer.writerow(["audio_file", "text"])
+
+    for category, source_path in discover_clips(source_dir):
+        rel_path = f"{category}/{source_path.name}"
+        output_path = output_dir / category / source_path.name
+        txt_path = source_path.with_name(source_path.name + ".txt")
+
+        if not txt_path.exists():
+            print(f"⚠️  No transcription, skipping: {source_path.name}")
+            stats["skipped"] += 1
+            continue
+
+        text = extract_text_from_transcript(txt_path.read_text(encoding='utf-8'))
+        if not text:
+            print(f"⚠️  Empty transcription, skipping: {source_path.name}")
+            stats["skipped"] += 1
+            continue
+
+        try:
+            source_bytes = source_path.read_bytes()
+            source_sha = hash_bytes(source_bytes)
+            entry = old_clips.get(rel_path)
+
+            if not force and output_is_current(entry, output_path, source_sha, params_sha):
+                duration = entry["duration"]
+                stats["reused"] += 1
+                status = "=="
+            else:
+                duration = process_clip(source_bytes, output_path, params)
+                stats["processed"] += 1
+                status = "✅"
+        except Exception as e:
+            print(f"❌ ERROR processing {rel_path}: {e}")
+            stats["failed"] += 1
+            # Keep the last good output (write_atomic never leaves it half-written) until a rebuild succeeds
+            entry = old_clips.get(rel_path)
+            if entry and output_path.exists() and rel_path in old_rows:
+                new_clips[rel_path] = entry
+                writer.writerow([rel_path, old_rows[rel_path]])
+                stats["clips"] += 1
+                stats["total_duration"] += entry["duration"]
+                print(f"   ↩️  Keeping the previous output of {rel_path}")
+            continue
+
+        out_stat = output_path.stat()
+        new_clips[rel_path] = {
+            "source": source_path.name,
+            "source_sha256": source_sha,
+            "transcript_sha256": hash_bytes(text.encode("utf-8")),
+            "params_sha256": params_sha,
+            "duration": duration,
+            "output_size": out_stat.st_size,
+            "output_mtime_ns": out_stat.st_mtime_ns,
+        }
+        writer.writerow([rel_path, text])
+        stats["clips"] += 1
+        stats["total_duration"] += duration
+        print(f"{status} {rel_path:<40} ({duration:.2f}s)")
+
+    # Drop outputs whose source clip disappeared; clips skipped this run keep their output and entry
+    for rel_path in sorted(set(old_clips) - set(new_clips)):
+        if (source_dir / old_clips[rel_path]["source"]).exists():
+            new_clips[rel_path] = old_clips[rel_path]
+            continue
+        stale = output_dir / rel_path
+        if stale.exists():
+            stale.unlink()
+        stats["removed"] += 1
+        print(f"🗑️  Removed stale clip: {rel_path}")
+
+    # Only rewrite metadata.csv if its content actually changed
+    metadata_bytes = metadata_buffer.getvalue().encode("utf-8")
+    if not metadata_path.exists() or metadata_path.read_bytes() != metadata_bytes:
+        write_atomic(metadata_path, metadata_bytes)
+        stats["metadata_updated"] = True
+    else:
+        stats["metadata_updated"] = False
+
+    manifest = {
+        "version": 1,
+        "params": params,
+        "params_sha256": params_sha,
+        "source_dir": os.path.relpath(source_dir, output_dir),
+        "clips": new_clips,
+    }
+    write_atomic(manifest_path, json.dumps(manifest, indent=2, ensure_ascii=False).encode("utf-8"))
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental Phase 4 dataset build")
+    parser.add_argument("--source", type=Path, default=SOURCE_DIR, help="Directory with <clip>.wav + <clip>.wav.txt")
+    parser.add_argument("--output", type=Path, default=OUTPUT_DIR, help="Dataset output directory")
+    parser.add_argument("--force", action="store_true", help="Ignore the manifest and reprocess every clip")
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("🎯 PHASE 4 DATASET BUILD (incremental)")
+    print("=" * 80)
+    print()
+    print(f"📂 Source: {args.source}")
+    print(f"📂 Output: {args.output}")
+    print(f"🎵 Target sample rate: {PROCESSING_PARAMS['target_sample_rate']} Hz")
+    print()
+
+    if not args.source.exists():
+        print(f"❌ ERROR: Source directory not found: {args.source}")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    stats = build_dataset(args.source, args.output, force=args.force)
+    elapsed = time.perf_counter() - start
+
+    print()
+    print("=" * 80)
+    print("✅ PHASE 4 DATASET BUILD COMPLETE")
+    print("=" * 80)
+    print()
+    print("📊 Summary:")
+    print(f"   • Clips in dataset: {stats['clips']}")
+    print(f"   • Processed: {stats['processed']}  Reused: {stats['reused']}")
+    print(f"   • Skipped: {stats['skipped']}  Failed: {stats['failed']}  Removed: {stats['removed']}")
+    print(f"   • Total duration: {stats['total_duration']:.1f}s ({stats['total_duration']/60:.1f} min)")
+    print(f"   • metadata.csv: {'updated' if stats['metadata_updated'] else 'unchanged'}")
+    print(f"   • Build time: {elapsed:.2f}s")
+    print()
+
+    if stats["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""
+Training Index - Upfront Length and Token Filtering
+===================================================
+Fast pre-pass over a Coqui-format metadata.csv before training starts.
+
+GPTTrainer's loader silently drops samples whose audio is longer than
+max_wav_length, whose tokenized text is longer than max_text_length or
+whose audio is shorter than 0.5s. Phase 4 had to disable evaluation because
+of it. This pass applies the same rules up front:
+- transcripts are tokenized with the XTTS vocab.json tokenizer
+- durations come from the WAV headers only (no audio decoding)
+
+Outputs (next to metadata.csv):
+- training_index.json   valid / too_long / too_short / rejected samples
+- metadata_train.csv    valid training samples only
+- metadata_eval.csv     valid eval samples only (never empty)
+
+Usage:
+  python scripts/build_training_index.py dataset_phase4 path/to/vocab.json
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import soundfile as sf
+
+TRAIN_FILE_NAME = "metadata_train.csv"
+EVAL_FILE_NAME = "metadata_eval.csv"
+INDEX_FILE_NAME = "training_index.json"
+
+# Same limits XTTSDataset enforces while loading
+MIN_WAV_SECONDS = 0.5
+UNK_TOKEN_ID = 1
+STOP_TOKEN_ID = 0
+
+
+def read_metadata(metadata_path):
+    """Read rows of a Coqui-format metadata.csv (audio_file|text[|speaker_name])"""
+    with open(metadata_path, 'r', encoding='utf-8') as f:
+        return list(csv.DictReader(f, delimiter='|'))
+
+
+def load_tokenizer(vocab_file):
+    from TTS.tts.layers.xtts.tokenizer import VoiceBpeTokenizer
+    return VoiceBpeTokenizer(vocab_file=str(vocab_file))
+
+
+def classify_sample(row, dataset_dir, tokenizer, language, sample_rate, max_wav_length, max_text_length):
+    """Return an index entry for one metadata row"""
+    audio_file = row["audio_file"]
+    text = (row.get("text") or "").strip()
+    entry = {"audio_file": audio_file, "text": text}
+
+    audio_path = dataset_dir / audio_file
+    if not audio_path.exists():
+        entry["status"] = "rejected"
+        entry["reason"] = "missing_audio"
+        return entry
+    if not text:
+        entry["status"] = "rejected"
+        entry["reason"] = "empty_text"
+        return entry
+
+    # Header-only read: frames and sample rate, no decoding
+    info = sf.info(str(audio_path))
+    wav_length = int(info.frames * sample_rate / info.samplerate)
+    entry["duration"] = round(info.frames / info.samplerate, 3)
+    entry["wav_length"] = wav_length
+
+    tokens = tokenizer.encode(text, language)
+    entry["text_tokens"] = len(tokens)
+
+    if UNK_TOKEN_ID in tokens or STOP_TOKEN_ID in tokens:
+        entry["status"] = "rejected"
+        entry["reason"] = "unknown_token"
+    elif wav_length > max_wav_length:
+        entry["status"] = "too_long"
+        entry["reason"] = "audio"
+    elif len(tokens) > max_text_length:
+        entry["status"] = "too_long"
+        entry["reason"] = "text"
+    elif wav_length < MIN_WAV_SECONDS * sample_rate:
+        entry["status"] = "too_short"
+        entry["reason"] = "audio"
+    else:
+        entry["status"] = "valid"
+    return entry
+
+
+def split_train_eval(valid, eval_split_size):
+    """
+    Deterministic, category-stratified split (category = first path component).
+    Always returns at least one eval and one training sample.
+    """
+    if len(valid) < 2:
+        raise ValueError(f"Need at least 2 valid samples for a train/eval split, got {len(valid)}")
+
+    by_category = defaultdict(list)
+    for entry in valid:
+        by_category[entry["audio_file"].split("/")[0]].append(entry)
+
+    n_eval = min(len(valid) - 1, max(1, round(len(valid) * eval_split_size)))
+    eval_entries = []
+    # Round-robin over categories, taking every k-th sample of each, so eval covers all prosody types
+    queues = {cat: sorted(entries, key=lambda e: e["audio_file"])[::-1] for cat, entries in sorted(by_category.items())}
+    while len(eval_entries) < n_eval:
+        for cat in list(queues):
+            if queues[cat] and len(eval_entries) < n_eval:
+                eval_entries.append(queues[cat].pop())
+    eval_files = {e["audio_file"] for e in eval_entries}
+    train_entries = [e for e in valid if e["audio_file"] not in eval_files]
+    return train_entries, eval_entries
+
+
+def write_metadata(path, entries):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter='|', lineterminator='\n')
+    writer.writerow(["audio_file", "text"])
+    for entry in entries:
+        writer.writerow([entry["audio_file"], entry["text"]])
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(buffer.getvalue(), encoding='utf-8')
+    os.replace(tmp_path, path)
+
+
+def build_training_index(
+    dataset_dir,
+    vocab_file,
+    max_wav_length,
+    max_text_length,
+    eval_split_size=0.15,
+    language="hu",
+    sample_rate=22050,
+    metadata_file="metadata.csv",
+    tokenizer=None,
+):
+    """
+    Classify every sample and write the index + train/eval metadata files.
+    Returns the index dict (see training_index.json).
+    """
+    dataset_dir = Path(dataset_dir)
+    start = time.perf_counter()
+    tokenizer = tokenizer or load_tokenizer(vocab_file)
+
+    entries = [
+        classify_sample(row, dataset_dir, tokenizer, language, sample_rate, max_wav_length, max_text_length)
+        for row in read_metadata(dataset_dir / metadata_file)
+    ]
+    groups = defaultdict(list)
+    for entry in entries:
+        groups[entry["status"]].append(entry)
+
+    train_entries, eval_entries = split_train_eval(groups["valid"], eval_split_size)
+    write_metadata(dataset_dir / TRAIN_FILE_NAME, train_entries)
+    write_metadata(dataset_dir / EVAL_FILE_NAME, eval_entries)
+
+    index = {
+        "limits": {
+            "max_wav_length": max_wav_length,
+            "max_text_length": max_text_length,
+            "min_wav_seconds": MIN_WAV_SECONDS,
+            "sample_rate": sample_rate,
+        },
+        "counts": {status: len(items) for status, items in groups.items()},
+        "train": [e["audio_file"] for e in train_entries],
+        "eval": [e["audio_file"] for e in eval_entries],
+        "valid": groups["valid"],
+        "too_long": groups["too_long"],
+        "too_short": groups["too_short"],
+        "rejected": groups["rejected"],
+        "elapsed_seconds": round(time.perf_counter() - start, 3),
+    }
+    with open(dataset_dir / INDEX_FILE_NAME, 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=2, ensure_ascii=False)
+    return index
+
+
+def print_index_summary(index):
+    counts = index["counts"]
+    print(f"   ✅ Valid: {counts.get('valid', 0)} "
+          f"(train {len(index['train'])}, eval {len(index['eval'])})")
+    for status in ("too_long", "too_short", "rejected"):
+        for entry in index[status]:
+            print(f"   ⚠️  {status} ({entry['reason']}): {entry['audio_file']}")
+    print(f"   ⏱️  Index built in {index['elapsed_seconds']:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the pre-training length/token index")
+    parser.add_argument("dataset_dir", type=Path)
+    parser.add_argument("vocab_file", type=Path)
+    parser.add_argument("--max-wav-length", type=int, default=530000)
+    parser.add_argument("--max-text-length", type=int, default=400)
+    parser.add_argument("--eval-split-size", type=float, default=0.15)
+    parser.add_argument("--language", default="hu")
+    args = parser.parse_args()
+
+    print("📇 Building training index...")
+    try:
+        index = build_training_index(
+            args.dataset_dir,
+            args.vocab_file,
+            args.max_wav_length,
+            args.max_text_length,
+            eval_split_size=args.eval_split_size,
+            language=args.language,
+        )
+    except ValueError as e:
+        print(f"❌ ERROR: {e}")
+        sys.exit(1)
+    print_index_summary(index)
+
+
+if __name__ == "__main__":
+    main()
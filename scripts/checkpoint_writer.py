@@ -0,0 +1,260 @@
+"""
+Async Checkpoint Writer
+=======================
+Moves checkpoint serialization off the training loop.
+
+The training loop only pays for a snapshot (tensors copied to CPU memory);
+torch.save runs in a background thread that writes to <name>.tmp and renames
+atomically, so a crash never leaves a truncated checkpoint behind.
+Old files are pruned by a declarative retention policy instead of globbing
+the run directory after every save:
+- keep the last N checkpoint_*.pth
+- keep the best K best_model_*.pth ranked by Mel CE
+
+Only files written by this writer are ever deleted.
+
+With delta_base set, every file is a delta checkpoint (see delta_checkpoint.py):
+only the trainable GPT weights + optimizer state are snapshotted and written.
+
+Usage (after the Trainer is created):
+  writer = install_async_checkpointing(trainer, RetentionPolicy(keep_last=3, keep_best=2))
+  trainer.fit()
+  writer.close()   # waits for pending writes and prints the blocked-time report
+"""
+
+import atexit
+import datetime
+import os
+import queue
+import shutil
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+import torch
+
+from delta_checkpoint import DeltaCheckpointer
+
+BEST_MODEL_SHORTCUT = "best_model.pth"
+_STOP = object()
+
+
+@dataclass
+class RetentionPolicy:
+    """Which checkpoint files survive a save"""
+    keep_last: int = 3  # newest checkpoint_*.pth files
+    keep_best: int = 1  # best_model_*.pth files, lowest metric first
+    metric: str = "avg_loss_mel_ce"  # KeepAverage key used for ranking
+
+
+def snapshot_state(obj):
+    """Copy every tensor in a (nested) state dict to CPU so training can keep mutating the originals"""
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, dict):
+        return {k: snapshot_state(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(snapshot_state(v) for v in obj)
+    return obj
+
+
+def _replace_link(target, link_path):
+    """Point link_path at target: hard link if possible, copy otherwise"""
+    tmp_path = link_path.with_name(link_path.name + ".tmp")
+    if tmp_path.exists():
+        tmp_path.unlink()
+    try:
+        os.link(target, tmp_path)
+    except OSError:
+        shutil.copyfile(target, tmp_path)
+    os.replace(tmp_path, link_path)
+
+
+class AsyncCheckpointWriter:
+    """Single background thread that serializes snapshots and applies the retention policy"""
+
+    def __init__(self, output_folder, policy=None, max_pending=1):
+        self.output_folder = Path(output_folder)
+        self.policy = policy or RetentionPolicy()
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._checkpoints = []  # (step, path) written as checkpoint_*.pth
+        self._best = []  # (metric, step, path) written as best_model_*.pth
+        self.stats = {"saves": 0, "errors": 0, "blocked_seconds": 0.0, "write_seconds": 0.0, "bytes_written": 0}
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, state, file_name, kind="checkpoint", step=0, metric=None):
+        """Snapshot `state` on the calling thread and queue it for writing. Returns blocked seconds."""
+        start = time.perf_counter()
+        snapshot = snapshot_state(state)
+        # Blocks only if the previous snapshot is still waiting (bounded memory)
+        self._queue.put((snapshot, self.output_folder / file_name, kind, step, metric))
+        blocked = time.perf_counter() - start
+        self.stats["blocked_seconds"] += blocked
+        return blocked
+
+    def flush(self):
+        """Wait until every queued snapshot is on disk"""
+        self._queue.join()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+        self.print_report()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                self._write(*item)
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"  ⚠️  Checkpoint write failed: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _write(self, snapshot, path, kind, step, metric):
+        start = time.perf_counter()
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            torch.save(snapshot, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        del snapshot
+
+        elapsed = time.perf_counter() - start
+        size = path.stat().st_size
+        self.stats["saves"] += 1
+        self.stats["write_seconds"] += elapsed
+        self.stats["bytes_written"] += size
+        print(f"  💾 Saved {path.name} ({size / 1024**2:.0f} MB in {elapsed:.1f}s, background)")
+
+        if kind == "best":
+            self._best.append((metric, step, path))
+            _replace_link(path, self.output_folder / BEST_MODEL_SHORTCUT)
+        else:
+            self._checkpoints.append((step, path))
+        self._apply_retention()
+
+    def _apply_retention(self):
+        self._checkpoints.sort()
+        while len(self._checkpoints) > self.policy.keep_last:
+            _, old = self._checkpoints.pop(0)
+            self._delete(old)
+
+        self._best.sort(key=lambda item: (item[0], -item[1]))
+        while len(self._best) > self.policy.keep_best:
+            _, _, old = self._best.pop()
+            self._delete(old)
+
+    @staticmethod
+    def _delete(path):
+        try:
+            size_mb = path.stat().st_size / (1024**2)
+            path.unlink()
+            print(f"  🗑️  Deleted: {path.name} ({size_mb:.0f} MB freed)")
+        except OSError as e:
+            print(f"  ⚠️  Could not delete {path.name}: {e}")
+
+    def report(self):
+        return dict(self.stats, pending=self._queue.qsize())
+
+    def print_report(self):
+        stats = self.report()
+        print()
+        print("💾 Checkpoint writer report:")
+        print(f"   • Saves: {stats['saves']} ({stats['errors']} failed)")
+        print(f"   • Training loop blocked on saves: {stats['blocked_seconds']:.1f}s")
+        print(f"   • Background write time: {stats['write_seconds']:.1f}s")
+        print(f"   • Written: {stats['bytes_written'] / 1024**3:.2f} GB")
+
+
+def current_metric(trainer, name):
+    """Eval value of a KeepAverage key if eval ran, else the running training value"""
+    for keep_avg in (trainer.keep_avg_eval, trainer.keep_avg_train):
+        if keep_avg is not None and name in keep_avg.avg_values:
+            return keep_avg[name]
+    return None
+
+
+def build_trainer_state(trainer, **extra):
+    """Same layout as trainer.io.save_model, so restore_path and Xtts.load_checkpoint keep working"""
+    model = trainer.model.module if hasattr(trainer.model, "module") else trainer.model
+    optimizer = trainer.optimizer
+    if isinstance(optimizer, list):
+        optimizer_state = [optim.state_dict() for optim in optimizer]
+    elif isinstance(optimizer, dict):
+        optimizer_state = {k: v.state_dict() for k, v in optimizer.items()}
+    else:
+        optimizer_state = optimizer.state_dict() if optimizer is not None else None
+    scaler = trainer.scaler if trainer.use_amp_scaler else None
+
+    state = {
+        "config": trainer.config.to_dict(),
+        "model": model.state_dict(),
+        "optimizer": optimizer_state,
+        "scaler": scaler.state_dict() if scaler is not None else None,
+        "step": trainer.total_steps_done,
+        "epoch": trainer.epochs_done,
+        "date": datetime.date.today().strftime("%B %d, %Y"),
+    }
+    state.update(extra)
+    return state
+
+
+def install_async_checkpointing(trainer, policy=None, save_best_after=0, delta_base=None):
+    """
+    Replace trainer.save_checkpoint / trainer.save_best_model with async versions.
+    Best models are ranked by policy.metric (Mel CE by default) instead of total loss.
+    With delta_base (a full checkpoint path), saves are deltas against that checkpoint.
+    """
+    policy = policy or RetentionPolicy()
+    writer = AsyncCheckpointWriter(trainer.output_path, policy)
+    best = {"metric": float("inf")}
+    delta = None
+    if delta_base is not None:
+        model = trainer.model.module if hasattr(trainer.model, "module") else trainer.model
+        delta = DeltaCheckpointer(delta_base, model, trainer.optimizer)
+
+    def build_state(**extra):
+        state = build_trainer_state(trainer, **extra)
+        # Filtering before the snapshot means frozen weights are never even copied
+        return delta.make_delta(state) if delta is not None else state
+
+    def model_loss():
+        return {
+            "train_loss": trainer._pick_target_avg_loss(trainer.keep_avg_train),
+            "eval_loss": trainer._pick_target_avg_loss(trainer.keep_avg_eval),
+        }
+
+    def save_checkpoint():
+        step = trainer.total_steps_done
+        state = build_state(model_loss=model_loss())
+        writer.submit(state, f"checkpoint_{step}.pth", step=step, metric=current_metric(trainer, policy.metric))
+
+    def save_best_model():
+        metric = current_metric(trainer, policy.metric)
+        step = trainer.total_steps_done
+        if metric is None or step < save_best_after or metric >= best["metric"]:
+            return
+        best["metric"] = metric
+        loss = model_loss()
+        trainer.best_loss = loss
+        state = build_state(model_loss=loss)
+        print(f"  🏆 New best {policy.metric}: {metric:.4f} (step {step})")
+        writer.submit(state, f"best_model_{step}.pth", kind="best", step=step, metric=metric)
+
+    trainer.save_checkpoint = save_checkpoint
+    trainer.save_best_model = save_best_model
+    # fit() hard-exits on Ctrl+C - make sure queued saves hit the disk first
+    trainer.callbacks.callbacks_on_keyboard_interrupt.append(lambda _: writer.flush())
+    return writer
@@ -0,0 +1,181 @@
+"""
+Chunked Decoder - Overlap-Add HiFi-GAN Decoding with Bounded Memory
+===================================================================
+The HiFi-GAN decoder holds activations for the whole utterance at once, so
+peak memory grows with text length (long "film" templates, multi-sentence
+answers). Decoding in fixed windows keeps it constant:
+- the GPT latents are upsampled to decoder rate once (cheap, same as one-shot);
+  at that rate one step is exactly 256 output samples, so windows line up
+  sample-accurately
+- each window is decoded with extra context steps on both sides (discarded),
+  covering the generator's receptive field - chunk edges see the same input
+  as one-shot decoding
+- neighbouring windows overlap and are crossfaded (raised cosine, weights sum
+  to 1), which hides any residual difference at the seams
+- inputs up to one window are decoded in one shot, exactly as before
+
+Usage:
+  use_chunked_decoder(model)                        # model.inference now decodes in windows
+  use_chunked_decoder(model, window=256, overlap=16, context=32)
+  wav = decode_chunked(model.hifigan_decoder, gpt_latents, speaker_embedding)
+
+Benchmark (parity and peak memory vs one-shot at growing lengths):
+  python scripts/chunked_decoder.py benchmark --model-dir <run> --checkpoint <pth> --reference <wav>
+"""
+
+import argparse
+import math
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from batch_size_finder import measure_peak_memory, reset_peak_memory
+
+HOP_LENGTH = 256  # output samples per decoder-rate step (HiFi-GAN upsampling 8 * 8 * 2 * 2)
+WINDOW = 256  # decoder-rate steps per window (~2.7 s of audio)
+OVERLAP = 16  # steps crossfaded between neighbouring windows (~170 ms)
+CONTEXT = 32  # steps of extra input on each side, decoded and dropped (> receptive field)
+PARITY_TOLERANCE = 1e-3  # max abs sample error vs one-shot
+BENCHMARK_FRAMES = (150, 300, 600, 1200)  # GPT latent frames (~7 s to ~56 s of audio)
+
+
+def decoder_input(decoder, latents):
+    """GPT latents [B, T, C] -> HiFi-GAN generator input [B, C, T * 4 * 24000/22050]"""
+    z = F.interpolate(latents.transpose(1, 2),
+                      scale_factor=decoder.ar_mel_length_compression / decoder.output_hop_length, mode="linear")
+    if decoder.output_sample_rate != decoder.input_sample_rate:
+        z = F.interpolate(z, scale_factor=decoder.output_sample_rate / decoder.input_sample_rate, mode="linear")
+    return z
+
+
+def decode_chunked(decoder, latents, g=None, window=WINDOW, overlap=OVERLAP, context=CONTEXT):
+    """HifiDecoder.forward in overlapping windows -> wav [B, 1, samples]"""
+    if overlap >= window:
+        raise ValueError(f"overlap ({overlap}) must be smaller than window ({window})")
+    z = decoder_input(decoder, latents)
+    total = z.shape[-1]
+    if total <= window:
+        return decoder.waveform_decoder(z, g=g)
+
+    fade = overlap * HOP_LENGTH
+    fade_in = 0.5 - 0.5 * torch.cos(math.pi * (torch.arange(fade, device=z.device) + 0.5) / fade)
+    out = z.new_zeros(z.shape[0], 1, total * HOP_LENGTH)
+    start = 0
+    while True:
+        end = min(start + window, total)
+        lo, hi = max(0, start - context), min(total, end + context)
+        wav = decoder.waveform_decoder(z[..., lo:hi], g=g)[..., (start - lo) * HOP_LENGTH:(end - lo) * HOP_LENGTH]
+        if start > 0:
+            wav[..., :fade] *= fade_in
+        if end < total:
+            wav[..., -fade:] *= 1 - fade_in
+        out[..., start * HOP_LENGTH:end * HOP_LENGTH] += wav
+        if end == total:
+            return out
+        start = end - overlap  # the last window is always longer than the overlap
+
+
+def use_chunked_decoder(model, window=WINDOW, overlap=OVERLAP, context=CONTEXT):
+    """Route model.hifigan_decoder through decode_chunked (PyTorch decoder only)"""
+    decoder = model.hifigan_decoder
+
+    def chunked_forward(latents, g=None):
+        return decode_chunked(decoder, latents, g, window=window, overlap=overlap, context=context)
+
+    decoder.forward = chunked_forward
+    return model
+
+
+def use_one_shot_decoder(model):
+    model.hifigan_decoder.__dict__.pop("forward", None)
+    return model
+
+
+# ----------------------------------------
+# Benchmark
+# ----------------------------------------
+
+def _peak(fn, device):
+    """(result, peak memory above the starting point in MB)"""
+    reset_peak_memory(device)  # peak := current usage
+    base = measure_peak_memory(device)
+    result = fn()
+    return result, measure_peak_memory(device) - base
+
+
+def compare(model, speaker_embedding, frames=BENCHMARK_FRAMES, window=WINDOW, overlap=OVERLAP, context=CONTEXT,
+            seed=0):
+    """Per length: max abs error / SNR of chunked vs one-shot, decode seconds and peak memory for both"""
+    generator = torch.Generator().manual_seed(seed)
+    device = next(model.parameters()).device
+    decoder = model.hifigan_decoder
+    rows = []
+    for n in frames:
+        latents = torch.randn(1, n, model.args.decoder_input_dim, generator=generator).to(device)
+        with torch.inference_mode():
+            # Chunked first - the one-shot pass at this length leaves the larger allocations behind
+            start = time.perf_counter()
+            chunked, chunked_mb = _peak(lambda: decode_chunked(decoder, latents, speaker_embedding, window,
+                                                               overlap, context), device)
+            chunked_s = time.perf_counter() - start
+            start = time.perf_counter()
+            reference, one_shot_mb = _peak(lambda: decoder.waveform_decoder(decoder_input(decoder, latents),
+                                                                            g=speaker_embedding), device)
+            one_shot_s = time.perf_counter() - start
+        reference, chunked = reference.cpu().numpy(), chunked.cpu().numpy()
+        error = chunked - reference
+        snr = 10 * np.log10(np.sum(reference ** 2) / max(np.sum(error ** 2), 1e-20))
+        rows.append({"frames": n, "audio_seconds": round(reference.shape[-1] / 24000, 1),
+                     "max_abs_error": float(np.abs(error).max()), "snr_db": round(float(snr), 1),
+                     "one_shot_s": round(one_shot_s, 2), "chunked_s": round(chunked_s, 2),
+                     "one_shot_mb": round(one_shot_mb, 1), "chunked_mb": round(chunked_mb, 1)})
+    return rows
+
+
+def print_comparison(rows):
+    print(f"{'frames':>7}{'audio s':>9}{'max err':>11}{'SNR dB':>8}{'1-shot s':>10}{'chunk s':>9}"
+          f"{'1-shot MB':>11}{'chunk MB':>10}")
+    for r in rows:
+        print(f"{r['frames']:>7}{r['audio_seconds']:>9.1f}{r['max_abs_error']:>11.2e}{r['snr_db']:>8.1f}"
+              f"{r['one_shot_s']:>10.2f}{r['chunked_s']:>9.2f}{r['one_shot_mb']:>11.1f}{r['chunked_mb']:>10.1f}")
+    worst = max(r["max_abs_error"] for r in rows)
+    status = "✅ parity OK" if worst <= PARITY_TOLERANCE else "❌ parity FAILED"
+    print(f"\n{status} (worst max abs error {worst:.2e}, tolerance {PARITY_TOLERANCE:.0e})")
+    return worst <= PARITY_TOLERANCE
+
+
+def main():
+    from sentence_synthesis import load_xtts
+
+    parser = argparse.ArgumentParser(description="Chunked overlap-add HiFi-GAN decoding")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench = sub.add_parser("benchmark", help="Parity and peak memory of chunked vs one-shot decoding")
+    bench.add_argument("--model-dir", required=True)
+    bench.add_argument("--checkpoint", required=True)
+    bench.add_argument("--reference", required=True, nargs="+", help="Speaker reference WAV(s) for the embedding")
+    bench.add_argument("--window", type=int, default=WINDOW)
+    bench.add_argument("--overlap", type=int, default=OVERLAP)
+    bench.add_argument("--context", type=int, default=CONTEXT)
+    args = parser.parse_args()
+
+    import audio_io
+    audio_io.install()
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    model = load_xtts(Path(args.model_dir), Path(args.checkpoint), device=device)
+    _, speaker_embedding = model.get_conditioning_latents(audio_path=args.reference, gpt_cond_len=30,
+                                                          gpt_cond_chunk_len=4, max_ref_length=60)
+
+    print("=" * 80)
+    print(f"🪟 CHUNKED DECODER BENCHMARK (window {args.window}, overlap {args.overlap}, "
+          f"context {args.context}, {device.upper()})")
+    print("=" * 80)
+    ok = print_comparison(compare(model, speaker_embedding, window=args.window, overlap=args.overlap,
+                                  context=args.context))
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
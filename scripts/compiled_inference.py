@@ -0,0 +1,211 @@
+"""
+Compiled Inference - torch.compile for the XTTS GPT Step and HiFi-GAN Decoder
+=============================================================================
+Opt-in compiled mode for Xtts.inference (eager stays the default):
+- GPT transformer: compiled with dynamic shapes, so the prefill and the
+  one-token decode step (KV cache growing every step) are one graph each
+  instead of a recompile per length
+- HiFi-GAN decoder: GPT latents are padded (last frame repeated) up to a
+  fixed length bucket and the waveform is trimmed back - every call hits one
+  of a few static graphs, which inductor optimizes best on CPU
+- warmup at startup compiles every decoder bucket and the GPT graphs once
+- compilation artifacts persist in run/compile_cache (inductor cache plus
+  torch.compiler cache artifacts), so later startups mostly load instead of
+  compiling
+
+Model weights are not baked into the graphs - the cache is keyed by torch
+version, device and buckets, and is reused across checkpoints.
+
+Usage:
+  compile_inference(model)
+  warmup(model, gpt_cond_latent, speaker_embedding)     # -> {"compile_seconds", "warmup_seconds", ...}
+  out = model.inference(text, "hu", gpt_cond_latent, speaker_embedding, **PARAMS)
+  uncompile(model)                                      # back to eager
+
+Benchmark (eager vs compiled, including compile/warmup cost):
+  python scripts/compiled_inference.py benchmark --model-dir <run> --checkpoint <pth> --reference <wav>
+"""
+
+import argparse
+import hashlib
+import os
+import sys
+import time
+from pathlib import Path
+
+import torch
+import torch.nn.functional as F
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+COMPILE_CACHE_DIR = PROJECT_ROOT / "run" / "compile_cache"
+# GPT latent frames per decoder graph (~46 ms of audio each); longer inputs round up to a multiple of the last
+DECODER_BUCKETS = (32, 64, 96, 128, 192, 256, 384, 512, 640)
+WARMUP_TEXTS = ["Melyik ország fővárosa Budapest?",
+                "A Duna Európa második leghosszabb folyója, tíz országon halad keresztül."]
+
+# Inductor reads this when it first needs a cache directory - set before anything compiles
+os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", str(COMPILE_CACHE_DIR / "inductor"))
+
+
+def bucket_length(frames, buckets=DECODER_BUCKETS):
+    for bucket in buckets:
+        if frames <= bucket:
+            return bucket
+    return -(-frames // buckets[-1]) * buckets[-1]
+
+
+def _artifact_path(device, buckets):
+    """Cache artifacts depend on torch, python, device and graph shapes - not on the weights"""
+    key = f"{torch.__version__}|{sys.version_info[:2]}|{device.type}|{buckets}"
+    return COMPILE_CACHE_DIR / f"xtts-{hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]}.bin"
+
+
+def _raise_recompile_limit(graphs):
+    config = torch._dynamo.config
+    name = "recompile_limit" if hasattr(config, "recompile_limit") else "cache_size_limit"
+    setattr(config, name, max(getattr(config, name), graphs))
+
+
+def compile_inference(model, buckets=DECODER_BUCKETS, mode=None):
+    """Swap compiled forwards into the GPT transformer and HiFi-GAN decoder (in place)"""
+    if getattr(model, "_compiled_inference", None) is not None:
+        return model
+    device = next(model.parameters()).device
+    buckets = tuple(buckets)
+    _raise_recompile_limit(len(buckets) + 8)
+
+    loaded = False
+    path = _artifact_path(device, buckets)
+    if path.exists() and hasattr(torch.compiler, "load_cache_artifacts"):
+        try:
+            torch.compiler.load_cache_artifacts(path.read_bytes())
+            loaded = True
+        except Exception as e:  # stale or foreign artifacts - compile from scratch
+            print(f"   ⚠️  Ignoring {path.name}: {e}")
+
+    # gpt_inference.transformer is the same GPT2Model the latent pass uses - both get the compiled forward
+    transformer = model.gpt.gpt_inference.transformer
+    transformer.forward = torch.compile(transformer.forward, dynamic=True, mode=mode)
+
+    decoder = model.hifigan_decoder
+    compiled_decoder = torch.compile(decoder.forward, dynamic=False, mode=mode)
+
+    def bucketed_forward(latents, g=None):
+        frames = latents.shape[1]
+        padded = bucket_length(frames, buckets)
+        if padded != frames:  # [B, T, C] - repeat the last frame so the trimmed tail has no edge effects
+            latents = F.pad(latents.transpose(1, 2), (0, padded - frames), mode="replicate").transpose(1, 2)
+        wav = compiled_decoder(latents, g=g)
+        return wav[..., :wav.shape[-1] * frames // padded]
+
+    decoder.forward = bucketed_forward
+    model._compiled_inference = {"buckets": buckets, "mode": mode, "device": device,
+                                 "artifact_path": path, "artifacts_loaded": loaded}
+    return model
+
+
+def uncompile(model):
+    """Back to eager forwards"""
+    for module in (model.gpt.gpt_inference.transformer, model.hifigan_decoder):
+        module.__dict__.pop("forward", None)
+    model._compiled_inference = None
+    return model
+
+
+def warmup(model, gpt_cond_latent, speaker_embedding, language="hu", texts=WARMUP_TEXTS):
+    """Compile (or load) every graph before the first real request; saves the cache artifacts"""
+    info = model._compiled_inference
+    if info is None:
+        raise RuntimeError("compile_inference(model) first")
+    dim = model.args.decoder_input_dim
+    report = {"artifacts_loaded": info["artifacts_loaded"]}
+
+    start = time.perf_counter()
+    with torch.inference_mode():
+        for bucket in info["buckets"]:
+            latents = torch.zeros(1, bucket, dim, device=info["device"])
+            model.hifigan_decoder(latents, g=speaker_embedding)
+    report["decoder_seconds"] = round(time.perf_counter() - start, 2)
+
+    start = time.perf_counter()
+    for text in texts:  # short and long prefill, decode step, latent pass
+        model.inference(text, language, gpt_cond_latent, speaker_embedding, temperature=0.35)
+    report["gpt_seconds"] = round(time.perf_counter() - start, 2)
+    report["warmup_seconds"] = round(report["decoder_seconds"] + report["gpt_seconds"], 2)
+
+    if hasattr(torch.compiler, "save_cache_artifacts"):
+        artifacts = torch.compiler.save_cache_artifacts()
+        if artifacts is not None:
+            COMPILE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            tmp = info["artifact_path"].with_suffix(".tmp")
+            tmp.write_bytes(artifacts[0])
+            tmp.replace(info["artifact_path"])
+            report["artifact_mb"] = round(len(artifacts[0]) / 1024**2, 1)
+    return report
+
+
+def print_warmup(report):
+    source = "loaded from cache" if report["artifacts_loaded"] else "compiled"
+    print(f"   ⚡ Compiled inference ready in {report['warmup_seconds']:.1f}s ({source}: "
+          f"decoder buckets {report['decoder_seconds']:.1f}s, GPT {report['gpt_seconds']:.1f}s)")
+
+
+def _timed(model, texts, latents, params):
+    """Seconds of wall time and of audio for one pass over texts (seeded, so both modes see the same sampling)"""
+    wall = audio = 0.0
+    for i, text in enumerate(texts):
+        torch.manual_seed(i)
+        start = time.perf_counter()
+        out = model.inference(text, "hu", *latents, **params)
+        wall += time.perf_counter() - start
+        audio += len(out["wav"]) / 24000
+    return wall, audio
+
+
+def main():
+    from question_bank import load_templates
+    from sentence_synthesis import load_xtts
+
+    parser = argparse.ArgumentParser(description="torch.compile inference for XTTS")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench = sub.add_parser("benchmark", help="Eager vs compiled inference, with compile and warmup cost")
+    bench.add_argument("--model-dir", required=True)
+    bench.add_argument("--checkpoint", required=True)
+    bench.add_argument("--reference", required=True, nargs="+", help="Speaker reference WAV(s)")
+    bench.add_argument("--sentences", type=int, default=8)
+    bench.add_argument("--mode", default=None, help="torch.compile mode, e.g. max-autotune")
+    args = parser.parse_args()
+
+    import audio_io
+    audio_io.install()
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    model = load_xtts(Path(args.model_dir), Path(args.checkpoint), device=device)
+    latents = model.get_conditioning_latents(audio_path=args.reference, gpt_cond_len=30, gpt_cond_chunk_len=4,
+                                             max_ref_length=60)
+    texts = [t.split("?")[0] + "?" for ts in load_templates().values() for t in ts][:args.sentences]
+    params = {"temperature": 0.35, "top_p": 0.90, "top_k": 50, "repetition_penalty": 3.5, "length_penalty": 1.3}
+
+    print("=" * 80)
+    print(f"⚡ COMPILED INFERENCE BENCHMARK ({len(texts)} sentences, {device.upper()})")
+    print("=" * 80)
+    eager_wall, eager_audio = _timed(model, texts, latents, params)
+
+    start = time.perf_counter()
+    compile_inference(model, mode=args.mode)
+    compile_seconds = time.perf_counter() - start
+    report = warmup(model, *latents)
+    print_warmup(report)
+    compiled_wall, compiled_audio = _timed(model, texts, latents, params)
+
+    print(f"{'Mode':<12}{'seconds':>10}{'RTF':>8}")
+    print(f"{'eager':<12}{eager_wall:>10.2f}{eager_wall / eager_audio:>8.3f}")
+    print(f"{'compiled':<12}{compiled_wall:>10.2f}{compiled_wall / compiled_audio:>8.3f}")
+    startup = compile_seconds + report["warmup_seconds"]
+    saved = eager_wall / len(texts) - compiled_wall / len(texts)
+    print(f"\nSpeedup {eager_wall / compiled_wall:.2f}x, startup cost {startup:.1f}s "
+          f"({'cached' if report['artifacts_loaded'] else 'cold'})"
+          + (f", pays off after {startup / saved:.0f} sentences" if saved > 0 else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Conditioning - Batched Speaker Latents from Many Reference WAVs
+===============================================================
+Drop-in for Xtts.get_conditioning_latents with the per-file / per-chunk
+Python loops replaced by batched work:
+- all references are loaded in parallel threads (soundfile releases the GIL),
+  resampled with the cached kernels from audio_io
+- GPT conditioning: the concatenated audio is cut into its 4-second chunks
+  once, every full chunk goes through one mel transform and one
+  conditioning encoder + perceiver pass as a single batch (the short tail
+  chunk, if kept, gets its own pass)
+- speaker embedding: one 16 kHz resample for all references, and one speaker
+  encoder pass per distinct reference length - equal-length references share
+  a batch. Different lengths are not padded together: the encoder's instance
+  norm and attention pooling run over the whole time axis, so padding would
+  change the embedding.
+
+Results match get_conditioning_latents up to float rounding.
+
+Usage:
+  gpt_cond_latent, speaker_embedding = compute_conditioning_latents(model, REFERENCES)
+
+Benchmark (16 references, before vs after, with parity):
+  python scripts/conditioning.py benchmark --model-dir <run> --checkpoint <pth>
+"""
+
+import argparse
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import torch
+
+from audio_io import load_audio, resample
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+GPT_SAMPLE_RATE = 22050
+SPEAKER_SAMPLE_RATE = 16000
+MIN_CHUNK_SECONDS = 0.33  # shorter tail chunks are dropped, as in Xtts.get_gpt_cond_latents
+LOAD_WORKERS = 8
+DEFAULT_REFERENCES = [PROJECT_ROOT / "prepared_sources" / "vago_samples_selected" / f"question{i}.wav"
+                      for i in range(1, 17)]
+
+
+def load_references(paths, sample_rate=GPT_SAMPLE_RATE, max_ref_length=60, workers=LOAD_WORKERS):
+    """(1, samples) float32 tensors, cropped to max_ref_length seconds, in input order"""
+    def load(path):
+        return load_audio(str(path), sample_rate)[:, :sample_rate * max_ref_length]
+
+    with ThreadPoolExecutor(min(workers, len(paths))) as pool:
+        return list(pool.map(load, paths))
+
+
+def split_chunks(audio, sample_rate=GPT_SAMPLE_RATE, chunk_length=4):
+    """(1, samples) -> (full chunks [n, chunk] or None, tail [1, rest] or None) as Xtts chunks it"""
+    chunk = sample_rate * chunk_length
+    n = audio.shape[-1] // chunk
+    full = audio[0, :n * chunk].reshape(n, chunk) if n else None
+    tail = audio[:, n * chunk:]
+    return full, (tail if tail.shape[-1] >= sample_rate * MIN_CHUNK_SECONDS else None)
+
+
+def style_embeddings(model, chunks, sample_rate=GPT_SAMPLE_RATE):
+    """Equal-length audio chunks [n, samples] -> conditioning encoder + perceiver output [n, 1024, 32]"""
+    from TTS.tts.models.xtts import wav_to_mel_cloning
+
+    mel = wav_to_mel_cloning(chunks, mel_norms=model.mel_stats.cpu(), n_fft=2048, hop_length=256, win_length=1024,
+                             power=2, normalized=False, sample_rate=sample_rate, f_min=0, f_max=8000, n_mels=80)
+    return model.gpt.get_style_emb(mel.to(model.device), None)
+
+
+def gpt_cond_latents(model, audios, sample_rate=GPT_SAMPLE_RATE, length=30, chunk_length=4):
+    """Xtts.get_gpt_cond_latents over the concatenated references, all full chunks in one batch"""
+    audio = torch.cat(audios, dim=-1)
+    if not model.args.gpt_use_perceiver_resampler:
+        return model.get_gpt_cond_latents(audio, sample_rate, length=length, chunk_length=chunk_length)
+    if length > 0:
+        audio = audio[:, :sample_rate * length]
+    style_embs = [style_embeddings(model, chunks, sample_rate)
+                  for chunks in split_chunks(audio, sample_rate, chunk_length) if chunks is not None]
+    return torch.cat(style_embs).mean(dim=0, keepdim=True).transpose(1, 2)
+
+
+def speaker_embeddings(model, audios, sample_rate=GPT_SAMPLE_RATE):
+    """Per-reference speaker embeddings [n, 512] in input order; one encoder pass per distinct length"""
+    by_length = defaultdict(list)
+    for i, audio in enumerate(audios):
+        by_length[audio.shape[-1]].append(i)
+    embeddings = [None] * len(audios)
+    for indices in by_length.values():
+        group = torch.cat([audios[i] for i in indices])
+        audio_16k = resample(group, sample_rate, SPEAKER_SAMPLE_RATE).to(model.device)
+        for i, embedding in zip(indices, model.hifigan_decoder.speaker_encoder.forward(audio_16k, l2_norm=True)):
+            embeddings[i] = embedding
+    return torch.stack(embeddings)
+
+
+def speaker_embedding(model, audios, sample_rate=GPT_SAMPLE_RATE):
+    """Mean of the per-reference speaker embeddings -> [1, 512, 1]"""
+    return speaker_embeddings(model, audios, sample_rate).mean(dim=0, keepdim=True).unsqueeze(-1)
+
+
+@torch.inference_mode()
+def compute_conditioning_latents(model, audio_path, max_ref_length=60, gpt_cond_len=30, gpt_cond_chunk_len=4,
+                                 workers=LOAD_WORKERS):
+    """Same result as model.get_conditioning_latents(audio_path, ...) - (gpt_cond_latent, speaker_embedding)"""
+    paths = audio_path if isinstance(audio_path, (list, tuple)) else [audio_path]
+    audios = load_references(paths, max_ref_length=max_ref_length, workers=workers)
+    gpt_cond_latent = gpt_cond_latents(model, [a.to(model.device) for a in audios],
+                                       length=gpt_cond_len, chunk_length=gpt_cond_chunk_len)
+    return gpt_cond_latent, speaker_embedding(model, audios)
+
+
+# ----------------------------------------
+# Benchmark
+# ----------------------------------------
+
+def _best_of(fn, repeats):
+    best, result = float("inf"), None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    from sentence_synthesis import load_xtts
+
+    parser = argparse.ArgumentParser(description="Batched conditioning latents")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench = sub.add_parser("benchmark", help="get_conditioning_latents vs batched, with parity")
+    bench.add_argument("--model-dir", required=True)
+    bench.add_argument("--checkpoint", required=True)
+    bench.add_argument("--reference", nargs="+", default=None,
+                       help="Reference WAVs (default: the 16 vago_samples_selected questions)")
+    bench.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    import audio_io
+    audio_io.install()
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    model = load_xtts(Path(args.model_dir), Path(args.checkpoint), device=device)
+    references = [str(r) for r in (args.reference or DEFAULT_REFERENCES)]
+    settings = {"gpt_cond_len": 30, "gpt_cond_chunk_len": 4, "max_ref_length": 60}
+
+    print("=" * 80)
+    print(f"🎙️  CONDITIONING LATENTS BENCHMARK ({len(references)} references, {device.upper()})")
+    print("=" * 80)
+    compute_conditioning_latents(model, references, **settings)  # warm file cache and kernels for both
+    before, (gpt_before, speaker_before) = _best_of(
+        lambda: model.get_conditioning_latents(audio_path=references, **settings), args.repeats)
+    after, (gpt_after, speaker_after) = _best_of(
+        lambda: compute_conditioning_latents(model, references, **settings), args.repeats)
+
+    with torch.inference_mode():
+        start = time.perf_counter()
+        audios = load_references(references)
+        load_s = time.perf_counter() - start
+        start = time.perf_counter()
+        gpt_cond_latents(model, [a.to(model.device) for a in audios])
+        gpt_s = time.perf_counter() - start
+        start = time.perf_counter()
+        speaker_embedding(model, audios)
+        speaker_s = time.perf_counter() - start
+    lengths = len({a.shape[-1] for a in audios})
+
+    gpt_error = (gpt_after - gpt_before).abs().max().item()
+    cosine = torch.nn.functional.cosine_similarity(speaker_after.flatten(), speaker_before.flatten(), dim=0).item()
+    print(f"get_conditioning_latents: {before:.2f}s")
+    print(f"batched:                  {after:.2f}s  ({before / after:.2f}x) - load {load_s:.2f}s, "
+          f"GPT chunks {gpt_s:.2f}s, speaker encoder {speaker_s:.2f}s ({lengths} length groups)")
+    print(f"Parity: GPT latent max abs diff {gpt_error:.2e}, speaker embedding cosine {cosine:.6f}")
+
+
+if __name__ == "__main__":
+    main()
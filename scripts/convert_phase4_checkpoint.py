@@ -12,6 +12,8 @@ import torch
 from pathlib import Path
 import sys
 
+from delta_checkpoint import load_checkpoint_state
+
 # Configuration
 PROJECT_ROOT = Path("i:/CODE/tts-2")
 TRAINING_DIR = PROJECT_ROOT / "run" / "training_phase4_continuation" / "XTTS_Phase4_Continuation-October-09-2025_07+54PM-f634425"
@@ -46,7 +48,7 @@ def convert_checkpoint(input_path, output_path):
     # Load checkpoint
     print("⏳ Loading training checkpoint...")
     try:
-        checkpoint = torch.load(input_path, map_location="cpu")
+        checkpoint = load_checkpoint_state(input_path, map_location="cpu")  # deltas are merged with their base
     except Exception as e:
         print(f"❌ Error loading checkpoint: {e}")
         return False
@@ -0,0 +1,235 @@
+"""
+Delta Checkpoints - Trainable Weights Only
+==========================================
+During phase continuation only the GPT is trained, yet every checkpoint_*.pth
+and best_model_*.pth used to carry the frozen DVAE, HiFiGAN decoder and
+speaker encoder as well (~5 GB per file).
+
+A delta checkpoint stores only:
+- parameters the optimizer can update (plus any tensor not present in the base)
+- buffers whose value differs from the base
+- optimizer state (which only covers those parameters anyway)
+- a reference + fingerprint of the base checkpoint it applies to
+
+load_checkpoint_state() rebuilds the full trainer state from base + delta.
+
+Usage:
+  python scripts/delta_checkpoint.py info best_model_2735.pth
+  python scripts/delta_checkpoint.py materialize best_model_2735.pth best_model_2735_full.pth
+"""
+
+import argparse
+import hashlib
+import sys
+from pathlib import Path
+
+import torch
+
+from gpt_lora import DEFAULT_ALPHA, adapter_from_checkpoint, apply_lora, find_gpt2
+
+DELTA_FORMAT = "xtts-delta-v1"
+DELTA_KEYS = ("format", "base_checkpoint", "base_fingerprint")
+FINGERPRINT_BLOCK = 16 * 1024**2  # bytes hashed from each end of the base file
+
+# Keys Xtts.load_checkpoint drops from trainer checkpoints (training-only modules)
+XTTS_IGNORE_PREFIXES = ("torch_mel_spectrogram_style_encoder", "torch_mel_spectrogram_dvae", "dvae")
+
+
+def quick_fingerprint(path):
+    """Size + hash of the first/last 16 MB - cheap enough for multi-GB checkpoints"""
+    path = Path(path)
+    size = path.stat().st_size
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        digest.update(f.read(FINGERPRINT_BLOCK))
+        if size > FINGERPRINT_BLOCK:
+            f.seek(max(FINGERPRINT_BLOCK, size - FINGERPRINT_BLOCK))
+            digest.update(f.read(FINGERPRINT_BLOCK))
+    return {"size": size, "sha256_ends": digest.hexdigest()}
+
+
+def load_state_file(path, map_location="cpu", mmap=False):
+    """torch.load that tolerates older (non-zip) files when mmap is requested"""
+    if mmap:
+        try:
+            return torch.load(path, map_location=map_location, weights_only=False, mmap=True)
+        except RuntimeError:
+            pass
+    return torch.load(path, map_location=map_location, weights_only=False)
+
+
+def is_delta_state(state):
+    return isinstance(state, dict) and state.get("format") == DELTA_FORMAT
+
+
+def is_delta_checkpoint(path):
+    """Peek at a checkpoint file without reading all tensors into memory"""
+    return is_delta_state(load_state_file(path, mmap=True))
+
+
+def trainable_state_keys(model, optimizer):
+    """State-dict keys of every parameter the optimizer(s) can update (tied aliases included)"""
+    optimizers = optimizer if isinstance(optimizer, list) else list(optimizer.values()) if isinstance(optimizer, dict) else [optimizer]
+    optimized = {id(p) for opt in optimizers for group in opt.param_groups for p in group["params"] if p.requires_grad}
+    return {name for name, p in model.named_parameters(remove_duplicate=False) if id(p) in optimized}
+
+
+class DeltaCheckpointer:
+    """Turns full trainer states into deltas against a fixed base checkpoint"""
+
+    def __init__(self, base_path, model, optimizer):
+        self.base_path = Path(base_path).resolve()
+        self.base_fingerprint = quick_fingerprint(self.base_path)
+        self.trainable = trainable_state_keys(model, optimizer)
+
+        base_state = load_state_file(self.base_path, mmap=True)
+        base_model = base_state["model"] if "model" in base_state else base_state
+        self.base_keys = set(base_model)
+        buffer_names = {name for name, _ in model.named_buffers(remove_duplicate=False)}
+        # Buffers are small - keep a CPU copy to detect the ones training touched
+        self.base_buffers = {k: base_model[k].detach().to("cpu", copy=True) for k in buffer_names if k in base_model}
+        del base_state, base_model
+
+    def _buffer_changed(self, key, value):
+        base = self.base_buffers.get(key)
+        if base is None:
+            return False
+        value = value.detach().to("cpu")
+        return value.shape != base.shape or value.dtype != base.dtype or not torch.equal(value, base)
+
+    def make_delta(self, state):
+        """Filter state["model"] down to the delta; everything else is kept as-is"""
+        delta_model = {
+            key: value
+            for key, value in state["model"].items()
+            if key in self.trainable or key not in self.base_keys or self._buffer_changed(key, value)
+        }
+        delta = dict(state)
+        delta["model"] = delta_model
+        delta["format"] = DELTA_FORMAT
+        delta["base_checkpoint"] = str(self.base_path)
+        delta["base_fingerprint"] = self.base_fingerprint
+        return delta
+
+
+def resolve_base_path(delta_path, delta_state, base_path=None):
+    """Explicit base > recorded absolute path > same file name next to the delta"""
+    candidates = [base_path, delta_state["base_checkpoint"]]
+    candidates.append(Path(delta_path).parent / Path(delta_state["base_checkpoint"]).name)
+    for candidate in candidates:
+        if candidate and Path(candidate).exists():
+            return Path(candidate)
+    raise FileNotFoundError(f"Base checkpoint not found: {delta_state['base_checkpoint']}")
+
+
+def load_checkpoint_state(path, map_location="cpu", base_path=None, verify=True):
+    """Load a checkpoint; delta checkpoints are merged with their base into a full state"""
+    state = load_state_file(path, map_location=map_location)
+    if not is_delta_state(state):
+        return state
+
+    base = resolve_base_path(path, state, base_path)
+    if verify and quick_fingerprint(base) != state["base_fingerprint"]:
+        raise ValueError(f"Base checkpoint {base} does not match the fingerprint recorded in {Path(path).name}")
+
+    base_state = load_state_file(base, map_location=map_location)
+    model = base_state["model"] if "model" in base_state else base_state
+    model.update(state["model"])
+
+    full = {k: v for k, v in state.items() if k not in DELTA_KEYS}
+    full["model"] = model
+    return full
+
+
+def ensure_full_checkpoint(path):
+    """Return a path Trainer(restore_path=...) can load: deltas are materialized once next to themselves"""
+    path = Path(path)
+    if not is_delta_checkpoint(path):
+        return path
+    full_path = path.with_name(path.stem + "_full.pth")
+    if not full_path.exists():
+        materialize(path, full_path)
+    return full_path
+
+
+def materialize(delta_path, output_path, base_path=None):
+    state = load_checkpoint_state(delta_path, base_path=base_path)
+    tmp_path = Path(str(output_path) + ".tmp")
+    torch.save(state, tmp_path)
+    tmp_path.replace(output_path)
+    return output_path
+
+
+def xtts_state_from_trainer_state(model_state):
+    """Trainer keys (xtts.*) -> Xtts inference keys, dropping training-only modules"""
+    converted = {}
+    for key, value in model_state.items():
+        if key.startswith("xtts."):
+            key = key[len("xtts."):]
+        if key.split(".")[0] in XTTS_IGNORE_PREFIXES:
+            continue
+        converted[key] = value
+    return converted
+
+
+def load_xtts_with_delta(model, config, checkpoint_dir, checkpoint_path, vocab_path, **kwargs):
+    """
+    Xtts.load_checkpoint that also accepts delta checkpoints:
+    the base is loaded normally, then the delta tensors are applied on top.
+    """
+    state = load_state_file(checkpoint_path, mmap=True)
+    if not is_delta_state(state):
+        model.load_checkpoint(config, checkpoint_dir=checkpoint_dir, checkpoint_path=str(checkpoint_path),
+                              vocab_path=vocab_path, **kwargs)
+        return model
+
+    base = resolve_base_path(checkpoint_path, state)
+    model.load_checkpoint(config, checkpoint_dir=checkpoint_dir, checkpoint_path=str(base),
+                          vocab_path=vocab_path, **kwargs)
+    model_state = xtts_state_from_trainer_state(state["model"])
+    if any(".lora." in k for k in model_state):
+        # LoRA run: the adapter layers must exist before their A/B tensors can load
+        _, lora = adapter_from_checkpoint(model_state)
+        apply_lora(find_gpt2(model), rank=lora["rank"], alpha=lora["alpha"] or DEFAULT_ALPHA,
+                   targets=tuple(lora["targets"]))
+    _, unexpected = model.load_state_dict(model_state, strict=False)
+    if unexpected:
+        raise ValueError(f"{Path(checkpoint_path).name} has {len(unexpected)} tensors the model does not "
+                         f"(e.g. {unexpected[0]})")
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or materialize delta checkpoints")
+    sub = parser.add_subparsers(dest="command", required=True)
+    info = sub.add_parser("info")
+    info.add_argument("checkpoint", type=Path)
+    mat = sub.add_parser("materialize")
+    mat.add_argument("delta", type=Path)
+    mat.add_argument("output", type=Path)
+    mat.add_argument("--base", type=Path, default=None)
+    args = parser.parse_args()
+
+    if args.command == "info":
+        state = load_state_file(args.checkpoint, mmap=True)
+        size_mb = args.checkpoint.stat().st_size / 1024**2
+        if not is_delta_state(state):
+            print(f"📦 Full checkpoint: {args.checkpoint.name} ({size_mb:.0f} MB, {len(state.get('model', {}))} tensors)")
+            return
+        print(f"📦 Delta checkpoint: {args.checkpoint.name} ({size_mb:.0f} MB)")
+        print(f"   • Tensors: {len(state['model'])}")
+        print(f"   • Step: {state.get('step')}")
+        print(f"   • Base: {state['base_checkpoint']}")
+        return
+
+    print(f"⏳ Materializing {args.delta.name}...")
+    try:
+        materialize(args.delta, args.output, base_path=args.base)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"❌ Error: {e}")
+        sys.exit(1)
+    print(f"✅ Full checkpoint written: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""
+Distributed Training - Data Parallel on CPU Cores and Nodes
+===========================================================
+torch.distributed (gloo) data parallelism for the Trainer/GPTTrainer setup.
+
+The Trainer only wraps models in DDP when several GPUs are present, so on CPU
+boxes this module does the data-parallel parts itself:
+- every process trains on its own shard of the samples (equal-length shards)
+- parameters are broadcast from rank 0 once (identical start, incl. LoRA init)
+- gradients are averaged with bucketed all-reduces right before gradient
+  clipping / the optimizer step, so every rank applies the same update
+- only rank 0 saves checkpoints, logs to TensorBoard and runs the eval service
+- each process gets cores / processes-per-node intra-op threads
+
+Launch with torchrun (one process per core group, any number of nodes):
+  torchrun --nproc_per_node=4 scripts/train_phase4_continuation.py
+  torchrun --nnodes=2 --node_rank=0 --master_addr=10.0.0.1 --master_port=29500 --nproc_per_node=4 scripts/train_phase4_continuation.py
+
+Scaling benchmark (XTTS-sized GPT, fixed batch per process):
+  python scripts/distributed_training.py benchmark --max-procs 4
+"""
+
+import argparse
+import datetime
+import os
+import socket
+import time
+from dataclasses import dataclass
+
+import torch
+import torch.distributed as dist
+from torch._utils import _flatten_dense_tensors, _unflatten_dense_tensors
+
+BUCKET_MB = 25  # all-reduce bucket size (same default as DDP)
+DEFAULT_BACKEND = "gloo"
+
+
+@dataclass
+class DistributedContext:
+    rank: int
+    world_size: int
+    local_rank: int
+    local_world_size: int
+
+    @property
+    def is_main(self):
+        return self.rank == 0
+
+
+def init_distributed(backend=DEFAULT_BACKEND, timeout_minutes=30):
+    """Join the process group if launched by torchrun (WORLD_SIZE > 1), else return None"""
+    world_size = int(os.environ.get("WORLD_SIZE", "1"))
+    if world_size <= 1:
+        return None
+    dist.init_process_group(backend=backend, timeout=datetime.timedelta(minutes=timeout_minutes))
+    ctx = DistributedContext(
+        rank=dist.get_rank(),
+        world_size=dist.get_world_size(),
+        local_rank=int(os.environ.get("LOCAL_RANK", "0")),
+        local_world_size=int(os.environ.get("LOCAL_WORLD_SIZE", str(world_size))),
+    )
+    configure_threads(ctx)
+    return ctx
+
+
+def configure_threads(ctx):
+    """Split this node's cores evenly between its processes"""
+    cores = os.cpu_count() or 1
+    threads = max(1, cores // ctx.local_world_size)
+    torch.set_num_threads(threads)
+    return threads
+
+
+def barrier(ctx):
+    if ctx is not None:
+        dist.barrier()
+
+
+def cleanup_distributed(ctx):
+    if ctx is not None:
+        dist.barrier()
+        dist.destroy_process_group()
+
+
+def broadcast_object(obj, ctx):
+    """rank 0's obj on every rank (e.g. a decision only rank 0 computed)"""
+    if ctx is None:
+        return obj
+    holder = [obj]
+    dist.broadcast_object_list(holder, src=0)
+    return holder[0]
+
+
+def shard_samples(samples, ctx):
+    """
+    Strided shard of the sample list for this rank. The list is padded by
+    wrapping around, so every rank has the same number of samples (and steps) -
+    otherwise the last all-reduce of an epoch would wait forever.
+    """
+    if ctx is None:
+        return samples
+    per_rank = -(-len(samples) // ctx.world_size)
+    padded = list(samples) + list(samples[: per_rank * ctx.world_size - len(samples)])
+    return padded[ctx.rank :: ctx.world_size]
+
+
+def broadcast_parameters(model, ctx):
+    """Copy rank 0's trainable parameters and buffers to every rank"""
+    tensors = [p.data for p in model.parameters() if p.requires_grad] + list(model.buffers())
+    for tensor in tensors:
+        dist.broadcast(tensor, src=0)
+
+
+class GradientAllReducer:
+    """Averages gradients across ranks in flat buckets (one all-reduce per ~25 MB)"""
+
+    def __init__(self, params, world_size, bucket_mb=BUCKET_MB):
+        self.params = [p for p in params if p.requires_grad]
+        self.world_size = world_size
+        self.bucket_bytes = bucket_mb * 1024**2
+        self.pending = True
+        self.stats = {"reduces": 0, "seconds": 0.0, "bytes": 0}
+
+    def _buckets(self):
+        bucket, size = [], 0
+        for p in self.params:
+            if p.grad is None:
+                # Every rank must reduce the same tensors
+                p.grad = torch.zeros_like(p)
+            bucket.append(p.grad)
+            size += p.grad.numel() * p.grad.element_size()
+            if size >= self.bucket_bytes:
+                yield bucket
+                bucket, size = [], 0
+        if bucket:
+            yield bucket
+
+    def reduce(self):
+        """All-reduce once per optimizer step (no-op if already done for this step)"""
+        if not self.pending:
+            return
+        start = time.perf_counter()
+        for grads in self._buckets():
+            flat = _flatten_dense_tensors(grads)
+            dist.all_reduce(flat)
+            flat /= self.world_size
+            for grad, synced in zip(grads, _unflatten_dense_tensors(flat, grads)):
+                grad.copy_(synced)
+            self.stats["bytes"] += flat.numel() * flat.element_size()
+        self.stats["reduces"] += 1
+        self.stats["seconds"] += time.perf_counter() - start
+        self.pending = False
+
+
+def install_distributed(trainer, ctx, bucket_mb=BUCKET_MB):
+    """
+    Make an initialized Trainer data-parallel: broadcast rank 0's weights and
+    average gradients before clipping (model.before_gradient_clipping hook) or,
+    if clipping is skipped, right before optimizer.step.
+    """
+    model = trainer.model.module if hasattr(trainer.model, "module") else trainer.model
+    optimizer = trainer.optimizer
+    params = [p for group in optimizer.param_groups for p in group["params"]]
+    broadcast_parameters(model, ctx)
+    reducer = GradientAllReducer(params, ctx.world_size, bucket_mb)
+
+    original_step = optimizer.step
+
+    def step(*args, **kwargs):
+        reducer.reduce()
+        result = original_step(*args, **kwargs)
+        reducer.pending = True
+        return result
+
+    optimizer.step = step
+    model.before_gradient_clipping = reducer.reduce
+    return reducer
+
+
+def print_reducer_report(reducer, ctx):
+    stats = reducer.stats
+    print()
+    print(f"🔗 Gradient all-reduce report (rank {ctx.rank}/{ctx.world_size}):")
+    print(f"   • Steps synchronized: {stats['reduces']}")
+    print(f"   • Time in all-reduce: {stats['seconds']:.1f}s")
+    print(f"   • Reduced: {stats['bytes'] / 1024**3:.2f} GB")
+
+
+# ----------------------------------------
+# Scaling benchmark
+# ----------------------------------------
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _benchmark_worker(rank, world_size, port, args, results):
+    os.environ.update(MASTER_ADDR="127.0.0.1", MASTER_PORT=str(port), RANK=str(rank),
+                      WORLD_SIZE=str(world_size), LOCAL_RANK=str(rank), LOCAL_WORLD_SIZE=str(world_size))
+    if world_size > 1:
+        ctx = init_distributed()
+    else:
+        ctx = DistributedContext(0, 1, 0, 1)
+        configure_threads(ctx)
+
+    from gpt_lora import XTTS_GPT_DIM, build_benchmark_gpt
+    torch.manual_seed(0)
+    gpt2 = build_benchmark_gpt(args.layers)
+    gpt2.train()
+    optimizer = torch.optim.AdamW(gpt2.parameters(), lr=1e-5)
+    reducer = None
+    if world_size > 1:
+        broadcast_parameters(gpt2, ctx)
+        reducer = GradientAllReducer(list(gpt2.parameters()), world_size)
+    inputs = torch.randn(args.batch_size, args.seq_len, XTTS_GPT_DIM)
+
+    times = []
+    for step in range(args.steps + 1):  # step 0 is warmup
+        barrier(ctx if world_size > 1 else None)
+        start = time.perf_counter()
+        gpt2(inputs_embeds=inputs).last_hidden_state.pow(2).mean().backward()
+        if reducer is not None:
+            reducer.reduce()
+            reducer.pending = True
+        optimizer.step()
+        optimizer.zero_grad(set_to_none=True)
+        if step:
+            times.append(time.perf_counter() - start)
+
+    if rank == 0:
+        step_seconds = sum(times) / len(times)
+        results[world_size] = {
+            "step_seconds": step_seconds,
+            "samples_per_sec": world_size * args.batch_size / step_seconds,
+            "allreduce_seconds": reducer.stats["seconds"] / reducer.stats["reduces"] if reducer else 0.0,
+            "threads": torch.get_num_threads(),
+        }
+    if world_size > 1:
+        dist.destroy_process_group()
+
+
+def run_scaling_benchmark(args):
+    import torch.multiprocessing as mp
+
+    manager = mp.Manager()
+    results = manager.dict()
+    counts = [n for n in (1, 2, 4, 8, 16, 32) if n <= args.max_procs]
+    if args.max_procs not in counts:
+        counts.append(args.max_procs)
+    for world_size in counts:
+        print(f"⏳ {world_size} process(es)...")
+        mp.spawn(_benchmark_worker, args=(world_size, _free_port(), args, results), nprocs=world_size, join=True)
+
+    base = results[1]["samples_per_sec"]
+    print()
+    print(f"{'Procs':<7}{'Threads':>9}{'Step time':>12}{'Samples/s':>12}{'All-reduce':>12}{'Speedup':>10}{'Efficiency':>12}")
+    for world_size in counts:
+        r = results[world_size]
+        speedup = r["samples_per_sec"] / base
+        print(f"{world_size:<7}{r['threads']:>9}{r['step_seconds']:>11.2f}s{r['samples_per_sec']:>12.2f}"
+              f"{r['allreduce_seconds']:>11.2f}s{speedup:>9.2f}x{speedup / world_size:>12.0%}")
+    return dict(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distributed training tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench = sub.add_parser("benchmark", help="Scaling efficiency from 1 to N processes on this machine")
+    bench.add_argument("--max-procs", type=int, default=min(4, os.cpu_count() or 1))
+    bench.add_argument("--layers", type=int, default=30)
+    bench.add_argument("--steps", type=int, default=3)
+    bench.add_argument("--batch-size", type=int, default=1, help="Per process (weak scaling)")
+    bench.add_argument("--seq-len", type=int, default=256)
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print(f"🔗 DATA-PARALLEL SCALING BENCHMARK ({DEFAULT_BACKEND}, {os.cpu_count()} cores)")
+    print("=" * 80)
+    run_scaling_benchmark(args)
+
+
+if __name__ == "__main__":
+    main()
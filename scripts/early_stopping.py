@@ -0,0 +1,307 @@
+"""
+Early Stopping - Stop Training When Mel CE Stops Improving
+==========================================================
+Trainer callback that follows smoothed (EMA) Mel CE / Text CE and ends the run
+when continuing is wasted compute:
+- target: smoothed Mel CE reached the target (2.5)
+- guardrail: smoothed Text CE went above 0.03 (pronunciation degrading)
+- plateau: smoothed Mel CE has not improved by min_delta for `patience` evaluations
+
+Scores come from the eval service leaderboard (eval_leaderboard.json, polled
+while training) or, without the service, from the Trainer's end-of-epoch
+averages. If the service process dies, or no leaderboard appears within
+LEADERBOARD_WAIT_CHECKS polls, the stopper falls back to the epoch averages.
+Text CE is compared on the Trainer's logged scale (weighted by
+gpt_loss_text_ce_weight), the same numbers as TensorBoard.
+
+Stopping ends the current epoch after the running step and skips the rest.
+At the end, finish() keeps only the relevant checkpoints (best K on the
+holdout + the latest one for resuming) and reports the GPU/CPU hours saved
+compared with the configured epoch budget.
+
+Usage (after the Trainer is created):
+  stopper = EarlyStopping.install(trainer, StoppingPolicy(target_mel_ce=2.5, patience=5), eval_process=proc)
+  trainer.fit()
+  stopper.finish()   # after the checkpoint writer and eval service are done
+"""
+
+import json
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+import torch
+import torch.distributed as dist
+
+from checkpoint_writer import current_metric
+from eval_service import CHECKPOINT_PATTERN, LEADERBOARD_FILE_NAME, load_leaderboard
+
+REPORT_FILE_NAME = "early_stopping.json"
+LEADERBOARD_WAIT_CHECKS = 50  # polls without eval_leaderboard.json before using epoch averages
+
+
+@dataclass
+class StoppingPolicy:
+    target_mel_ce: float = 2.5
+    text_ce_limit: float = 0.03  # Trainer-logged (weighted) Text CE
+    patience: int = 5  # evaluations without improvement before stopping
+    min_delta: float = 0.005  # smoothed Mel CE improvement that counts
+    smoothing: float = 0.3  # EMA weight of the newest evaluation
+    min_evaluations: int = 3  # never stop before this many evaluations
+    keep_best: int = 2  # checkpoints kept by holdout Mel CE (plus the latest)
+
+
+class PlateauDetector:
+    """EMA of Mel CE / Text CE and the stopping decision"""
+
+    def __init__(self, policy):
+        self.policy = policy
+        self.history = []  # (step, mel_ce, text_ce, smoothed_mel_ce, smoothed_text_ce)
+        self.smoothed_mel = None
+        self.smoothed_text = None
+        self.best_mel = float("inf")
+        self.best_step = None
+        self.since_best = 0
+
+    def observe(self, step, mel_ce, text_ce=None):
+        """Add one evaluation. Returns the stop reason or None."""
+        a = self.policy.smoothing
+        self.smoothed_mel = mel_ce if self.smoothed_mel is None else a * mel_ce + (1 - a) * self.smoothed_mel
+        if text_ce is not None:
+            self.smoothed_text = text_ce if self.smoothed_text is None else a * text_ce + (1 - a) * self.smoothed_text
+        self.history.append((step, mel_ce, text_ce, self.smoothed_mel, self.smoothed_text))
+
+        if self.smoothed_mel < self.best_mel - self.policy.min_delta:
+            self.best_mel = self.smoothed_mel
+            self.best_step = step
+            self.since_best = 0
+        else:
+            self.since_best += 1
+
+        if len(self.history) < self.policy.min_evaluations:
+            return None
+        if self.smoothed_mel <= self.policy.target_mel_ce:
+            return "target"
+        if self.smoothed_text is not None and self.smoothed_text > self.policy.text_ce_limit:
+            return "text_ce_guardrail"
+        if self.since_best >= self.policy.patience:
+            return "plateau"
+        return None
+
+
+class _StoppableLoader:
+    """Train loader that ends the epoch early once the stopper has fired"""
+
+    def __init__(self, loader, stopper):
+        self.loader = loader
+        self.stopper = stopper
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __getattr__(self, name):
+        return getattr(self.loader, name)
+
+    def __iter__(self):
+        for batch in self.loader:
+            if self.stopper.reason is not None:
+                return
+            yield batch
+
+
+class EarlyStopping:
+    """Trainer callbacks around a PlateauDetector"""
+
+    def __init__(self, policy, run_dir, text_ce_weight=1.0, use_leaderboard=True, check_every=10,
+                 eval_process=None, leaderboard_wait_checks=LEADERBOARD_WAIT_CHECKS):
+        self.policy = policy
+        self.detector = PlateauDetector(policy)
+        self.run_dir = Path(run_dir)
+        self.text_ce_weight = text_ce_weight
+        self.use_leaderboard = use_leaderboard
+        self.check_every = check_every
+        self.eval_process = eval_process
+        self.leaderboard_wait_checks = leaderboard_wait_checks
+        self._missing_checks = 0
+        self.reason = None
+        self.stop_step = None
+        self._leaderboard_mtime = None
+        self._trainer = None
+        self._start_time = None
+        self._start_step = 0
+        self.world_size = dist.get_world_size() if dist.is_available() and dist.is_initialized() else 1
+
+    @classmethod
+    def install(cls, trainer, policy=None, use_leaderboard=None, check_every=10, eval_process=None):
+        """
+        use_leaderboard: read the eval service's scores (default: when in-loop eval is off).
+        eval_process: the service's Popen - if it exits during training, epoch averages are used.
+        In data-parallel runs install on every rank - rank 0 decides, the others follow.
+        """
+        if use_leaderboard is None:
+            use_leaderboard = not trainer.config.run_eval
+        model_args = getattr(trainer.config, "model_args", None)
+        stopper = cls(policy or StoppingPolicy(), trainer.output_path,
+                      text_ce_weight=getattr(model_args, "gpt_loss_text_ce_weight", 1.0),
+                      use_leaderboard=use_leaderboard, check_every=check_every, eval_process=eval_process)
+        stopper._trainer = trainer
+        stopper._start_step = trainer.restore_step
+        trainer.callbacks.callbacks_on_train_epoch_start.append(stopper.on_train_epoch_start)
+        trainer.callbacks.callbacks_on_train_step_end.append(stopper.on_train_step_end)
+        trainer.callbacks.callbacks_on_epoch_end.append(stopper.on_epoch_end)
+        return stopper
+
+    def on_train_epoch_start(self, trainer):
+        if self._start_time is None:
+            self._start_time = time.perf_counter()
+        if not isinstance(trainer.train_loader, _StoppableLoader):
+            trainer.train_loader = _StoppableLoader(trainer.train_loader, self)
+
+    def on_train_step_end(self, trainer):
+        if self.reason is not None or trainer.total_steps_done % self.check_every:
+            return
+        if self.use_leaderboard and trainer.args.rank == 0:
+            self._poll_leaderboard(trainer)
+        self._sync(trainer)
+
+    def on_epoch_end(self, trainer):
+        if self.reason is None and not self.use_leaderboard and trainer.args.rank == 0:
+            mel_ce = current_metric(trainer, "avg_loss_mel_ce")
+            if mel_ce is not None:
+                self._observe(trainer, trainer.total_steps_done, mel_ce, current_metric(trainer, "avg_loss_text_ce"))
+        self._sync(trainer)
+
+    def _poll_leaderboard(self, trainer):
+        # The service only exits once training is over - any earlier exit means no more scores
+        if self.eval_process is not None and self.eval_process.poll() is not None:
+            self._fall_back(f"eval service exited with code {self.eval_process.returncode}")
+            return
+        path = self.run_dir / LEADERBOARD_FILE_NAME
+        try:
+            mtime = path.stat().st_mtime
+        except FileNotFoundError:
+            self._missing_checks += 1
+            if self._missing_checks >= self.leaderboard_wait_checks:
+                self._fall_back(f"no {LEADERBOARD_FILE_NAME} after {self._missing_checks} checks")
+            return
+        if mtime == self._leaderboard_mtime:
+            return
+        self._leaderboard_mtime = mtime
+        # checkpoint_N and best_model_N score the same weights - one evaluation per step
+        entries = {e["step"]: e for e in load_leaderboard(path)["entries"] if e.get("step") is not None}
+        last_step = self.detector.history[-1][0] if self.detector.history else self._start_step
+        for step in sorted(entries):
+            if step <= last_step:
+                continue
+            entry = entries[step]
+            self._observe(trainer, step, entry["mel_ce"], entry["text_ce"] * self.text_ce_weight)
+            if self.reason is not None:
+                break
+
+    def _fall_back(self, why):
+        self.use_leaderboard = False
+        print(f"   ⚠️  Early stopping: {why} - following the Trainer's epoch averages instead")
+
+    def _observe(self, trainer, step, mel_ce, text_ce):
+        reason = self.detector.observe(step, mel_ce, text_ce)
+        d = self.detector
+        text = f", Text CE {d.smoothed_text:.4f}" if d.smoothed_text is not None else ""
+        print(f"   📉 Step {step}: smoothed Mel CE {d.smoothed_mel:.4f}{text} "
+              f"(best {d.best_mel:.4f} @ {d.best_step}, {d.since_best}/{self.policy.patience} without improvement)")
+        if reason is not None:
+            self._stop(trainer, reason)
+
+    def _sync(self, trainer):
+        # Every rank runs the same steps, so all of them reach this broadcast together
+        if not (dist.is_available() and dist.is_initialized()):
+            return
+        flag = torch.tensor([0 if self.reason is None else 1])
+        dist.broadcast(flag, src=0)
+        if flag.item() and self.reason is None:
+            self._stop(trainer, "rank 0")
+
+    def _stop(self, trainer, reason):
+        self.reason = reason
+        self.stop_step = trainer.total_steps_done
+        # The running epoch ends after this step (_StoppableLoader), the remaining ones are skipped
+        trainer.skip_train_epoch = True
+        trainer.config.run_eval = False
+        messages = {
+            "target": f"target Mel CE {self.policy.target_mel_ce} reached",
+            "text_ce_guardrail": f"Text CE above {self.policy.text_ce_limit}",
+            "plateau": f"no Mel CE improvement in {self.policy.patience} evaluations",
+            "rank 0": "rank 0 stopped",
+        }
+        print()
+        print(f"🛑 Early stopping at step {self.stop_step}: {messages[reason]}")
+
+    def prune_checkpoints(self):
+        """Keep the best K checkpoints on the holdout and the latest one; returns bytes freed"""
+        leaderboard = load_leaderboard(self.run_dir / LEADERBOARD_FILE_NAME)
+        if not leaderboard["entries"]:
+            print("   ⚠️  No leaderboard - checkpoints left to the writer's retention policy")
+            return 0
+        keep = {e["checkpoint"] for e in leaderboard["entries"][: self.policy.keep_best]}
+        checkpoints = []
+        for path in self.run_dir.glob("*.pth"):
+            match = CHECKPOINT_PATTERN.match(path.name)
+            if match:
+                checkpoints.append((int(match.group(2)), match.group(1), path))
+        latest = [path for _, kind, path in sorted(checkpoints) if kind == "checkpoint"][-1:]
+        keep.update(path.name for path in latest)
+
+        freed = 0
+        for _, _, path in sorted(checkpoints):
+            if path.name in keep:
+                continue
+            size = path.stat().st_size
+            path.unlink()
+            freed += size
+            print(f"  🗑️  Deleted: {path.name} ({size / 1024**2:.0f} MB freed)")
+        print(f"   ✅ Kept: {', '.join(sorted(keep))}")
+        return freed
+
+    def summary(self):
+        trainer = self._trainer
+        steps_done = trainer.total_steps_done - self._start_step
+        steps_per_epoch = len(trainer.train_loader) if trainer.train_loader is not None else 0
+        budget_steps = trainer.config.epochs * steps_per_epoch
+        elapsed = time.perf_counter() - self._start_time if self._start_time is not None else 0.0
+        seconds_per_step = elapsed / steps_done if steps_done else 0.0
+        processes = self.world_size
+        saved_steps = max(0, budget_steps - steps_done)
+        d = self.detector
+        return {
+            "reason": self.reason,
+            "stop_step": self.stop_step,
+            "best_step": d.best_step,
+            "best_smoothed_mel_ce": round(d.best_mel, 5) if d.best_step is not None else None,
+            "evaluations": len(d.history),
+            "steps_done": steps_done,
+            "budget_steps": budget_steps,
+            "saved_steps": saved_steps,
+            "device": "GPU" if trainer.use_cuda else "CPU",
+            "hours_used": round(elapsed * processes / 3600, 2),
+            "hours_saved": round(saved_steps * seconds_per_step * processes / 3600, 2),
+            "history": [list(h) for h in d.history],
+        }
+
+    def finish(self, prune=True):
+        """Prune checkpoints, print the report and write early_stopping.json (call on rank 0)"""
+        summary = self.summary()
+        print()
+        print("📉 Early stopping report:")
+        if summary["reason"] is None:
+            print("   • Ran the full epoch budget (no stop condition met)")
+        else:
+            print(f"   • Stopped at step {summary['stop_step']} ({summary['reason']})")
+        if summary["best_step"] is not None:
+            print(f"   • Best smoothed Mel CE: {summary['best_smoothed_mel_ce']:.4f} at step {summary['best_step']}")
+        print(f"   • Steps: {summary['steps_done']} of {summary['budget_steps']} budgeted")
+        print(f"   • {summary['device']} hours: {summary['hours_used']:.2f} used, ~{summary['hours_saved']:.2f} saved")
+        if prune and summary["reason"] is not None:
+            print("🧹 Keeping only the relevant checkpoints...")
+            summary["bytes_freed"] = self.prune_checkpoints()
+        with open(self.run_dir / REPORT_FILE_NAME, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+        return summary
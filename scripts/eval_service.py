@@ -0,0 +1,367 @@
+"""
+Evaluation Service - Non-Blocking Checkpoint Scoring
+====================================================
+Scores saved checkpoints on a fixed holdout set in a separate process,
+so training never stops for evaluation.
+
+- The holdout set is the run's eval split (metadata_eval.csv for Phase 4).
+  Its batches are built once - conditioning mels and DVAE codes included -
+  and cached in <run_dir>/eval_holdout_cache.pt. Every checkpoint is scored on
+  exactly the same inputs (no random conditioning crops).
+- Each new checkpoint_*.pth / best_model_*.pth (full, delta or LoRA) gets
+  Mel CE / Text CE via GPTTrainer.eval_step.
+- Results go to TensorBoard (EvalService/*) and <run_dir>/eval_leaderboard.json,
+  which is sorted by Mel CE. A checkpoint that fails to load or score is
+  logged under "failed" and retried only if the file changes.
+
+Started by the training scripts (EVAL_SERVICE = True) with a stdin pipe: when
+training ends (or dies) the pipe closes, the service scores the remaining
+checkpoints and exits.
+
+Usage:
+  python scripts/eval_service.py run/training_phase4_continuation/<run>          # watch
+  python scripts/eval_service.py run/training_phase4_continuation/<run> --once   # score and exit
+"""
+
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+
+import audio_io
+audio_io.install()  # soundfile instead of torchaudio/torchcodec
+
+from TTS.tts.datasets import load_tts_samples
+from TTS.tts.layers.xtts.trainer.gpt_trainer import GPTTrainer, GPTTrainerConfig
+
+from delta_checkpoint import is_delta_state, load_state_file, resolve_base_path
+from gpt_lora import adapter_from_checkpoint, apply_lora, find_gpt2, remove_lora
+
+CACHE_FILE_NAME = "eval_holdout_cache.pt"
+LEADERBOARD_FILE_NAME = "eval_leaderboard.json"
+CHECKPOINT_PATTERN = re.compile(r"^(checkpoint|best_model)_(\d+)\.pth$")
+POLL_SECONDS = 10
+HOLDOUT_SEED = 1234
+LOSS_KEYS = ("loss_mel_ce", "loss_text_ce", "loss")
+
+
+def holdout_fingerprint(samples, config):
+    """Changes whenever the holdout audio/text or the feature settings change"""
+    items = []
+    for sample in sorted(samples, key=lambda s: s["audio_file"]):
+        stat = os.stat(sample["audio_file"])
+        items.append([sample["audio_file"], sample["text"], stat.st_size, stat.st_mtime_ns])
+    payload = {
+        "samples": items,
+        "audio": config.audio.to_dict(),
+        "model_args": config.model_args.to_dict(),
+        "eval_batch_size": config.eval_batch_size,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def to_device(batch, device):
+    return {k: v.to(device) if isinstance(v, torch.Tensor) else v for k, v in batch.items()}
+
+
+def build_holdout_batches(model, config, samples, device):
+    """Run the data loader + format_batch_on_device once, with fixed seeds"""
+    random.seed(HOLDOUT_SEED)
+    np.random.seed(HOLDOUT_SEED)
+    torch.manual_seed(HOLDOUT_SEED)
+    config.run_eval = True  # get_data_loader returns None for eval otherwise
+    loader = model.get_data_loader(config, {}, is_eval=True, samples=samples, verbose=False, num_gpus=0)
+    batches = []
+    for batch in loader:
+        batch = model.format_batch(batch)
+        batch = model.format_batch_on_device(to_device(batch, device))
+        batches.append(to_device(batch, "cpu"))
+    return batches
+
+
+def load_holdout(model, config, run_dir, device):
+    """Cached holdout batches (rebuilt only if the fingerprint changed)"""
+    if not any(dataset.formatter for dataset in config.datasets):
+        raise ValueError("config.json lists no dataset - the training script must pass datasets=[config_dataset]")
+    _, samples = load_tts_samples(
+        config.datasets,
+        eval_split=True,
+        eval_split_max_size=config.eval_split_max_size,
+        eval_split_size=config.eval_split_size,
+    )
+    fingerprint = holdout_fingerprint(samples, config)
+    cache_path = run_dir / CACHE_FILE_NAME
+    if cache_path.exists():
+        cache = torch.load(cache_path, map_location="cpu", weights_only=False)
+        if cache.get("fingerprint") == fingerprint:
+            print(f"📦 Holdout cache: {len(cache['samples'])} samples ({cache_path.name})")
+            return cache
+
+    print(f"⏳ Building holdout cache ({len(samples)} samples)...")
+    start = time.perf_counter()
+    cache = {
+        "fingerprint": fingerprint,
+        "samples": [s["audio_file"] for s in samples],
+        "batches": build_holdout_batches(model, config, samples, device),
+    }
+    tmp_path = cache_path.with_name(cache_path.name + ".tmp")
+    torch.save(cache, tmp_path)
+    os.replace(tmp_path, cache_path)
+    print(f"   ✅ Cached {len(cache['batches'])} batches in {time.perf_counter() - start:.1f}s")
+    return cache
+
+
+class CheckpointScorer:
+    """Holds one GPTTrainer and swaps checkpoint weights into it"""
+
+    def __init__(self, config, device):
+        self.device = device
+        self.model = GPTTrainer.init_from_config(config).to(device)
+        self.model.eval()
+        self.loaded_base = None
+
+    def _sync_lora(self, model_state):
+        gpt2 = find_gpt2(self.model)
+        if not any(".lora." in k for k in model_state):
+            remove_lora(gpt2)
+            return
+        _, config = adapter_from_checkpoint(model_state)
+        current = getattr(gpt2, "lora_config", None)
+        if current is None or current["rank"] != config["rank"] or current["targets"] != config["targets"]:
+            # alpha is loaded with the tensors (checkpoints without it keep the default)
+            apply_lora(gpt2, rank=config["rank"], targets=tuple(config["targets"]))
+
+    def _load_model_state(self, model_state):
+        self._sync_lora(model_state)
+        self.model.load_state_dict(model_state, strict=False)
+
+    def load(self, path):
+        state = load_state_file(path, mmap=True)
+        if is_delta_state(state):
+            # The base is loaded once; each delta only overwrites the trained tensors
+            base = resolve_base_path(path, state)
+            if self.loaded_base != base:
+                base_state = load_state_file(base, mmap=True)
+                self._load_model_state(base_state["model"] if "model" in base_state else base_state)
+                self.loaded_base = base
+        else:
+            self.loaded_base = None
+        self._load_model_state(state["model"])
+        return state.get("step")
+
+    def reset(self):
+        """After a failed load or score: the weights may be half-swapped, so reload the base next time"""
+        self.loaded_base = None
+        if str(self.device).startswith("cuda"):
+            torch.cuda.empty_cache()
+
+    @torch.no_grad()
+    def score(self, batches):
+        totals = dict.fromkeys(LOSS_KEYS, 0.0)
+        n_samples = 0
+        for batch in batches:
+            batch = to_device(dict(batch), self.device)
+            _, loss_dict = self.model.eval_step(batch, None)
+            size = batch["text_inputs"].shape[0]
+            for key in LOSS_KEYS:
+                totals[key] += float(loss_dict[key]) * size
+            n_samples += size
+        # Report unweighted CE values (GPTTrainer scales them by the loss weights)
+        args = self.model.args
+        return {
+            "mel_ce": totals["loss_mel_ce"] / n_samples / args.gpt_loss_mel_ce_weight,
+            "text_ce": totals["loss_text_ce"] / n_samples / args.gpt_loss_text_ce_weight,
+            "loss": totals["loss"] / n_samples,
+        }
+
+
+def load_leaderboard(path):
+    if path.exists():
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {"entries": [], "failed": []}
+
+
+def write_leaderboard(path, leaderboard):
+    leaderboard["entries"].sort(key=lambda e: e["mel_ce"])
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(leaderboard, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def file_stamp(path):
+    stat = path.stat()
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def pending_checkpoints(run_dir, done, failed=None):
+    """Unscored checkpoints, oldest step first; failed ones ({name: stamp}) only once the file changed"""
+    failed = failed or {}
+    found = []
+    for path in run_dir.glob("*.pth"):
+        match = CHECKPOINT_PATTERN.match(path.name)
+        if not match or path.name in done:
+            continue
+        try:
+            if failed.get(path.name) == file_stamp(path):
+                continue
+        except FileNotFoundError:
+            continue
+        found.append((int(match.group(2)), path))
+    return [path for _, path in sorted(found)]
+
+
+def watch_stdin(stop_event):
+    """Parent closed our stdin (training finished or died) -> stop after the next pass"""
+    def wait():
+        try:
+            sys.stdin.read()
+        finally:
+            stop_event.set()
+    threading.Thread(target=wait, daemon=True).start()
+
+
+def run_service(run_dir, device="cpu", threads=2, once=False, poll_seconds=POLL_SECONDS, watch_parent=False):
+    from torch.utils.tensorboard import SummaryWriter
+
+    torch.set_num_threads(threads)
+    config = GPTTrainerConfig()
+    config.load_json(str(run_dir / "config.json"))
+
+    print("🤖 Loading evaluation model...")
+    scorer = CheckpointScorer(config, device)
+    holdout = load_holdout(scorer.model, config, run_dir, device)
+
+    leaderboard_path = run_dir / LEADERBOARD_FILE_NAME
+    leaderboard = load_leaderboard(leaderboard_path)
+    leaderboard["holdout"] = {"samples": holdout["samples"], "fingerprint": holdout["fingerprint"]}
+    # Scores from an older holdout set are not comparable
+    leaderboard["entries"] = [e for e in leaderboard["entries"] if e.get("holdout") == holdout["fingerprint"]]
+    leaderboard.setdefault("failed", [])
+    done = {e["checkpoint"] for e in leaderboard["entries"]}
+    failed = {e["checkpoint"]: e["stamp"] for e in leaderboard["failed"]}
+    writer = SummaryWriter(log_dir=str(run_dir), filename_suffix=".eval_service")
+
+    stop_event = threading.Event()
+    if watch_parent:
+        watch_stdin(stop_event)
+
+    print(f"👀 Watching {run_dir}")
+    while True:
+        stopping = once or stop_event.is_set()
+        for path in pending_checkpoints(run_dir, done, failed):
+            start = time.perf_counter()
+            try:
+                stamp = file_stamp(path)
+                step = scorer.load(path)
+                scores = scorer.score(holdout["batches"])
+            except FileNotFoundError:
+                continue  # removed by the retention policy before we got to it
+            except Exception as e:  # truncated file, unpickling error, OOM... - keep serving the others
+                scorer.reset()
+                failed[path.name] = stamp
+                leaderboard["failed"] = [f for f in leaderboard["failed"] if f["checkpoint"] != path.name]
+                leaderboard["failed"].append(dict(checkpoint=path.name, stamp=stamp, error=f"{type(e).__name__}: {e}",
+                                                  failed_at=datetime.datetime.now().isoformat(timespec="seconds")))
+                write_leaderboard(leaderboard_path, leaderboard)
+                print(f"❌ {path.name}: {type(e).__name__}: {e} - skipped (retried if the file changes)")
+                continue
+            elapsed = time.perf_counter() - start
+            done.add(path.name)
+            if failed.pop(path.name, None) is not None:
+                leaderboard["failed"] = [f for f in leaderboard["failed"] if f["checkpoint"] != path.name]
+
+            entry = dict(checkpoint=path.name, step=step, holdout=holdout["fingerprint"],
+                         evaluated_at=datetime.datetime.now().isoformat(timespec="seconds"),
+                         eval_seconds=round(elapsed, 2), **{k: round(v, 5) for k, v in scores.items()})
+            leaderboard["entries"].append(entry)
+            write_leaderboard(leaderboard_path, leaderboard)
+            for key in ("mel_ce", "text_ce", "loss"):
+                writer.add_scalar(f"EvalService/{key}", scores[key], step)
+            writer.flush()
+
+            rank = [e["checkpoint"] for e in leaderboard["entries"]].index(path.name) + 1
+            print(f"📊 {path.name}: Mel CE {scores['mel_ce']:.4f}, Text CE {scores['text_ce']:.4f} "
+                  f"(#{rank} of {len(leaderboard['entries'])}, {elapsed:.1f}s)")
+        if stopping:
+            break
+        stop_event.wait(poll_seconds)
+
+    writer.close()
+    if leaderboard["entries"]:
+        best = leaderboard["entries"][0]
+        print(f"🏆 Best on holdout: {best['checkpoint']} (Mel CE {best['mel_ce']:.4f})")
+    return leaderboard
+
+
+def start_eval_service(run_dir, device="cpu", threads=2):
+    """Launch the service next to a training run; close proc.stdin (or exit) to stop it"""
+    return subprocess.Popen(
+        [sys.executable, str(Path(__file__).resolve()), str(run_dir),
+         "--device", device, "--threads", str(threads), "--watch-parent"],
+        stdin=subprocess.PIPE,
+    )
+
+
+def eval_service_failed(proc):
+    """True once the service process has exited with an error"""
+    return proc is not None and proc.poll() not in (None, 0)
+
+
+def monitor_eval_service(trainer, proc):
+    """Warn (once) at the end of an epoch if the service died - its checkpoints are no longer scored"""
+    warned = False
+
+    def check(trainer):
+        nonlocal warned
+        if not warned and eval_service_failed(proc):
+            warned = True
+            print(f"⚠️  Eval service exited with code {proc.returncode} - checkpoints are not being scored. "
+                  f"Score them later: python scripts/eval_service.py {trainer.output_path} --once")
+
+    trainer.callbacks.callbacks_on_epoch_end.append(check)
+
+
+def stop_eval_service(proc):
+    """Let the service score the last checkpoints, then wait for it; returns its exit code"""
+    proc.stdin.close()
+    code = proc.wait()
+    if code != 0:
+        print(f"⚠️  Eval service exited with code {code} - eval_leaderboard.json may be missing or incomplete")
+    return code
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score checkpoints on a cached holdout set")
+    parser.add_argument("run_dir", type=Path)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--threads", type=int, default=2, help="CPU threads (leave the rest to training)")
+    parser.add_argument("--once", action="store_true", help="Score pending checkpoints and exit")
+    parser.add_argument("--poll", type=float, default=POLL_SECONDS)
+    parser.add_argument("--watch-parent", action="store_true", help="Stop when stdin closes")
+    args = parser.parse_args()
+
+    if not (args.run_dir / "config.json").exists():
+        print(f"❌ ERROR: No config.json in {args.run_dir}")
+        sys.exit(1)
+    try:
+        run_service(args.run_dir, args.device, args.threads, args.once, args.poll, args.watch_parent)
+    except ValueError as e:
+        print(f"❌ ERROR: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
 """
 Convert metadata.csv to proper Coqui format with headers
+
+Superseded by build_phase4_dataset.py (incremental, non-interactive).
 """
 
 import csv
@@ -22,19 +22,22 @@ from pathlib import Path
 from datetime import datetime
 from TTS.tts.configs.xtts_config import XttsConfig
 from TTS.tts.models.xtts import Xtts
-import TTS.tts.models.xtts as xtts_module
 
-# Workaround for torchaudio/torchcodec - use soundfile instead
-def load_audio_sf(audiopath, sr=None):
-    """Load audio using soundfile (bypassing broken torchaudio/torchcodec)"""
-    audio_np, lsr = sf.read(audiopath)
-    audio = torch.FloatTensor(audio_np)
-    if audio.dim() == 1:
-        audio = audio.unsqueeze(0)
-    return audio
+import audio_io
+from artifact_store import resolve_model_file
+from chunked_decoder import use_chunked_decoder
+from compiled_inference import compile_inference, print_warmup, warmup
+from conditioning import compute_conditioning_latents
+from delta_checkpoint import load_xtts_with_delta
+from gpt_lora import find_gpt2, load_adapter, set_adapter_enabled
+from latent_store import LatentStore
+from onnx_decoder import use_onnx_decoder
+from question_bank import BANK_PATH, QuestionBank
+from sentence_synthesis import SentenceSynthesizer, print_report
+from text_frontend import TextFrontend
 
-# Monkey-patch XTTS audio loading
-xtts_module.load_audio = load_audio_sf
+# Workaround for torchaudio/torchcodec - load audio with soundfile (resampled + downmixed, see audio_io.py)
+audio_io.install()
 
 # ========================================
 # CONFIGURATION
@@ -50,6 +53,45 @@ PROJECT_ROOT = Path("i:/CODE/tts-2")
 MODEL_DIR = PROJECT_ROOT / "run" / "training_phase4_continuation" / "XTTS_Phase4_Continuation-October-09-2025_07+54PM-f634425"
 MODEL_PATH = MODEL_DIR / "best_model_2735.pth"  # Phase 4 - Training Mel CE: 2.943 (peak), Eval Mel CE: 3.006
 
+# LoRA adapters (optional, see gpt_lora.py) - applied on top of MODEL_PATH
+ADAPTER_PATH = None  # Default adapter for every topic, e.g. MODEL_DIR / "adapter_final.pt"
+TOPIC_ADAPTERS = {}  # Per-topic overrides, e.g. {"sport": MODEL_DIR / "adapter_sport.pt"} - swapped in as needed
+
+# Parallel sentence synthesis for texts without '?' (see sentence_synthesis.py)
+# 1 = old behaviour (enable_text_splitting, sentences one after another)
+SENTENCE_WORKERS = 3
+SENTENCE_BACKEND = "thread"  # "thread" (shared model, GPU) or "process" (one model copy per worker, CPU)
+SENTENCE_PAUSE_MS = 250  # silence between sentences (0 = crossfade them together)
+SENTENCE_CROSSFADE_MS = 20
+
+# Question bank (see question_bank.py) - used instead of QUESTION_TEMPLATES when the file exists
+# Create it with: python scripts/question_bank.py seed
+QUESTION_BANK = BANK_PATH
+SKIP_RENDERED = True  # only sample questions that have not been voiced yet
+
+# Text normalization before inference (see text_frontend.py): foreign names through
+# lexicon/hu_foreign_names.tsv, numbers/dates/ordinals spelled out in Hungarian
+NORMALIZE_TEXT = True
+
+# torch.compile for the GPT step and HiFi-GAN decoder (see compiled_inference.py) - slower startup
+# (warmup, cached in run/compile_cache after the first run), faster inference on long batches
+COMPILE_INFERENCE = False
+
+# HiFi-GAN decoder on ONNX Runtime (see onnx_decoder.py) - takes over the decoder from COMPILE_INFERENCE
+# Export once with: python scripts/onnx_decoder.py export --model-dir <MODEL_DIR> --checkpoint <MODEL_PATH> --reference <wav>
+ONNX_DECODER = None  # e.g. MODEL_DIR / "hifigan_decoder.onnx"
+ONNX_THREADS = 4
+
+# Decode long utterances in overlapping windows (see chunked_decoder.py) - peak decoder memory stays
+# constant however long the text is; short texts decode in one shot as before. PyTorch decoder only:
+# ignored when ONNX_DECODER or COMPILE_INFERENCE take over the decoder.
+CHUNKED_DECODER = True
+
+# Speaker latents from the per-reference latent store (see latent_store.py) - changing REFERENCES only
+# computes the added files. The GPT latent then averages chunks from every reference instead of the
+# first 30 s of the concatenated references (identical for a single reference).
+LATENT_STORE = False
+
 OUTPUT_DIR = PROJECT_ROOT / "test_samples"
 OUTPUT_DIR.mkdir(exist_ok=True)
 
@@ -162,6 +204,59 @@ QUESTION_TEMPLATES = {
 }
 
 
+# ========================================
+# QUESTION SOURCE
+# ========================================
+
+_bank = None
+
+
+def open_bank():
+    """The question bank, or None when QUESTION_TEMPLATES is used"""
+    global _bank
+    if _bank is None and QUESTION_BANK is not None and Path(QUESTION_BANK).exists():
+        _bank = QuestionBank(QUESTION_BANK)
+    return _bank
+
+
+def topic_names():
+    bank = open_bank()
+    return [topic for topic, _ in bank.topics()] if bank else list(QUESTION_TEMPLATES.keys())
+
+
+def available_questions(topic=None):
+    """Questions that can be drawn from topic (None = all topics)"""
+    bank = open_bank()
+    if bank:
+        return bank.count(topic, unrendered=SKIP_RENDERED)
+    if topic is None:
+        return sum(len(q) for q in QUESTION_TEMPLATES.values())
+    return len(QUESTION_TEMPLATES[topic])
+
+
+def pick_questions(selected_topic, num_questions):
+    """[(topic, text, bank id or None)] - sampled from the bank without loading it"""
+    bank = open_bank()
+    if bank:
+        topic = None if selected_topic == "vegyes" else selected_topic
+        rows = bank.sample(num_questions, topic=topic, unrendered=SKIP_RENDERED)
+        return [(row["topic"], row["text"], row["id"]) for row in rows]
+
+    if selected_topic == "vegyes":
+        # Mixed mode: randomly select from all topics
+        import random
+        all_questions_pool = []
+        for topic, questions in QUESTION_TEMPLATES.items():
+            for q in questions:
+                all_questions_pool.append((topic, q, None))
+
+        # Shuffle and take requested number
+        random.shuffle(all_questions_pool)
+        return all_questions_pool[:num_questions]
+    all_questions = QUESTION_TEMPLATES[selected_topic]
+    return [(selected_topic, q, None) for q in all_questions[:num_questions]]
+
+
 # ========================================
 # USER INPUT FUNCTIONS
 # ========================================
@@ -177,25 +272,26 @@ def get_user_inputs():
     
     # Show available topics
     print("📚 Elérhető témák:")
-    topics = list(QUESTION_TEMPLATES.keys())
+    topics = topic_names()
+    mixed = len(topics) + 1  # "Vegyes" always comes after the last topic
     for i, topic in enumerate(topics, 1):
         print(f"  {i}. {topic.capitalize()}")
-    print(f"  10. Vegyes (random minden témából)")
+    print(f"  {mixed}. Vegyes (random minden témából)")
     print()
     
     # Get topic
     while True:
         try:
-            topic_choice = input("Válassz témát (1-10): ").strip()
+            topic_choice = input(f"Válassz témát (1-{mixed}): ").strip()
             topic_idx = int(topic_choice)
-            if topic_idx == 10:
+            if topic_idx == mixed:
                 selected_topic = "vegyes"
                 break
             elif 1 <= topic_idx <= len(topics):
                 selected_topic = topics[topic_idx - 1]
                 break
             else:
-                print("❌ Érvénytelen választás! Válassz 1 és 10 között.")
+                print(f"❌ Érvénytelen választás! Válassz 1 és {mixed} között.")
         except (ValueError, KeyboardInterrupt):
             print("\n❌ Megszakítva.")
             return None, None
@@ -206,7 +302,7 @@ def get_user_inputs():
     # Get number of questions
     if selected_topic == "vegyes":
         # For mixed, allow any number
-        available = sum(len(q) for q in QUESTION_TEMPLATES.values())
+        available = available_questions()
         while True:
             try:
                 num_str = input(f"Hány kérdést generáljak? (1-{available}, ajánlott: 20+): ").strip()
@@ -219,7 +315,7 @@ def get_user_inputs():
                 print("\n❌ Megszakítva.")
                 return None, None
     else:
-        available = len(QUESTION_TEMPLATES[selected_topic])
+        available = available_questions(selected_topic)
         while True:
             try:
                 num_str = input(f"Hány kérdést generáljak? (1-{available}): ").strip()
@@ -241,28 +337,43 @@ def get_user_inputs():
 # MAIN GENERATION
 # ========================================
 
+def use_adapter(model, adapter_path, current_path):
+    """Swap the active LoRA adapter if it differs from the current one. Returns the new current path."""
+    if adapter_path == current_path:
+        return current_path
+    gpt2 = find_gpt2(model)
+    if adapter_path is None:
+        set_adapter_enabled(gpt2, False)
+        print("   🧩 Adapter disabled (base model)")
+    else:
+        load_adapter(gpt2, adapter_path)
+        print(f"   🧩 Adapter: {Path(adapter_path).name}")
+    return adapter_path
+
+
 def main():
     # Check for command-line arguments
     if len(sys.argv) == 3:
         # Command-line mode: topic_num questions_num
+        topics = topic_names()
+        mixed = len(topics) + 1
         try:
-            topics = list(QUESTION_TEMPLATES.keys())
             choice = int(sys.argv[1])
             num_questions = int(sys.argv[2])
             
             # Handle "vegyes" (mixed) option
-            if choice == 10:
+            if choice == mixed:
                 selected_topic = "vegyes"
-                total_available = sum(len(q) for q in QUESTION_TEMPLATES.values())
+                total_available = available_questions()
                 if num_questions < 1 or num_questions > total_available:
                     print(f"❌ Érvénytelen kérdésszám! Válassz 1-{total_available} között.")
                     return
             elif choice < 1 or choice > len(topics):
-                print(f"❌ Érvénytelen téma! Válassz 1-10 között (10=vegyes).")
+                print(f"❌ Érvénytelen téma! Válassz 1-{mixed} között ({mixed}=vegyes).")
                 return
             else:
                 selected_topic = topics[choice - 1]
-                available = len(QUESTION_TEMPLATES[selected_topic])
+                available = available_questions(selected_topic)
                 if num_questions < 1 or num_questions > available:
                     print(f"❌ Érvénytelen kérdésszám! Válassz 1-{available} között.")
                     return
@@ -271,8 +382,8 @@ def main():
             print()
             
         except ValueError:
-            print("❌ Használat: python generate_questions_and_answers.py <téma 1-10> <kérdések>")
-            print("   Téma 10 = vegyes (random minden témából)")
+            print(f"❌ Használat: python generate_questions_and_answers.py <téma 1-{mixed}> <kérdések>")
+            print(f"   Téma {mixed} = vegyes (random minden témából)")
             return
     else:
         # Interactive mode
@@ -282,20 +393,8 @@ def main():
             return
     
     # Get questions for the selected topic
-    if selected_topic == "vegyes":
-        # Mixed mode: randomly select from all topics
-        import random
-        all_questions_pool = []
-        for topic, questions in QUESTION_TEMPLATES.items():
-            for q in questions:
-                all_questions_pool.append((topic, q))
-        
-        # Shuffle and take requested number
-        random.shuffle(all_questions_pool)
-        questions_to_generate = all_questions_pool[:num_questions]
-    else:
-        all_questions = QUESTION_TEMPLATES[selected_topic]
-        questions_to_generate = [(selected_topic, q) for q in all_questions[:num_questions]]
+    questions_to_generate = pick_questions(selected_topic, num_questions)
+    print(f"Kérdések forrása: {'kérdésbank (' + Path(QUESTION_BANK).name + ')' if open_bank() else 'QUESTION_TEMPLATES'}")
     
     print("=" * 80)
     print(f"🎯 GENERÁLÁS: {num_questions} KÉRDÉS - {selected_topic.upper()}")
@@ -328,11 +427,13 @@ def main():
     config.load_json(str(config_path))
     
     model = Xtts.init_from_config(config)
-    model.load_checkpoint(
+    # Accepts full and delta checkpoints (delta = base checkpoint + trained GPT weights)
+    load_xtts_with_delta(
+        model,
         config,
         checkpoint_dir=str(MODEL_DIR),
-        checkpoint_path=str(MODEL_PATH),
-        vocab_path=str(MODEL_DIR / "vocab.json"),
+        checkpoint_path=MODEL_PATH,
+        vocab_path=str(resolve_model_file("vocab.json", MODEL_DIR)),
         eval=True,
         use_deepspeed=False
     )
@@ -341,19 +442,49 @@ def main():
     device = "cuda" if torch.cuda.is_available() else "cpu"
     model = model.to(device)
     print(f"✅ Model loaded on {device.upper()}")
+    active_adapter = use_adapter(model, ADAPTER_PATH, None)
+    sentence_synth = None
+    if SENTENCE_WORKERS > 1:
+        # The process backend's workers load their own copies and follow the topic adapter per job
+        sentence_synth = SentenceSynthesizer(
+            model, workers=SENTENCE_WORKERS, backend=SENTENCE_BACKEND,
+            pause_ms=SENTENCE_PAUSE_MS, crossfade_ms=SENTENCE_CROSSFADE_MS,
+            model_dir=MODEL_DIR, checkpoint_path=MODEL_PATH, adapter_path=ADAPTER_PATH,
+        )
+        print(f"✅ Sentence synthesis: {SENTENCE_WORKERS} {SENTENCE_BACKEND} workers")
     print()
     
     # Compute speaker latents
     print("🎙️ Computing speaker latents from references...")
-    gpt_cond_latent, speaker_embedding = model.get_conditioning_latents(
-        audio_path=[str(ref) for ref in REFERENCES],
-        gpt_cond_len=30,
-        gpt_cond_chunk_len=4,
-        max_ref_length=60
-    )
-    print("✅ Speaker latents computed")
+    if LATENT_STORE:
+        # Per-reference contributions cached per checkpoint - only new or changed references are computed
+        store = LatentStore(MODEL_PATH, model)
+        computed = store.add(REFERENCES)
+        gpt_cond_latent, speaker_embedding = store.latents(REFERENCES)
+        print(f"✅ Speaker latents from the latent store ({len(computed)} of {len(REFERENCES)} references computed)")
+    else:
+        # Batched: references loaded in parallel, chunks and speaker encoder in a few passes (see conditioning.py)
+        gpt_cond_latent, speaker_embedding = compute_conditioning_latents(
+            model,
+            [str(ref) for ref in REFERENCES],
+            gpt_cond_len=30,
+            gpt_cond_chunk_len=4,
+            max_ref_length=60
+        )
+        print("✅ Speaker latents computed")
+    if COMPILE_INFERENCE:
+        print("⚡ Compiling inference (GPT step + HiFi-GAN decoder)...")
+        compile_inference(model)
+        print_warmup(warmup(model, gpt_cond_latent, speaker_embedding))
+    if ONNX_DECODER is not None:
+        use_onnx_decoder(model, ONNX_DECODER, threads=ONNX_THREADS)
+        print(f"✅ HiFi-GAN decoder on ONNX Runtime ({ONNX_THREADS} threads)")
+    elif CHUNKED_DECODER and not COMPILE_INFERENCE:
+        use_chunked_decoder(model)
     print()
     
+    frontend = TextFrontend.load() if NORMALIZE_TEXT else None
+
     # Generate samples
     print("=" * 80)
     print("GENERATING SAMPLES")
@@ -361,15 +492,17 @@ def main():
     print()
     
     for i, question_data in enumerate(questions_to_generate, 1):
-        # Unpack topic and text
-        if isinstance(question_data, tuple):
-            topic, text = question_data
-        else:
-            topic = selected_topic
-            text = question_data
+        # Unpack topic, text and question bank id
+        topic, text, question_id = question_data
+        if frontend is not None:
+            text = frontend.normalize(text)
         
-        # Create filename
-        filename = f"q{i:03d}_{topic}"
+        active_adapter = use_adapter(model, TOPIC_ADAPTERS.get(topic, ADAPTER_PATH), active_adapter)
+        if sentence_synth is not None:
+            sentence_synth.adapter_path = active_adapter and str(active_adapter)
+
+        # Create filename - bank questions carry their id, so later runs never overwrite a rendered file
+        filename = f"q{i:03d}_{topic}" if question_id is None else f"q{question_id:05d}_{topic}"
         
         print(f"[{i}/{num_questions}] {filename}")
         print(f"Text: {text[:80]}...")
@@ -425,6 +558,20 @@ def main():
             
             # Concatenate all segments
             audio_numpy = np.concatenate(audio_segments)
+        elif sentence_synth is not None:
+            # Fallback: sentences synthesized in parallel, stitched back in order
+            audio_numpy = sentence_synth.synthesize(
+                text,
+                "hu",
+                gpt_cond_latent,
+                speaker_embedding,
+                temperature=PARAMS["temperature"],
+                top_p=PARAMS["top_p"],
+                top_k=PARAMS["top_k"],
+                repetition_penalty=PARAMS["repetition_penalty"],
+                length_penalty=PARAMS["length_penalty"],
+            )
+            print_report(sentence_synth.last_report)
         else:
             # Fallback: generate as single text
             out = model.inference(
@@ -448,8 +595,13 @@ def main():
         sf.write(str(output_path), audio_numpy, 24000)
         
         print(f"✅ Saved: {output_path.name}")
+        if question_id is not None:
+            open_bank().mark_rendered(question_id, output_path)
         print()
     
+    if sentence_synth is not None:
+        sentence_synth.close()
+
     print("=" * 80)
     print(f"✅ MIND A(Z) {num_questions} MINTA ELKÉSZÜLT!")
     print("=" * 80)
@@ -0,0 +1,363 @@
+"""
+LoRA Adapters for the XTTS GPT
+==============================
+Low-rank adapter fine-tuning mode for GPTTrainer.
+
+The GPT-2 blocks (attn.c_attn, attn.c_proj, mlp.c_fc, mlp.c_proj) get a
+small trainable update  W x + (B A x) * alpha / rank  while every base weight
+stays frozen. alpha is a buffer of each adapter, so training checkpoints carry
+it next to the A/B matrices (rank and targets follow from their keys/shapes).
+Only the A/B matrices (and their optimizer state) are trained, so an adapter
+file is a few MB instead of a multi-GB checkpoint.
+
+Adapters are attached as `<layer>.lora` submodules with a forward hook, so the
+base state-dict keys are unchanged and full checkpoints still load as before.
+Adapter keys are stored relative to the GPT-2 model (h.N....lora.A), which makes
+the same file usable from GPTTrainer (training) and Xtts (inference).
+
+Usage:
+  # Training (after the Trainer restored the base checkpoint)
+  enable_lora_training(trainer, rank=8, alpha=16, lr=1e-4)
+
+  # Inference / swapping
+  load_adapter(find_gpt2(model), "adapter_question.pt")
+  set_adapter_enabled(find_gpt2(model), False)   # back to the base voice
+
+  # Tools
+  python scripts/gpt_lora.py export best_model_3000.pth adapter.pt
+  python scripts/gpt_lora.py benchmark --layers 30 --steps 5
+"""
+
+import argparse
+import json
+import math
+import re
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+ADAPTER_FORMAT = "xtts-gpt-lora-v1"
+LORA_TARGETS = ("attn.c_attn", "attn.c_proj", "mlp.c_fc", "mlp.c_proj")
+DEFAULT_RANK = 8
+DEFAULT_ALPHA = 16
+# Matches adapter tensors of the training GPT (xtts.gpt.gpt.*) and the inference GPT (gpt.gpt.*),
+# but not the gpt_inference aliases of the same tensors
+ADAPTER_KEY_PATTERN = re.compile(r"(?:^|\.)gpt\.gpt\.(h\.\d+\..+\.lora\.(?:A|B|alpha))$")
+
+# XTTS-v2 GPT dimensions (GPTArgs defaults)
+XTTS_GPT_LAYERS = 30
+XTTS_GPT_DIM = 1024
+XTTS_GPT_HEADS = 16
+XTTS_GPT_POSITIONS = 605 + 402 + 70
+
+
+class LoRA(nn.Module):
+    """Low-rank update B(A(x)) * alpha / rank; B starts at zero so the base model is unchanged"""
+
+    def __init__(self, in_features, out_features, rank=DEFAULT_RANK, alpha=DEFAULT_ALPHA, dropout=0.0):
+        super().__init__()
+        self.rank = rank
+        self.register_buffer("alpha", torch.tensor(float(alpha)))
+        self.enabled = True
+        self.A = nn.Parameter(torch.empty(rank, in_features))
+        self.B = nn.Parameter(torch.zeros(out_features, rank))
+        nn.init.kaiming_uniform_(self.A, a=math.sqrt(5))
+        self.dropout = nn.Dropout(dropout) if dropout > 0 else nn.Identity()
+
+    @property
+    def scaling(self):
+        return self.alpha / self.rank
+
+    def forward(self, x):
+        return F.linear(F.linear(self.dropout(x), self.A), self.B) * self.scaling
+
+
+def _lora_hook(module, inputs, output):
+    if not module.lora.enabled:
+        return output
+    return output + module.lora(inputs[0]).to(output.dtype)
+
+
+def _layer_shape(module):
+    """(in_features, out_features) for transformers Conv1D (weight: in x out) and nn.Linear (out x in)"""
+    if isinstance(module, nn.Linear):
+        return module.in_features, module.out_features
+    in_features, out_features = module.weight.shape
+    return in_features, out_features
+
+
+def find_gpt2(model):
+    """The GPT-2 transformer inside GPTTrainer (model.xtts.gpt.gpt) or Xtts (model.gpt.gpt)"""
+    model = model.module if hasattr(model, "module") else model
+    xtts = model.xtts if hasattr(model, "xtts") else model
+    return xtts.gpt.gpt
+
+
+def lora_layers(gpt2):
+    """(name, module) of every layer that carries an adapter"""
+    return [(name, module) for name, module in gpt2.named_modules() if isinstance(getattr(module, "lora", None), LoRA)]
+
+
+def apply_lora(gpt2, rank=DEFAULT_RANK, alpha=DEFAULT_ALPHA, dropout=0.0, targets=LORA_TARGETS):
+    """Attach fresh adapters to every target layer (existing adapters are replaced)"""
+    remove_lora(gpt2)
+    count = 0
+    for name, module in list(gpt2.named_modules()):
+        if not any(name.endswith("." + target) for target in targets):
+            continue
+        in_features, out_features = _layer_shape(module)
+        weight = module.weight
+        module.lora = LoRA(in_features, out_features, rank, alpha, dropout).to(device=weight.device)
+        module._lora_handle = module.register_forward_hook(_lora_hook)
+        count += 1
+    if count == 0:
+        raise ValueError(f"No LoRA target layers found ({', '.join(targets)})")
+    gpt2.lora_config = {"rank": rank, "alpha": alpha, "dropout": dropout, "targets": list(targets)}
+    return count
+
+
+def remove_lora(gpt2):
+    for _, module in lora_layers(gpt2):
+        module._lora_handle.remove()
+        del module._lora_handle
+        del module.lora
+    if hasattr(gpt2, "lora_config"):
+        del gpt2.lora_config
+
+
+def set_adapter_enabled(gpt2, enabled):
+    for _, module in lora_layers(gpt2):
+        module.lora.enabled = enabled
+
+
+def lora_parameters(gpt2):
+    return [p for _, module in lora_layers(gpt2) for p in module.lora.parameters()]
+
+
+def freeze_base(model, gpt2):
+    """Freeze everything in `model` except the adapters"""
+    for p in model.parameters():
+        p.requires_grad = False
+    for p in lora_parameters(gpt2):
+        p.requires_grad = True
+
+
+def adapter_state_dict(gpt2):
+    return {k: v.detach().cpu() for k, v in gpt2.state_dict().items() if ".lora." in k}
+
+
+def save_adapter(gpt2, path, **metadata):
+    """Write an adapter-only file (A/B matrices + LoRA config)"""
+    payload = {
+        "format": ADAPTER_FORMAT,
+        "config": dict(gpt2.lora_config),
+        "state": adapter_state_dict(gpt2),
+        "metadata": metadata,
+    }
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    torch.save(payload, tmp_path)
+    tmp_path.replace(path)
+    return path
+
+
+def adapter_from_checkpoint(checkpoint_state):
+    """
+    Pull the adapter out of a trainer checkpoint (full or delta) -> (state, config).
+    config["alpha"] is None for checkpoints written before alpha was stored.
+    """
+    model_state = checkpoint_state["model"] if "model" in checkpoint_state else checkpoint_state
+    state = {}
+    for key, value in model_state.items():
+        match = ADAPTER_KEY_PATTERN.search(key)
+        if match:
+            state[match.group(1)] = value
+    if not state:
+        raise ValueError("Checkpoint contains no LoRA adapter tensors")
+    rank = next(v for k, v in state.items() if k.endswith(".lora.A")).shape[0]
+    targets = sorted({t for t in LORA_TARGETS for k in state if f".{t}.lora." in k})
+    alphas = {float(v) for k, v in state.items() if k.endswith(".lora.alpha")}
+    if len(alphas) > 1:
+        raise ValueError(f"Checkpoint mixes LoRA alphas: {sorted(alphas)}")
+    alpha = alphas.pop() if alphas else None
+    return state, {"rank": rank, "alpha": alpha, "dropout": 0.0, "targets": targets}
+
+
+def load_adapter(gpt2, path):
+    """Load (or swap in) an adapter; layers are (re)built if the rank/targets differ"""
+    payload = torch.load(path, map_location="cpu", weights_only=False)
+    if payload.get("format") != ADAPTER_FORMAT:
+        raise ValueError(f"{Path(path).name} is not a LoRA adapter file")
+    config = payload["config"]
+    current = getattr(gpt2, "lora_config", None)
+    if current is None or {k: current[k] for k in ("rank", "targets")} != {k: config[k] for k in ("rank", "targets")}:
+        apply_lora(gpt2, config["rank"], config["alpha"], config.get("dropout", 0.0), tuple(config["targets"]))
+
+    # The file's config is authoritative for alpha (older files store it only there)
+    state = dict(payload["state"])
+    for name, _ in lora_layers(gpt2):
+        state[f"{name}.lora.alpha"] = torch.tensor(float(config["alpha"]))
+    missing, unexpected = gpt2.load_state_dict(state, strict=False)
+    missing = [k for k in missing if ".lora." in k]
+    if missing or unexpected:
+        raise ValueError(f"Adapter does not match the model (missing {len(missing)}, unexpected {len(unexpected)})")
+    set_adapter_enabled(gpt2, True)
+    gpt2.lora_config = dict(config)
+    return payload.get("metadata", {})
+
+
+def enable_lora_training(trainer, rank=DEFAULT_RANK, alpha=DEFAULT_ALPHA, lr=1e-4, dropout=0.0):
+    """
+    Switch an initialized (and restored) Trainer to adapter training:
+    adapters are attached, base weights frozen, and optimizer/scheduler rebuilt
+    over the adapter parameters only.
+    """
+    model = trainer.model.module if hasattr(trainer.model, "module") else trainer.model
+    gpt2 = find_gpt2(model)
+    layers = apply_lora(gpt2, rank, alpha, dropout)
+    freeze_base(model, gpt2)
+    params = lora_parameters(gpt2)
+
+    optimizer_params = dict(trainer.config.optimizer_params or {})
+    trainer.config.lr = lr
+    trainer.optimizer = torch.optim.AdamW(params, lr=lr, **optimizer_params)
+    trainer.scheduler = trainer.get_scheduler(model, trainer.config, trainer.optimizer)
+    trainer.scheduler = trainer.restore_scheduler(
+        trainer.scheduler, trainer.args, trainer.config, trainer.restore_epoch, trainer.restore_step
+    )
+    trainable = sum(p.numel() for p in params)
+    total = sum(p.numel() for p in model.parameters())
+    return {"layers": layers, "trainable": trainable, "total": total}
+
+
+# ----------------------------------------
+# CPU benchmark: full fine-tuning vs LoRA
+# ----------------------------------------
+
+def build_benchmark_gpt(layers, dim=XTTS_GPT_DIM, heads=XTTS_GPT_HEADS):
+    """GPT-2 with the XTTS-v2 dimensions (random weights - only speed and memory matter here)"""
+    from transformers import GPT2Config, GPT2Model
+    config = GPT2Config(vocab_size=256, n_positions=XTTS_GPT_POSITIONS, n_embd=dim, n_layer=layers, n_head=heads)
+    return GPT2Model(config)
+
+
+def run_benchmark_mode(mode, layers, steps, batch_size, seq_len, rank):
+    """Time `steps` optimizer steps in this process; returns a result dict"""
+    from training_metrics import peak_memory_mb
+
+    torch.manual_seed(0)
+    gpt2 = build_benchmark_gpt(layers)
+    gpt2.train()
+    if mode == "lora":
+        apply_lora(gpt2, rank=rank)
+        freeze_base(gpt2, gpt2)
+        params = lora_parameters(gpt2)
+    else:
+        params = list(gpt2.parameters())
+    optimizer = torch.optim.AdamW(params, lr=1e-4)
+    inputs = torch.randn(batch_size, seq_len, XTTS_GPT_DIM)
+
+    times = []
+    for step in range(steps + 1):  # step 0 is warmup
+        start = time.perf_counter()
+        hidden = gpt2(inputs_embeds=inputs).last_hidden_state
+        loss = hidden.float().pow(2).mean()
+        loss.backward()
+        optimizer.step()
+        optimizer.zero_grad(set_to_none=True)
+        if step:
+            times.append(time.perf_counter() - start)
+
+    return {
+        "mode": mode,
+        "step_seconds": sum(times) / len(times),
+        "peak_memory_mb": peak_memory_mb(),
+        "trainable_params": sum(p.numel() for p in params),
+    }
+
+
+def benchmark(layers, steps, batch_size, seq_len, rank):
+    """Each mode runs in its own process so peak memory is measured independently"""
+    results = []
+    for mode in ("full", "lora"):
+        print(f"⏳ Benchmarking {mode}...")
+        out = subprocess.run(
+            [sys.executable, __file__, "_bench_worker", mode, str(layers), str(steps),
+             str(batch_size), str(seq_len), str(rank)],
+            capture_output=True, text=True, check=True,
+        )
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LoRA adapter tools for the XTTS GPT")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="Extract an adapter from a training checkpoint")
+    export.add_argument("checkpoint", type=Path)
+    export.add_argument("output", type=Path)
+    export.add_argument("--alpha", type=float, default=None,
+                        help="Only for checkpoints that predate stored alpha (LORA_ALPHA of that run)")
+    bench = sub.add_parser("benchmark", help="CPU step time / peak memory: full fine-tuning vs LoRA")
+    bench.add_argument("--layers", type=int, default=XTTS_GPT_LAYERS)
+    bench.add_argument("--steps", type=int, default=5)
+    bench.add_argument("--batch-size", type=int, default=2)
+    bench.add_argument("--seq-len", type=int, default=256)
+    bench.add_argument("--rank", type=int, default=DEFAULT_RANK)
+    worker = sub.add_parser("_bench_worker")
+    for name in ("mode", "layers", "steps", "batch_size", "seq_len", "rank"):
+        worker.add_argument(name)
+    args = parser.parse_args()
+
+    if args.command == "_bench_worker":
+        result = run_benchmark_mode(args.mode, int(args.layers), int(args.steps),
+                                    int(args.batch_size), int(args.seq_len), int(args.rank))
+        print(json.dumps(result))
+        return
+
+    if args.command == "export":
+        from delta_checkpoint import load_state_file
+        try:
+            state, config = adapter_from_checkpoint(load_state_file(args.checkpoint, mmap=True))
+        except ValueError as e:
+            print(f"❌ Error: {e}")
+            sys.exit(1)
+        if config["alpha"] is None:
+            if args.alpha is None:
+                print("❌ Error: checkpoint does not store the LoRA alpha - pass --alpha (LORA_ALPHA of the run)")
+                sys.exit(1)
+            config["alpha"] = args.alpha
+        elif args.alpha is not None and args.alpha != config["alpha"]:
+            print(f"⚠️  Ignoring --alpha {args.alpha:g}: the checkpoint was trained with alpha {config['alpha']:g}")
+        payload = {
+            "format": ADAPTER_FORMAT,
+            "config": config,
+            "state": {k: v.clone() for k, v in state.items()},
+            "metadata": {"source": args.checkpoint.name},
+        }
+        torch.save(payload, args.output)
+        print(f"✅ Adapter written: {args.output} ({args.output.stat().st_size / 1024**2:.1f} MB, "
+              f"rank {config['rank']}, alpha {config['alpha']:g})")
+        return
+
+    print("=" * 80)
+    print(f"🏁 LoRA BENCHMARK (CPU, {args.layers} layers, batch {args.batch_size} x {args.seq_len} tokens)")
+    print("=" * 80)
+    results = benchmark(args.layers, args.steps, args.batch_size, args.seq_len, args.rank)
+    print()
+    print(f"{'Mode':<8}{'Trainable params':>20}{'Step time':>14}{'Peak memory':>16}")
+    for r in results:
+        print(f"{r['mode']:<8}{r['trainable_params']:>20,}{r['step_seconds']:>12.2f}s{r['peak_memory_mb']:>13.0f} MB")
+    full, lora = results
+    print()
+    print(f"⚡ LoRA step time: {lora['step_seconds'] / full['step_seconds']:.0%} of full fine-tuning")
+    print(f"💾 LoRA peak memory: {lora['peak_memory_mb'] / full['peak_memory_mb']:.0%} of full fine-tuning")
+
+
+if __name__ == "__main__":
+    main()
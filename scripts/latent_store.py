@@ -0,0 +1,291 @@
+"""
+Latent Store - Per-Reference Conditioning, Updated Incrementally
+================================================================
+Tuning the reference set (16 question files, a handful, the single
+question9.wav experiment) used to recompute latents for every file on every
+change. The store keeps each reference's contribution instead:
+- speaker embedding: the per-reference embedding (XTTS averages them, so the
+  combined value is exact)
+- GPT conditioning: the sum and count of the reference's own 4-second chunk
+  style embeddings; the combined gpt_cond_latent is the mean over the chunks
+  of every selected reference
+- adding a reference computes only that file, removing one computes nothing;
+  entries are keyed by path and invalidated when the file changes
+- one store file per checkpoint (run/latent_store/<fingerprint>.pt), since
+  the conditioning encoder is trained too
+- subset_latents() combines many candidate subsets with one matrix product,
+  score_subsets() ranks them against a target set
+
+Note: Xtts.get_conditioning_latents only uses the first 30 s of the
+concatenated references for the GPT latent (with 16 files, the first two or
+three). The store averages chunks from every selected reference. For one
+reference up to 30 s long the results are identical.
+
+Usage:
+  store = LatentStore(MODEL_PATH, model)
+  store.add(REFERENCES)                                 # only new / changed files are computed
+  gpt_cond_latent, speaker_embedding = store.latents(REFERENCES)
+
+  python scripts/latent_store.py add --model-dir <run> --checkpoint <pth> prepared_sources/vago_samples_selected/*.wav
+  python scripts/latent_store.py subsets --checkpoint <pth> --size 4 --limit 20000
+  python scripts/latent_store.py subsets --checkpoint <pth> --size 3 --render "Melyik ország fővárosa Budapest?" \\
+      --model-dir <run>
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import math
+import random
+import time
+from pathlib import Path
+
+import torch
+
+from conditioning import MIN_CHUNK_SECONDS, load_references, speaker_embeddings, split_chunks, style_embeddings
+from delta_checkpoint import quick_fingerprint
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+STORE_DIR = PROJECT_ROOT / "run" / "latent_store"
+RENDER_DIR = PROJECT_ROOT / "generated_output" / "latent_subsets"
+CHUNK_BATCH = 32  # conditioning chunks per encoder pass
+
+
+def reference_key(path):
+    return Path(path).resolve().as_posix()
+
+
+def reference_stamp(path):
+    stat = Path(path).stat()
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class LatentStore:
+    """Per-reference (chunk_sum, chunks, speaker) contributions for one checkpoint"""
+
+    def __init__(self, checkpoint_path, model=None, chunk_length=4, max_ref_length=60, store_dir=STORE_DIR):
+        """model is only needed by add() - combining and scoring stored references works without it"""
+        self.model = model
+        self.chunk_length = chunk_length
+        self.max_ref_length = max_ref_length
+        key = {"checkpoint": quick_fingerprint(checkpoint_path), "chunk_length": chunk_length,
+               "max_ref_length": max_ref_length}
+        digest = hashlib.sha256(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+        self.path = Path(store_dir) / f"{digest}.pt"
+        self.entries = torch.load(self.path, weights_only=True) if self.path.exists() else {}
+
+    def __contains__(self, path):
+        return reference_key(path) in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stale(self, paths):
+        """References that are missing from the store or changed on disk"""
+        return [p for p in paths
+                if self.entries.get(reference_key(p), {}).get("stamp") != reference_stamp(p)]
+
+    # ---------- updates ----------
+
+    @torch.inference_mode()
+    def add(self, paths):
+        """Compute and store the contributions of new or changed references; returns those paths"""
+        todo = self.stale(paths)
+        if not todo:
+            return []
+        if self.model is None:
+            raise RuntimeError("LatentStore needs the model to add references")
+        model = self.model
+        audios = load_references(todo, max_ref_length=self.max_ref_length)
+        splits = [split_chunks(audio.to(model.device), chunk_length=self.chunk_length) for audio in audios]
+
+        # A reference shorter than MIN_CHUNK_SECONDS has no chunk to average - it would turn any subset NaN
+        usable = [i for i, (chunks, tail) in enumerate(splits) if chunks is not None or tail is not None]
+        for i in sorted(set(range(len(todo))) - set(usable)):
+            print(f"⚠️  Skipping {Path(todo[i]).name}: shorter than {MIN_CHUNK_SECONDS}s, no conditioning chunk")
+        todo, audios, splits = [todo[i] for i in usable], [audios[i] for i in usable], [splits[i] for i in usable]
+        if not todo:
+            return []
+
+        # Full chunks of all new references go through the encoder together; tails differ in length
+        full, full_owners, tail_embs, tail_owners = [], [], [], []
+        for i, (chunks, tail) in enumerate(splits):
+            if chunks is not None:
+                full.append(chunks)
+                full_owners += [i] * chunks.shape[0]
+            if tail is not None:
+                tail_embs.append(style_embeddings(model, tail))
+                tail_owners.append(i)
+        full = torch.cat(full) if full else torch.empty(0)
+        embs = torch.cat([style_embeddings(model, full[start:start + CHUNK_BATCH])
+                          for start in range(0, full.shape[0], CHUNK_BATCH)] + tail_embs)
+        owners = torch.tensor(full_owners + tail_owners, device=model.device)
+        sums = embs.new_zeros(len(todo), *embs.shape[1:]).index_add_(0, owners, embs)
+        counts = torch.bincount(owners.cpu(), minlength=len(todo))
+
+        speakers = speaker_embeddings(model, audios)
+        for i, path in enumerate(todo):
+            self.entries[reference_key(path)] = {
+                "stamp": reference_stamp(path), "chunk_sum": sums[i].cpu(), "chunks": int(counts[i]),
+                "speaker": speakers[i].cpu(),
+            }
+        self.save()
+        return todo
+
+    def remove(self, paths):
+        removed = [p for p in paths if self.entries.pop(reference_key(p), None) is not None]
+        if removed:
+            self.save()
+        return removed
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        torch.save(self.entries, tmp)
+        tmp.replace(self.path)
+
+    # ---------- combining ----------
+
+    def _stack(self, keys):
+        missing = [k for k in keys if k not in self.entries]
+        if missing:
+            raise KeyError(f"not in the latent store (add() them first): {', '.join(missing)}")
+        entries = [self.entries[k] for k in keys]
+        return (torch.stack([e["chunk_sum"] for e in entries]),
+                torch.tensor([e["chunks"] for e in entries], dtype=torch.float32),
+                torch.stack([e["speaker"] for e in entries]))
+
+    def latents(self, paths=None):
+        """(gpt_cond_latent [1, 32, 1024], speaker_embedding [1, 512, 1]) for paths (default: all stored)"""
+        keys = [reference_key(p) for p in paths] if paths is not None else list(self.entries)
+        return self.subset_latents([range(len(keys))], keys)
+
+    def subset_latents(self, subsets, keys=None):
+        """subsets: index lists into keys (default: stored order) -> ([K, 32, 1024], [K, 512, 1])"""
+        keys = keys if keys is not None else list(self.entries)
+        sums, counts, speakers = self._stack(keys)
+        mask = torch.zeros(len(subsets), len(keys))
+        for row, subset in enumerate(subsets):
+            mask[row, list(subset)] = 1.0
+        chunk_counts = mask @ counts
+        empty = [row for row, n in enumerate(chunk_counts.tolist()) if n == 0]
+        if empty:
+            names = ", ".join(Path(keys[i]).name for i in subsets[empty[0]])
+            raise ValueError(f"subset {empty[0]} ({names or 'no references'}) has no conditioning chunks")
+        gpt = (mask @ sums.flatten(1)) / chunk_counts[:, None]
+        speaker = (mask @ speakers) / mask.sum(dim=1, keepdim=True)
+        gpt = gpt.view(len(subsets), *sums.shape[1:]).transpose(1, 2)
+        device = self.model.device if self.model is not None else "cpu"
+        return gpt.to(device), speaker.unsqueeze(-1).to(device)
+
+    def score_subsets(self, subsets, keys=None, target=None):
+        """Cosine similarity of each subset's latents to target (default: all of keys) - [(score, gpt, speaker)]"""
+        keys = keys if keys is not None else list(self.entries)
+        gpt, speaker = self.subset_latents(subsets, keys)
+        target_gpt, target_speaker = target if target is not None else self.subset_latents([range(len(keys))], keys)
+        gpt_cos = torch.nn.functional.cosine_similarity(gpt.flatten(1), target_gpt.flatten(1), dim=1)
+        speaker_cos = torch.nn.functional.cosine_similarity(speaker.flatten(1), target_speaker.flatten(1), dim=1)
+        return [((g + s) / 2, g, s) for g, s in zip(gpt_cos.tolist(), speaker_cos.tolist())]
+
+
+def candidate_subsets(n, size, limit=None, seed=0):
+    """All size-combinations of n references, or a seeded random sample of limit of them"""
+    combinations = itertools.combinations(range(n), size)
+    if limit is None:
+        return list(combinations)
+    if math.comb(n, size) <= limit:
+        return list(combinations)
+    rng = random.Random(seed)
+    seen = set()
+    while len(seen) < limit:
+        seen.add(tuple(sorted(rng.sample(range(n), size))))
+    return sorted(seen)
+
+
+def render_subsets(model, store, keys, ranked, text, language="hu"):
+    """Synthesize text with each ranked subset into RENDER_DIR for listening"""
+    import soundfile as sf
+    from sentence_synthesis import SAMPLE_RATE, synthesize_sentence
+
+    RENDER_DIR.mkdir(parents=True, exist_ok=True)
+    listing = []
+    for rank, (subset, score) in enumerate(ranked, 1):
+        gpt, speaker = store.subset_latents([subset], keys)
+        torch.manual_seed(0)
+        wav = synthesize_sentence(model, text, language, gpt, speaker, temperature=0.35)
+        path = RENDER_DIR / f"subset_{rank:02d}.wav"
+        sf.write(path, wav, SAMPLE_RATE)
+        listing.append({"file": path.name, "score": round(score, 5), "references": [Path(keys[i]).name for i in subset]})
+    with open(RENDER_DIR / "subsets.json", 'w', encoding='utf-8') as f:
+        json.dump(listing, f, indent=2, ensure_ascii=False)
+    return listing
+
+
+def main():
+    from sentence_synthesis import load_xtts
+
+    parser = argparse.ArgumentParser(description="Per-reference latent store")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (("add", "Compute latents for new or changed references"),
+                            ("remove", "Drop references from the store"),
+                            ("list", "Show stored references"),
+                            ("subsets", "Rank candidate reference subsets against a target set")):
+        cmd = sub.add_parser(name, help=help_text)
+        cmd.add_argument("--checkpoint", required=True)
+        cmd.add_argument("--model-dir", default=None, help="Needed by add and --render")
+        if name in ("add", "remove"):
+            cmd.add_argument("references", nargs="+")
+    subsets = sub.choices["subsets"]
+    subsets.add_argument("--size", type=int, default=4, help="References per candidate subset")
+    subsets.add_argument("--limit", type=int, default=20000, help="Random sample when there are more combinations")
+    subsets.add_argument("--pool", nargs="+", default=None, help="Candidate references (default: all stored)")
+    subsets.add_argument("--target", nargs="+", default=None, help="Target set (default: the whole pool)")
+    subsets.add_argument("--top", type=int, default=10)
+    subsets.add_argument("--render", default=None, help="Synthesize this text with the top subsets")
+    args = parser.parse_args()
+
+    model = None
+    if args.command == "add" or getattr(args, "render", None):
+        import audio_io
+        audio_io.install()
+        if args.model_dir is None:
+            parser.error("--model-dir is required to compute latents or render")
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        model = load_xtts(Path(args.model_dir), Path(args.checkpoint), device=device)
+    store = LatentStore(Path(args.checkpoint), model)
+
+    print("=" * 80)
+    print(f"🗃️  LATENT STORE - {args.command.upper()} ({len(store)} references stored, {store.path.name})")
+    print("=" * 80)
+    if args.command == "add":
+        start = time.perf_counter()
+        todo = store.stale(args.references)
+        computed = store.add(args.references)
+        print(f"✅ {len(computed)} computed, {len(todo) - len(computed)} skipped, "
+              f"{len(args.references) - len(todo)} already stored ({time.perf_counter() - start:.2f}s)")
+    elif args.command == "remove":
+        print(f"🗑️  Removed {len(store.remove(args.references))}")
+    elif args.command == "list":
+        for key, entry in store.entries.items():
+            print(f"   • {Path(key).name:<24} {entry['chunks']} chunks")
+    else:
+        keys = [reference_key(p) for p in args.pool] if args.pool else list(store.entries)
+        target = store.latents(args.target) if args.target else None
+        candidates = candidate_subsets(len(keys), args.size, args.limit)
+        start = time.perf_counter()
+        scores = store.score_subsets(candidates, keys, target)
+        elapsed = time.perf_counter() - start
+        ranked = sorted(zip(candidates, scores), key=lambda item: -item[1][0])[:args.top]
+        print(f"Scored {len(candidates)} subsets of {args.size} from {len(keys)} references in {elapsed * 1000:.1f} ms")
+        print(f"{'#':>3}{'score':>9}{'GPT cos':>9}{'spk cos':>9}  references")
+        for rank, (subset, (score, gpt_cos, speaker_cos)) in enumerate(ranked, 1):
+            names = ", ".join(Path(keys[i]).stem for i in subset)
+            print(f"{rank:>3}{score:>9.5f}{gpt_cos:>9.5f}{speaker_cos:>9.5f}  {names}")
+        if args.render:
+            listing = render_subsets(model, store, keys, [(s, sc[0]) for s, sc in ranked], args.render)
+            print(f"\n🔊 {len(listing)} renders in {RENDER_DIR}")
+
+
+if __name__ == "__main__":
+    main()
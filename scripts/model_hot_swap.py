@@ -0,0 +1,279 @@
+"""
+Model Hot-Swap - Change Checkpoints Without Restarting the Synthesis Process
+============================================================================
+A running process keeps serving on the current model while the next
+checkpoint loads in the background:
+- requests take the current model version with acquire(); a swap replaces
+  the version pointer under a lock (the pause is microseconds), requests that
+  already hold the old version finish on it
+- speaker latents for the new checkpoint are loaded from the latent cache
+  (run/latent_cache, keyed by checkpoint fingerprint + reference files) or
+  computed once and cached - switching back and forth costs no recompute
+- the old weights are freed as soon as the last request using them is done
+- each swap reports load / latent / pause / drain times and the memory
+  high-water mark (old and new model are both resident while loading)
+
+A process can also watch a small pointer file and swap when it changes:
+  {"model_dir": "run/.../XTTS_Phase4_...", "checkpoint": "best_model_2735.pth"}
+
+Usage:
+  models = HotSwapModel(MODEL_DIR, MODEL_PATH, profiles={"vago": REFERENCES})
+  with models.acquire() as version:
+      out = version.model.inference(text, "hu", *version.latents["vago"], **PARAMS)
+  models.swap(NEW_DIR, NEW_DIR / "best_model_2735.pth")      # returns a Future with the report
+  models.watch("run/active_model.json")                     # or swap on pointer file changes
+
+  python scripts/model_hot_swap.py demo --pointer run/active_model.json --reference <wav>
+"""
+
+import argparse
+import gc
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+import torch
+
+from batch_size_finder import measure_peak_memory, reset_peak_memory
+from conditioning import compute_conditioning_latents
+from delta_checkpoint import quick_fingerprint
+from sentence_synthesis import load_xtts, make_prefix_thread_local, synthesize_sentence
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+LATENT_CACHE_DIR = PROJECT_ROOT / "run" / "latent_cache"
+WATCH_INTERVAL = 5.0  # seconds between pointer file checks
+
+
+def current_memory_mb(device):
+    """Memory in use now (CUDA: allocated tensors, CPU: resident set)"""
+    if device.type == "cuda":
+        return torch.cuda.memory_allocated(device) / 1024**2
+    try:
+        with open("/proc/self/status", 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return float("nan")
+
+
+class ModelVersion:
+    """One loaded checkpoint with its speaker latents and in-flight request count"""
+
+    def __init__(self, generation, model, model_dir, checkpoint_path, latents):
+        self.generation = generation
+        self.model = model
+        self.model_dir = Path(model_dir)
+        self.checkpoint_path = Path(checkpoint_path)
+        self.latents = latents
+        self.users = 0
+        self.retired_at = None
+
+    @property
+    def name(self):
+        return self.checkpoint_path.name
+
+
+class HotSwapModel:
+    """Serves the current ModelVersion while the next one loads in the background"""
+
+    def __init__(self, model_dir, checkpoint_path, profiles=None, device=None, latent_cache_dir=LATENT_CACHE_DIR):
+        """profiles: {name: [reference WAVs]} - latents are prepared for every version"""
+        self.device = torch.device(device or ("cuda" if torch.cuda.is_available() else "cpu"))
+        self.profiles = {name: [Path(r) for r in refs] for name, refs in (profiles or {}).items()}
+        self.latent_cache_dir = Path(latent_cache_dir)
+        self.reports = []
+        self._lock = threading.Lock()
+        self._loader = ThreadPoolExecutor(1, thread_name_prefix="model-swap")  # one swap at a time
+        self._generation = 0
+        self._watching = None
+        self._current, _ = self._load(model_dir, checkpoint_path)
+
+    # ---------- serving ----------
+
+    @contextmanager
+    def acquire(self):
+        """The current version, kept alive until the block ends even if a swap happens meanwhile"""
+        with self._lock:
+            version = self._current
+            version.users += 1
+        try:
+            yield version
+        finally:
+            with self._lock:
+                version.users -= 1
+                free = version.retired_at is not None and version.users == 0
+            if free:
+                self._free(version)
+
+    @property
+    def current(self):
+        return self._current
+
+    # ---------- swapping ----------
+
+    def swap(self, model_dir, checkpoint_path):
+        """Load checkpoint_path in the background and switch to it; Future -> swap report"""
+        return self._loader.submit(self._swap, Path(model_dir), Path(checkpoint_path))
+
+    def _load(self, model_dir, checkpoint_path):
+        start = time.perf_counter()
+        model = make_prefix_thread_local(load_xtts(model_dir, checkpoint_path, device=self.device))
+        load_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        latents, cached = {}, 0
+        for name, references in self.profiles.items():
+            latents[name], hit = self._latents(model, checkpoint_path, references)
+            cached += hit
+        self._generation += 1
+        version = ModelVersion(self._generation, model, model_dir, checkpoint_path, latents)
+        return version, {"load_seconds": round(load_seconds, 2),
+                         "latent_seconds": round(time.perf_counter() - start, 2),
+                         "latents_cached": cached, "latents_computed": len(self.profiles) - cached}
+
+    def _latents(self, model, checkpoint_path, references):
+        """(gpt_cond_latent, speaker_embedding) from the cache, or computed and cached"""
+        key = {"checkpoint": quick_fingerprint(checkpoint_path),
+               "references": [(r.name, r.stat().st_size, int(r.stat().st_mtime)) for r in references]}
+        digest = hashlib.sha256(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()[:24]
+        path = self.latent_cache_dir / f"{digest}.pt"
+        if path.exists():
+            gpt_cond_latent, speaker_embedding = torch.load(path, map_location=self.device, weights_only=True)
+            return (gpt_cond_latent, speaker_embedding), True
+        gpt_cond_latent, speaker_embedding = compute_conditioning_latents(
+            model, [str(r) for r in references], gpt_cond_len=30, gpt_cond_chunk_len=4, max_ref_length=60)
+        self.latent_cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        torch.save((gpt_cond_latent.cpu(), speaker_embedding.cpu()), tmp)
+        tmp.replace(path)
+        return (gpt_cond_latent, speaker_embedding), False
+
+    def _swap(self, model_dir, checkpoint_path):
+        reset_peak_memory(self.device)
+        memory_before = current_memory_mb(self.device)
+        old_name = self._current.name
+        start = time.perf_counter()
+        print(f"🔄 Loading {checkpoint_path.name} in the background (serving {old_name})...")
+        version, report = self._load(model_dir, checkpoint_path)
+
+        pause_start = time.perf_counter()
+        with self._lock:
+            old, self._current = self._current, version
+            old.retired_at = time.perf_counter()
+            free = old.users == 0
+        pause_ms = (time.perf_counter() - pause_start) * 1000
+        if free:
+            self._free(old)
+
+        report.update({
+            "from": old_name,
+            "to": version.name,
+            "generation": version.generation,
+            "swap_seconds": round(time.perf_counter() - start, 2),
+            "pause_ms": round(pause_ms, 3),
+            "in_flight_on_old": 0 if free else old.users,
+            "memory_before_mb": round(memory_before, 1),
+            "peak_memory_mb": round(measure_peak_memory(self.device), 1),
+        })
+        self.reports.append(report)
+        print_report(report)
+        return report
+
+    def _free(self, version):
+        drain = time.perf_counter() - version.retired_at
+        version.model = None
+        version.latents = None
+        gc.collect()
+        if self.device.type == "cuda":
+            torch.cuda.empty_cache()
+        print(f"   🧹 Freed {version.name} ({drain:.2f}s after the swap), "
+              f"memory now {current_memory_mb(self.device):.0f} MB")
+
+    # ---------- pointer file ----------
+
+    def watch(self, pointer_path, interval=WATCH_INTERVAL):
+        """Swap whenever the pointer file names a different checkpoint (daemon thread)"""
+        pointer_path = Path(pointer_path)
+
+        def poll():
+            last_mtime = None
+            while self._watching is not None:
+                try:
+                    mtime = pointer_path.stat().st_mtime
+                    if mtime != last_mtime:
+                        last_mtime = mtime
+                        with open(pointer_path, 'r', encoding='utf-8') as f:
+                            pointer = json.load(f)
+                        model_dir = PROJECT_ROOT / pointer["model_dir"]
+                        checkpoint = model_dir / pointer["checkpoint"]
+                        if checkpoint.resolve() != self._current.checkpoint_path.resolve():
+                            self.swap(model_dir, checkpoint).result()
+                except FileNotFoundError:
+                    pass
+                except (ValueError, KeyError, OSError) as e:
+                    print(f"   ⚠️  Ignoring {pointer_path.name}: {e}")
+                time.sleep(interval)
+
+        self._watching = threading.Thread(target=poll, name="model-pointer", daemon=True)
+        self._watching.start()
+
+    def close(self):
+        self._watching = None
+        self._loader.shutdown()
+
+
+def hot_swap_backend(models, language="hu"):
+    """synthesize(text, profile, **params) for SynthesisJobs that always uses the current version"""
+    def synthesize(text, profile, **params):
+        with models.acquire() as version:
+            gpt_cond_latent, speaker_embedding = version.latents[profile]
+            return synthesize_sentence(version.model, text, language, gpt_cond_latent, speaker_embedding, **params)
+
+    return synthesize
+
+
+def print_report(report):
+    print(f"   ✅ Swapped {report['from']} -> {report['to']} in {report['swap_seconds']:.1f}s "
+          f"(load {report['load_seconds']:.1f}s, latents {report['latent_seconds']:.1f}s: "
+          f"{report['latents_cached']} cached / {report['latents_computed']} computed)")
+    print(f"      Serving pause {report['pause_ms']:.3f} ms, {report['in_flight_on_old']} requests still on the old "
+          f"model, memory {report['memory_before_mb']:.0f} MB before / {report['peak_memory_mb']:.0f} MB peak")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve while swapping checkpoints")
+    sub = parser.add_subparsers(dest="command", required=True)
+    demo = sub.add_parser("demo", help="Synthesize in a loop and swap when the pointer file changes")
+    demo.add_argument("--pointer", required=True, help="JSON file: {\"model_dir\": ..., \"checkpoint\": ...}")
+    demo.add_argument("--reference", required=True, nargs="+", help="Speaker reference WAV(s)")
+    demo.add_argument("--text", default="Melyik ország fővárosa Budapest?")
+    args = parser.parse_args()
+
+    import audio_io
+    audio_io.install()
+    with open(args.pointer, 'r', encoding='utf-8') as f:
+        pointer = json.load(f)
+    model_dir = PROJECT_ROOT / pointer["model_dir"]
+    models = HotSwapModel(model_dir, model_dir / pointer["checkpoint"], profiles={"default": args.reference})
+    models.watch(args.pointer)
+    synthesize = hot_swap_backend(models)
+
+    print("=" * 80)
+    print(f"🔄 HOT-SWAP DEMO - edit {args.pointer} to switch checkpoints, Ctrl+C to stop")
+    print("=" * 80)
+    try:
+        while True:
+            start = time.perf_counter()
+            synthesize(args.text, "default", temperature=0.35)
+            print(f"   🔊 {models.current.name}: {time.perf_counter() - start:.2f}s")
+    except KeyboardInterrupt:
+        models.close()
+
+
+if __name__ == "__main__":
+    main()
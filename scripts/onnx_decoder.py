@@ -0,0 +1,211 @@
+"""
+ONNX Decoder - Export the XTTS HiFi-GAN Decoder and Run It on ONNX Runtime
+==========================================================================
+The waveform decoder (GPT latents + speaker embedding -> 24 kHz audio) is a
+plain convolutional network - ONNX Runtime's CPU kernels run it faster than
+eager PyTorch after every GPT pass:
+- export: latents [B, T, 1024] + speaker_embedding [B, 512, 1] -> wav [B, 1, S],
+  batch and length dynamic; a sidecar JSON records the decoder weight digest
+- OrtDecoder: InferenceSession with a configurable intra-op thread count
+- use_onnx_decoder(model, path) routes model.hifigan_decoder through ORT
+  (refuses a file exported from different decoder weights)
+- parity check (max abs error, SNR) and decode-time comparison vs eager
+
+Requires: pip install onnx onnxruntime
+
+Usage:
+  python scripts/onnx_decoder.py export --model-dir <run> --checkpoint <pth> --reference <wav>
+  python scripts/onnx_decoder.py check --model-dir <run> --checkpoint <pth> --reference <wav> --threads 4
+
+  use_onnx_decoder(model, MODEL_DIR / "hifigan_decoder.onnx", threads=4)
+  out = model.inference(...)                # decoder now runs on ONNX Runtime
+  use_eager_decoder(model)
+"""
+
+import argparse
+import hashlib
+import json
+import statistics
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+
+from chunked_decoder import decoder_input
+
+ONNX_FILENAME = "hifigan_decoder.onnx"
+OPSET = 17
+PARITY_FRAMES = (37, 128, 301)  # GPT latent frames per parity/timing case (~1.7 s, 6 s, 14 s of audio)
+PARITY_TOLERANCE = 1e-3  # max abs sample error
+DEFAULT_THREADS = 4
+
+
+class DecoderGraph(torch.nn.Module):
+    """HifiDecoder.forward with explicit batch shapes (the original squeezes the batch away when B=1)"""
+
+    def __init__(self, decoder):
+        super().__init__()
+        self.decoder = decoder
+
+    def forward(self, latents, speaker_embedding):
+        return self.decoder.waveform_decoder(decoder_input(self.decoder, latents), g=speaker_embedding)
+
+
+def decoder_digest(model):
+    """sha256 over the waveform decoder weights - ties an .onnx file to the weights it was exported from"""
+    digest = hashlib.sha256()
+    for name, tensor in sorted(model.hifigan_decoder.waveform_decoder.state_dict().items()):
+        digest.update(name.encode("utf-8"))
+        digest.update(tensor.detach().cpu().contiguous().numpy().tobytes())
+    return digest.hexdigest()[:24]
+
+
+def export_decoder(model, output_path, frames=128, opset=OPSET):
+    """Write the decoder to ONNX (+ .json sidecar); returns the sidecar metadata"""
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    graph = DecoderGraph(model.hifigan_decoder).cpu().eval()
+    latents = torch.randn(1, frames, model.args.decoder_input_dim)
+    speaker_embedding = torch.randn(1, model.args.d_vector_dim, 1)
+    start = time.perf_counter()
+    with torch.no_grad():
+        torch.onnx.export(
+            graph, (latents, speaker_embedding), str(output_path),
+            input_names=["latents", "speaker_embedding"], output_names=["wav"],
+            dynamic_axes={"latents": {0: "batch", 1: "frames"}, "speaker_embedding": {0: "batch"},
+                          "wav": {0: "batch", 2: "samples"}},
+            opset_version=opset, dynamo=False,
+        )
+    graph.to(next(model.parameters()).device)
+    meta = {"decoder_digest": decoder_digest(model), "opset": opset, "torch": torch.__version__,
+            "export_seconds": round(time.perf_counter() - start, 2),
+            "size_mb": round(output_path.stat().st_size / 1024**2, 1)}
+    with open(output_path.with_suffix(".json"), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+class OrtDecoder:
+    """ONNX Runtime session for the exported decoder, called like HifiDecoder.forward"""
+
+    def __init__(self, path, threads=DEFAULT_THREADS, providers=None):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError("ONNX Runtime decoding needs onnxruntime: pip install onnxruntime") from e
+        self.path = Path(path)
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.threads = threads
+        self.session = ort.InferenceSession(str(self.path), options, providers=providers or ["CPUExecutionProvider"])
+        sidecar = self.path.with_suffix(".json")
+        self.meta = json.loads(sidecar.read_text(encoding='utf-8')) if sidecar.exists() else {}
+
+    def __call__(self, latents, g=None):
+        wav = self.session.run(["wav"], {
+            "latents": latents.detach().float().cpu().numpy(),
+            "speaker_embedding": g.detach().float().cpu().numpy(),
+        })[0]
+        return torch.from_numpy(wav).to(latents.device)
+
+
+def use_onnx_decoder(model, path, threads=DEFAULT_THREADS, providers=None):
+    """Route model.hifigan_decoder through ONNX Runtime (speaker encoder stays in PyTorch)"""
+    decoder = OrtDecoder(path, threads=threads, providers=providers)
+    expected = decoder.meta.get("decoder_digest")
+    if expected is not None and expected != decoder_digest(model):
+        raise ValueError(f"{decoder.path.name} was exported from different decoder weights - export it again")
+    model.hifigan_decoder.forward = decoder
+    return decoder
+
+
+def use_eager_decoder(model):
+    model.hifigan_decoder.__dict__.pop("forward", None)
+    return model
+
+
+# ----------------------------------------
+# Parity and timing
+# ----------------------------------------
+
+def _median_ms(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def compare(model, decoder, speaker_embedding, frames=PARITY_FRAMES, repeats=5, seed=0):
+    """Per length: max abs error, SNR of ORT vs eager, and median decode ms for both"""
+    generator = torch.Generator().manual_seed(seed)
+    device = next(model.parameters()).device
+    graph = DecoderGraph(model.hifigan_decoder)
+    rows = []
+    for n in frames:
+        latents = torch.randn(1, n, model.args.decoder_input_dim, generator=generator).to(device)
+        with torch.inference_mode():
+            reference = graph(latents, speaker_embedding).cpu().numpy()
+            eager_ms = _median_ms(lambda: graph(latents, speaker_embedding), repeats)
+        onnx_wav = decoder(latents, speaker_embedding).cpu().numpy()
+        onnx_ms = _median_ms(lambda: decoder(latents, speaker_embedding), repeats)
+        error = onnx_wav - reference
+        snr = 10 * np.log10(np.sum(reference ** 2) / max(np.sum(error ** 2), 1e-20))
+        rows.append({"frames": n, "audio_seconds": round(reference.shape[-1] / 24000, 2),
+                     "max_abs_error": float(np.abs(error).max()), "snr_db": round(float(snr), 1),
+                     "eager_ms": round(eager_ms, 1), "onnx_ms": round(onnx_ms, 1)})
+    return rows
+
+
+def print_comparison(rows, threads):
+    print(f"{'frames':>7}{'audio s':>9}{'max err':>11}{'SNR dB':>8}{'eager ms':>10}{'onnx ms':>9}{'speedup':>9}")
+    for r in rows:
+        print(f"{r['frames']:>7}{r['audio_seconds']:>9.2f}{r['max_abs_error']:>11.2e}{r['snr_db']:>8.1f}"
+              f"{r['eager_ms']:>10.1f}{r['onnx_ms']:>9.1f}{r['eager_ms'] / r['onnx_ms']:>8.2f}x")
+    worst = max(r["max_abs_error"] for r in rows)
+    status = "✅ parity OK" if worst <= PARITY_TOLERANCE else "❌ parity FAILED"
+    print(f"\n{status} (worst max abs error {worst:.2e}, tolerance {PARITY_TOLERANCE:.0e}, "
+          f"ORT threads {threads}, torch threads {torch.get_num_threads()})")
+    return worst <= PARITY_TOLERANCE
+
+
+def main():
+    from sentence_synthesis import load_xtts
+
+    parser = argparse.ArgumentParser(description="HiFi-GAN decoder on ONNX Runtime")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (("export", "Export the decoder to ONNX and check parity"),
+                            ("check", "Parity and decode time of an exported decoder vs eager")):
+        cmd = sub.add_parser(name, help=help_text)
+        cmd.add_argument("--model-dir", required=True)
+        cmd.add_argument("--checkpoint", required=True)
+        cmd.add_argument("--reference", required=True, nargs="+", help="Speaker reference WAV(s) for the embedding")
+        cmd.add_argument("--output", default=None, help=f"ONNX file (default: <model-dir>/{ONNX_FILENAME})")
+        cmd.add_argument("--threads", type=int, default=DEFAULT_THREADS, help="ONNX Runtime intra-op threads")
+        cmd.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    import audio_io
+    audio_io.install()
+    model = load_xtts(Path(args.model_dir), Path(args.checkpoint), device="cpu")
+    _, speaker_embedding = model.get_conditioning_latents(audio_path=args.reference, gpt_cond_len=30,
+                                                          gpt_cond_chunk_len=4, max_ref_length=60)
+    output = Path(args.output) if args.output else Path(args.model_dir) / ONNX_FILENAME
+
+    print("=" * 80)
+    print(f"🧩 HIFI-GAN DECODER - ONNX {args.command.upper()}")
+    print("=" * 80)
+    if args.command == "export":
+        meta = export_decoder(model, output)
+        print(f"✅ Exported {output} ({meta['size_mb']} MB, opset {meta['opset']}, {meta['export_seconds']}s)")
+    decoder = OrtDecoder(output, threads=args.threads)
+    ok = print_comparison(compare(model, decoder, speaker_embedding, repeats=args.repeats), args.threads)
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,8 @@ Prepares the 40 new high-quality samples from vago_samples_selected
 - 16 question samples
 
 Creates metadata.csv for training continuation from checkpoint 1901
+
+Superseded by build_phase4_dataset.py (incremental, non-interactive).
 """
 
 import os
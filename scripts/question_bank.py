@@ -0,0 +1,313 @@
+"""
+Question Bank - Indexed SQLite Store for Quiz Questions
+=======================================================
+On-disk replacement for the in-script QUESTION_TEMPLATES dict, sized for
+tens of thousands of questions:
+- one row per question: topic, difficulty (1-5, NULL = unrated), text and
+  the "already rendered" flag (time + output file)
+- indexes on (topic, sample_key) and (topic, difficulty), full-text search
+  over the text (SQLite FTS5, LIKE fallback where FTS5 is not compiled in)
+- sampling never loads the bank: a draw picks a uniformly random position
+  among the matching rows and reads that one row through the (topic,
+  sample_key) index (LIMIT 1 OFFSET k), redrawing positions already taken.
+  N questions cost N index walks and O(N) memory whatever the bank size
+  (asking for half of a topic or more reads the topic once)
+- imports are streamed (JSONL / CSV) in batches
+
+Seeded from QUESTION_TEMPLATES in generate_questions_and_answers.py (read
+with ast, the generator and its model imports are not loaded).
+
+Usage:
+  python scripts/question_bank.py seed                              # templates -> question_bank.sqlite
+  python scripts/question_bank.py import questions.jsonl            # {"topic", "text", "difficulty"} per line
+  python scripts/question_bank.py import questions.csv --topic sport
+  python scripts/question_bank.py sample sport 5 --unrendered
+  python scripts/question_bank.py search "Petőfi OR Arany"
+  python scripts/question_bank.py stats
+  python scripts/question_bank.py check                             # sampling uniformity self-check
+"""
+
+import argparse
+import ast
+import csv
+import json
+import random
+import sqlite3
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+BANK_PATH = PROJECT_ROOT / "question_bank.sqlite"
+GENERATOR_PATH = Path(__file__).resolve().parent / "generate_questions_and_answers.py"
+IMPORT_BATCH = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS questions (
+    id INTEGER PRIMARY KEY,
+    topic TEXT NOT NULL,
+    difficulty INTEGER CHECK (difficulty BETWEEN 1 AND 5),
+    text TEXT NOT NULL UNIQUE,
+    sample_key REAL NOT NULL,
+    rendered_at TEXT,
+    output_path TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_questions_topic_key ON questions (topic, sample_key);
+CREATE INDEX IF NOT EXISTS idx_questions_topic_difficulty ON questions (topic, difficulty);
+CREATE INDEX IF NOT EXISTS idx_questions_key ON questions (sample_key);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts USING fts5(text, content='questions', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS questions_ai AFTER INSERT ON questions BEGIN
+    INSERT INTO questions_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS questions_ad AFTER DELETE ON questions BEGIN
+    INSERT INTO questions_fts (questions_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+CREATE TRIGGER IF NOT EXISTS questions_au AFTER UPDATE OF text ON questions BEGIN
+    INSERT INTO questions_fts (questions_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    INSERT INTO questions_fts (rowid, text) VALUES (new.id, new.text);
+END;
+"""
+
+
+def load_templates(path=GENERATOR_PATH):
+    """QUESTION_TEMPLATES from the generator script, without importing it"""
+    tree = ast.parse(Path(path).read_text(encoding="utf-8"))
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(getattr(t, "id", None) == "QUESTION_TEMPLATES" for t in node.targets):
+            return ast.literal_eval(node.value)
+    raise ValueError(f"QUESTION_TEMPLATES not found in {Path(path).name}")
+
+
+class QuestionBank:
+    """SQLite question store with topic-aware constant-memory sampling"""
+
+    def __init__(self, path=BANK_PATH):
+        self.path = Path(path)
+        self.conn = sqlite3.connect(str(self.path))
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        try:
+            self.conn.executescript(FTS_SCHEMA)
+            self.has_fts = True
+        except sqlite3.OperationalError:  # SQLite built without FTS5
+            self.has_fts = False
+        self.rng = random.Random()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---------- writing ----------
+
+    def add_many(self, rows):
+        """Insert (topic, text, difficulty) rows from any iterable, in batches; returns rows added"""
+        rows = iter(rows)
+        added = 0
+        while True:
+            batch = [(topic, " ".join(text.split()), difficulty, self.rng.random())
+                     for topic, text, difficulty in islice(rows, IMPORT_BATCH)]
+            if not batch:
+                return added
+            with self.conn:
+                cursor = self.conn.executemany(
+                    "INSERT OR IGNORE INTO questions (topic, text, difficulty, sample_key) VALUES (?, ?, ?, ?)", batch)
+                added += cursor.rowcount  # ignored duplicates are not counted
+
+    def seed_from_templates(self, templates=None):
+        templates = templates if templates is not None else load_templates()
+        return self.add_many((topic, text, None) for topic, texts in templates.items() for text in texts)
+
+    def mark_rendered(self, question_id, output_path=None):
+        with self.conn:
+            self.conn.execute("UPDATE questions SET rendered_at = ?, output_path = ? WHERE id = ?",
+                              (datetime.now().isoformat(timespec="seconds"),
+                               str(output_path) if output_path else None, question_id))
+
+    def reset_rendered(self, topic=None):
+        with self.conn:
+            if topic is None:
+                self.conn.execute("UPDATE questions SET rendered_at = NULL, output_path = NULL")
+            else:
+                self.conn.execute("UPDATE questions SET rendered_at = NULL, output_path = NULL WHERE topic = ?",
+                                  (topic,))
+
+    # ---------- reading ----------
+
+    def topics(self):
+        """[(topic, count)] in seeding order"""
+        return [(r["topic"], r["n"]) for r in
+                self.conn.execute("SELECT topic, COUNT(*) AS n FROM questions GROUP BY topic ORDER BY MIN(id)")]
+
+    def count(self, topic=None, unrendered=False, min_difficulty=None, max_difficulty=None):
+        where, params = self._filters(topic, unrendered, min_difficulty, max_difficulty)
+        return self.conn.execute(f"SELECT COUNT(*) FROM questions {where}", params).fetchone()[0]
+
+    def _filters(self, topic, unrendered, min_difficulty, max_difficulty):
+        clauses, params = [], []
+        if topic is not None:
+            clauses.append("topic = ?")
+            params.append(topic)
+        if unrendered:
+            clauses.append("rendered_at IS NULL")
+        if min_difficulty is not None:
+            clauses.append("difficulty >= ?")
+            params.append(min_difficulty)
+        if max_difficulty is not None:
+            clauses.append("difficulty <= ?")
+            params.append(max_difficulty)
+        return ("WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def sample(self, n, topic=None, unrendered=False, min_difficulty=None, max_difficulty=None):
+        """
+        Up to n distinct random questions (sqlite3.Row: id, topic, difficulty, text, ...).
+        Each draw is a uniform position among the matching rows, read with
+        LIMIT 1 OFFSET k in sample_key order - no ORDER BY RANDOM() over the bank.
+        When n is at least half the matching rows, one scan is cheaper.
+        """
+        where, params = self._filters(topic, unrendered, min_difficulty, max_difficulty)
+        available = self.count(topic, unrendered, min_difficulty, max_difficulty)
+        if n * 2 >= available:
+            rows = self.conn.execute(f"SELECT * FROM questions {where}", params).fetchall()
+            return self.rng.sample(rows, min(n, len(rows)))
+
+        query = f"SELECT id FROM questions {where} ORDER BY sample_key LIMIT 1 OFFSET ?"
+        positions = {}  # dict keeps the draw order
+        while len(positions) < n:
+            positions[self.rng.randrange(available)] = None
+        ids = [self.conn.execute(query, (*params, k)).fetchone()[0] for k in positions]
+        return [self.conn.execute("SELECT * FROM questions WHERE id = ?", (question_id,)).fetchone()
+                for question_id in ids]
+
+    def sample_per_topic(self, n, topics=None, **filters):
+        """n questions from each topic (all topics by default)"""
+        topics = topics or [topic for topic, _ in self.topics()]
+        return {topic: self.sample(n, topic=topic, **filters) for topic in topics}
+
+    def search(self, query, limit=20, topic=None):
+        """Full-text search (FTS5 syntax: words, "phrases", OR, prefix*)"""
+        if self.has_fts:
+            sql = ("SELECT q.* FROM questions_fts f JOIN questions q ON q.id = f.rowid "
+                   "WHERE questions_fts MATCH ?" + (" AND q.topic = ?" if topic else "") + " ORDER BY rank LIMIT ?")
+        else:
+            sql = "SELECT * FROM questions WHERE text LIKE ?" + (" AND topic = ?" if topic else "") + " LIMIT ?"
+            query = f"%{query}%"
+        params = (query, topic, limit) if topic else (query, limit)
+        return self.conn.execute(sql, params).fetchall()
+
+    def stats(self):
+        return self.conn.execute(
+            "SELECT topic, COUNT(*) AS total, COUNT(rendered_at) AS rendered, "
+            "COUNT(difficulty) AS rated, AVG(difficulty) AS avg_difficulty "
+            "FROM questions GROUP BY topic ORDER BY MIN(id)").fetchall()
+
+
+# ----------------------------------------
+# Import
+# ----------------------------------------
+
+def read_rows(path, topic=None, difficulty=None):
+    """Stream (topic, text, difficulty) from JSONL or CSV (columns: topic, text, difficulty)"""
+    path = Path(path)
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        records = (json.loads(line) for line in f if line.strip()) if path.suffix == ".jsonl" else csv.DictReader(f)
+        for record in records:
+            level = record.get("difficulty") or difficulty
+            yield record.get("topic") or topic, record["text"], int(level) if level not in (None, "") else None
+
+
+# ----------------------------------------
+# Self-check
+# ----------------------------------------
+
+def run_checks(rows=1000, draws=50000, seed=0):
+    """Failure messages of the sampling checks on a throwaway in-memory bank (empty = all passed)"""
+    failures = []
+    with QuestionBank(":memory:") as bank:
+        bank.rng = random.Random(seed)
+        bank.add_many((f"topic{i % 4}", f"question {i}", i % 5 + 1) for i in range(rows))
+
+        picks = dict.fromkeys(range(1, rows + 1), 0)
+        for _ in range(draws):
+            picks[bank.sample(1)[0]["id"]] += 1
+        expected = draws / rows
+        chi2 = sum((count - expected) ** 2 / expected for count in picks.values())
+        never = sum(1 for count in picks.values() if count == 0)
+        # chi-square with rows - 1 degrees of freedom: mean rows - 1, sd ~ sqrt(2 * rows)
+        if never or chi2 > rows + 6 * (2 * rows) ** 0.5:
+            failures.append(f"single draws not uniform: chi2 {chi2:.0f} over {rows} rows, "
+                            f"{never} never drawn, picks {min(picks.values())}..{max(picks.values())}")
+
+        drawn = bank.sample(20, topic="topic1", min_difficulty=2)
+        if len({row["id"] for row in drawn}) != 20 or any(row["topic"] != "topic1" or row["difficulty"] < 2
+                                                           for row in drawn):
+            failures.append("sample(20, topic, min_difficulty) returned duplicates or rows outside the filter")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite question bank")
+    parser.add_argument("--bank", default=str(BANK_PATH))
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("seed", help="Add QUESTION_TEMPLATES from the generator")
+    imp = sub.add_parser("import", help="Stream questions from JSONL or CSV")
+    imp.add_argument("path")
+    imp.add_argument("--topic", help="Topic for rows without one")
+    imp.add_argument("--difficulty", type=int, help="Difficulty for rows without one")
+    sample = sub.add_parser("sample", help="Random questions of a topic (or 'vegyes')")
+    sample.add_argument("topic")
+    sample.add_argument("n", type=int)
+    sample.add_argument("--unrendered", action="store_true")
+    search = sub.add_parser("search", help="Full-text search")
+    search.add_argument("query")
+    search.add_argument("--topic")
+    search.add_argument("--limit", type=int, default=20)
+    reset = sub.add_parser("reset", help="Clear the rendered flags")
+    reset.add_argument("--topic")
+    sub.add_parser("stats", help="Questions per topic")
+    sub.add_parser("check", help="Check that sampling is uniform and respects the filters")
+    args = parser.parse_args()
+
+    if args.command == "check":
+        failures = run_checks()
+        for failure in failures:
+            print(f"❌ {failure}")
+        print("✅ Sampling checks passed" if not failures else f"❌ {len(failures)} sampling checks failed")
+        raise SystemExit(1 if failures else 0)
+
+    with QuestionBank(args.bank) as bank:
+        if args.command == "seed":
+            print(f"✅ Added {bank.seed_from_templates()} template questions")
+        elif args.command == "import":
+            added = bank.add_many(row for row in read_rows(args.path, args.topic, args.difficulty) if row[0])
+            print(f"✅ Imported {added} questions from {Path(args.path).name} (duplicates skipped)")
+        elif args.command in ("sample", "search"):
+            if args.command == "sample":
+                topic = None if args.topic == "vegyes" else args.topic
+                rows = bank.sample(args.n, topic=topic, unrendered=args.unrendered)
+            else:
+                rows = bank.search(args.query, args.limit, args.topic)
+            for row in rows:
+                flag = "🔊" if row["rendered_at"] else "  "
+                print(f"{flag} [{row['id']:>6}] {row['topic']:<12} {row['text'][:90]}")
+        elif args.command == "reset":
+            bank.reset_rendered(args.topic)
+            print("✅ Rendered flags cleared")
+        else:
+            print(f"{'Topic':<14}{'Total':>8}{'Rendered':>10}{'Rated':>8}{'Avg diff':>10}")
+            for row in bank.stats():
+                avg = f"{row['avg_difficulty']:.1f}" if row["avg_difficulty"] is not None else "-"
+                print(f"{row['topic']:<14}{row['total']:>8}{row['rendered']:>10}{row['rated']:>8}{avg:>10}")
+            print(f"\nFull-text search: {'FTS5' if bank.has_fts else 'LIKE fallback'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+"""
+Render Episode - Full Quiz Shows From Cached Segments
+=====================================================
+Builds a whole episode (intro, questions, answers, reactions, transitions)
+from a JSON script instead of stitching per-question WAVs by hand:
+- every beat names a speaker profile (references + sampling parameters +
+  optional LoRA adapter) and its text
+- rendered beats are cached as WAVs keyed by model, profile, language and
+  text - re-rendering an episode only synthesizes beats that changed, and a
+  fully cached episode does not even load the model
+- beats and the silences between them are streamed into one output file
+  through a fixed-size buffer, so peak memory depends on the longest beat,
+  not on the episode length
+- per-beat timing (cached / rendered, render time, position in the episode)
+  is printed and written next to the output
+
+Script format (see episodes/example_episode.json):
+  {
+    "language": "hu",
+    "profiles": {"host": {"references": ["prepared_sources/.../question9.wav"],
+                          "params": {"temperature": 0.35}, "adapter": null}},
+    "pauses_ms": {"question": 1500},
+    "beats": [{"type": "intro", "speaker": "host", "text": "..."},
+              {"type": "silence", "ms": 2000}, ...]
+  }
+
+Usage:
+  python scripts/render_episode.py episodes/example_episode.json
+  python scripts/render_episode.py episodes/example_episode.json --output generated_output/episode_01.flac
+  python scripts/render_episode.py episodes/example_episode.json --plan     # cache status only
+"""
+
+import argparse
+import hashlib
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+import torch
+
+import audio_io
+from conditioning import compute_conditioning_latents
+from gpt_lora import find_gpt2, load_adapter, set_adapter_enabled
+from sentence_synthesis import SAMPLE_RATE, SentenceSynthesizer, load_xtts
+from text_frontend import TextFrontend
+from training_metrics import peak_memory_mb
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+MODEL_DIR = PROJECT_ROOT / "run" / "training_phase4_continuation" / "XTTS_Phase4_Continuation-October-09-2025_07+54PM-f634425"
+MODEL_PATH = MODEL_DIR / "best_model_2735.pth"
+CACHE_DIR = PROJECT_ROOT / "generated_output" / "segment_cache"
+OUTPUT_DIR = PROJECT_ROOT / "generated_output"
+
+BEAT_TYPES = ("intro", "question", "answer", "reaction", "transition", "silence")
+# Silence after each beat type unless the beat or the script says otherwise
+DEFAULT_PAUSES_MS = {"intro": 800, "question": 1200, "answer": 900, "reaction": 600, "transition": 1000}
+DEFAULT_PARAMS = {
+    "temperature": 0.35,
+    "top_p": 0.90,
+    "top_k": 50,
+    "repetition_penalty": 3.5,
+    "length_penalty": 1.3,
+}
+BUFFER_FRAMES = 32768  # streaming buffer (~1.4 s at 24 kHz)
+SENTENCE_PAUSE_MS = 250  # inside a beat, between its sentences
+SENTENCE_WORKERS = 2
+
+
+# ----------------------------------------
+# Script
+# ----------------------------------------
+
+def load_script(path, normalize=True):
+    """
+    Parse and validate an episode script. Beats get a "spoken" text - normalized
+    by text_frontend, so respelling a name or a year does not re-render a beat.
+    """
+    frontend = TextFrontend.load() if normalize else None
+    with open(path, 'r', encoding='utf-8') as f:
+        script = json.load(f)
+    profiles = script.get("profiles", {})
+    for name, profile in profiles.items():
+        if not profile.get("references"):
+            raise ValueError(f"profile '{name}' has no references")
+        profile["references"] = [str(PROJECT_ROOT / ref) for ref in profile["references"]]
+        if profile.get("adapter"):
+            profile["adapter"] = str(PROJECT_ROOT / profile["adapter"])
+    for i, beat in enumerate(script.get("beats", []), 1):
+        if beat.get("type") not in BEAT_TYPES:
+            raise ValueError(f"beat {i}: unknown type {beat.get('type')!r} (expected one of {', '.join(BEAT_TYPES)})")
+        if beat["type"] == "silence":
+            continue
+        if beat.get("speaker") not in profiles:
+            raise ValueError(f"beat {i}: unknown speaker {beat.get('speaker')!r}")
+        if not beat.get("text", "").strip():
+            raise ValueError(f"beat {i}: empty text")
+        beat["spoken"] = frontend.normalize(beat["text"]) if frontend else beat["text"]
+    return script
+
+
+def pause_after(script, beat):
+    if beat["type"] == "silence":
+        return beat.get("ms", 1000)
+    if "pause_ms" in beat:
+        return beat["pause_ms"]
+    return script.get("pauses_ms", {}).get(beat["type"], DEFAULT_PAUSES_MS[beat["type"]])
+
+
+# ----------------------------------------
+# Segment cache
+# ----------------------------------------
+
+def file_stamp(path):
+    stat = Path(path).stat()
+    return stat.st_size, int(stat.st_mtime)
+
+
+def model_fingerprint(checkpoint_path):
+    """Cheap checkpoint identity (hashing a multi-GB file on every render is not)"""
+    size, mtime = file_stamp(checkpoint_path)
+    return f"{Path(checkpoint_path).name}:{size}:{mtime}"
+
+
+def segment_key(model_id, profile, language, text):
+    payload = {
+        "model": model_id,
+        # Re-recorded / re-cut references invalidate their speaker's segments
+        "references": [(Path(ref).name, *file_stamp(ref)) for ref in profile["references"]],
+        "params": {**DEFAULT_PARAMS, **profile.get("params", {})},
+        "adapter": profile.get("adapter"),
+        "language": language,
+        "text": " ".join(text.split()),
+        "sentence_pause_ms": SENTENCE_PAUSE_MS,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()[:24]
+
+
+class SegmentRenderer:
+    """Renders beats into the cache; the model is loaded on the first miss"""
+
+    def __init__(self, script, model_dir, checkpoint_path, cache_dir, workers=SENTENCE_WORKERS):
+        self.script = script
+        self.model_dir = Path(model_dir)
+        self.checkpoint_path = Path(checkpoint_path)
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.workers = workers
+        self.language = script.get("language", "hu")
+        self.model_id = model_fingerprint(checkpoint_path)
+        self.model = None
+        self.synth = None
+        self.adapter = None
+        self.latents = {}
+
+    def path(self, beat):
+        profile = self.script["profiles"][beat["speaker"]]
+        return self.cache_dir / f"{segment_key(self.model_id, profile, self.language, beat['spoken'])}.wav"
+
+    def _load(self):
+        print(f"⏳ Loading model {self.checkpoint_path.name}...")
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.model = load_xtts(self.model_dir, self.checkpoint_path, device=device)
+        self.synth = SentenceSynthesizer(self.model, workers=self.workers, pause_ms=SENTENCE_PAUSE_MS)
+        print(f"✅ Model loaded on {device.upper()}")
+
+    def _use_profile(self, name):
+        profile = self.script["profiles"][name]
+        adapter = profile.get("adapter")
+        if adapter != self.adapter:
+            if adapter is None:
+                set_adapter_enabled(find_gpt2(self.model), False)
+            else:
+                load_adapter(find_gpt2(self.model), adapter)
+            self.adapter = adapter
+        if name not in self.latents:
+            self.latents[name] = compute_conditioning_latents(
+                self.model, profile["references"], gpt_cond_len=30, gpt_cond_chunk_len=4, max_ref_length=60)
+        return profile
+
+    def render(self, beat):
+        """Synthesize the beat into its cache file"""
+        if self.model is None:
+            self._load()
+        profile = self._use_profile(beat["speaker"])
+        gpt_cond_latent, speaker_embedding = self.latents[beat["speaker"]]
+        wav = self.synth.synthesize(beat["spoken"], self.language, gpt_cond_latent, speaker_embedding,
+                                    **{**DEFAULT_PARAMS, **profile.get("params", {})})
+        path = self.path(beat)
+        tmp = path.with_suffix(".tmp.wav")
+        sf.write(str(tmp), wav, SAMPLE_RATE, subtype="FLOAT")
+        tmp.replace(path)  # a crashed render never leaves a truncated cache entry
+        return path
+
+    def close(self):
+        if self.synth is not None:
+            self.synth.close()
+
+
+# ----------------------------------------
+# Streaming output
+# ----------------------------------------
+
+class EpisodeWriter:
+    """Appends segments and silence to one file through a fixed-size buffer"""
+
+    def __init__(self, path, sample_rate=SAMPLE_RATE, buffer_frames=BUFFER_FRAMES):
+        self.sample_rate = sample_rate
+        self.buffer = np.zeros(buffer_frames, dtype=np.float32)
+        self.frames = 0
+        subtype = "PCM_16" if Path(path).suffix.lower() in (".wav", ".flac") else None
+        self.file = sf.SoundFile(str(path), 'w', samplerate=sample_rate, channels=1, subtype=subtype)
+
+    def write_segment(self, path):
+        with sf.SoundFile(str(path)) as segment:
+            if segment.samplerate != self.sample_rate:
+                raise ValueError(f"{Path(path).name}: {segment.samplerate} Hz, episode is {self.sample_rate} Hz")
+            if segment.channels != 1:
+                raise ValueError(f"{Path(path).name}: expected mono")
+            while True:
+                chunk = segment.read(out=self.buffer)  # view of the frames actually read
+                if len(chunk) == 0:
+                    break
+                self.file.write(chunk)
+                self.frames += len(chunk)
+
+    def write_silence(self, ms):
+        remaining = int(self.sample_rate * ms / 1000)
+        self.buffer[:] = 0.0
+        while remaining > 0:
+            n = min(remaining, len(self.buffer))
+            self.file.write(self.buffer[:n])
+            self.frames += n
+            remaining -= n
+
+    @property
+    def seconds(self):
+        return self.frames / self.sample_rate
+
+    def close(self):
+        self.file.close()
+
+
+# ----------------------------------------
+# Rendering
+# ----------------------------------------
+
+def plan(script, renderer):
+    """(beat, cache path or None, cached) per beat"""
+    rows = []
+    for beat in script["beats"]:
+        if beat["type"] == "silence":
+            rows.append((beat, None, True))
+        else:
+            path = renderer.path(beat)
+            rows.append((beat, path, path.exists()))
+    return rows
+
+
+def render_episode(script, output_path, renderer):
+    """Stream the whole episode into output_path; returns the per-beat timing report"""
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    writer = EpisodeWriter(output_path)
+    beats = []
+    start = time.perf_counter()
+    try:
+        for i, (beat, path, cached) in enumerate(plan(script, renderer), 1):
+            offset = writer.seconds
+            render_seconds = 0.0
+            if path is not None:
+                if not cached:
+                    t0 = time.perf_counter()
+                    renderer.render(beat)
+                    render_seconds = time.perf_counter() - t0
+                writer.write_segment(path)
+            audio_seconds = writer.seconds - offset
+            pause = pause_after(script, beat)
+            writer.write_silence(pause)
+            row = {
+                "beat": i,
+                "type": beat["type"],
+                "speaker": beat.get("speaker"),
+                "text": beat.get("text", "")[:60],
+                "status": "silence" if path is None else ("cached" if cached else "rendered"),
+                "render_seconds": round(render_seconds, 2),
+                "start_seconds": round(offset, 2),
+                "audio_seconds": round(audio_seconds, 2),
+                "pause_ms": pause,
+            }
+            beats.append(row)
+            print(f"  [{i:>3}] {row['start_seconds']:>8.1f}s  {row['type']:<10} {row['status']:<8} "
+                  f"{row['audio_seconds']:>6.1f}s audio  {row['render_seconds']:>6.1f}s render  {row['text']}")
+    finally:
+        writer.close()
+    return {
+        "output": str(output_path),
+        "episode_seconds": round(writer.seconds, 2),
+        "wall_seconds": round(time.perf_counter() - start, 2),
+        "rendered": sum(b["status"] == "rendered" for b in beats),
+        "cached": sum(b["status"] == "cached" for b in beats),
+        "peak_memory_mb": round(peak_memory_mb(), 1),
+        "beats": beats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a quiz episode from a JSON script")
+    parser.add_argument("script", help="Episode script (JSON)")
+    parser.add_argument("--output", help="Output file (.wav/.flac/.ogg), default generated_output/<script>.wav")
+    parser.add_argument("--model-dir", default=str(MODEL_DIR))
+    parser.add_argument("--checkpoint", default=str(MODEL_PATH))
+    parser.add_argument("--cache-dir", default=str(CACHE_DIR))
+    parser.add_argument("--workers", type=int, default=SENTENCE_WORKERS, help="Parallel sentences per beat")
+    parser.add_argument("--plan", action="store_true", help="Only show which beats are cached")
+    parser.add_argument("--no-normalize", action="store_true", help="Synthesize beat texts as written")
+    args = parser.parse_args()
+
+    script = load_script(args.script, normalize=not args.no_normalize)
+    output = Path(args.output) if args.output else OUTPUT_DIR / f"{Path(args.script).stem}.wav"
+    audio_io.install()
+    renderer = SegmentRenderer(script, args.model_dir, args.checkpoint, args.cache_dir, workers=args.workers)
+
+    print("=" * 80)
+    print(f"🎬 EPISODE: {Path(args.script).stem} ({len(script['beats'])} beats)")
+    print("=" * 80)
+    rows = plan(script, renderer)
+    missing = sum(not cached for _, _, cached in rows)
+    print(f"Cache: {len(rows) - missing} of {len(rows)} beats ready, {missing} to render ({args.cache_dir})")
+    print()
+    if args.plan:
+        for i, (beat, _, cached) in enumerate(rows, 1):
+            print(f"  [{i:>3}] {beat['type']:<10} {'✅' if cached else '⏳'} {beat.get('text', '')[:60]}")
+        return
+
+    try:
+        report = render_episode(script, output, renderer)
+    finally:
+        renderer.close()
+    report_path = output.with_suffix(".timing.json")
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    print()
+    print(f"✅ {output.name}: {report['episode_seconds'] / 60:.1f} min in {report['wall_seconds']:.1f}s "
+          f"({report['rendered']} rendered, {report['cached']} cached), peak memory {report['peak_memory_mb']:.0f} MB")
+    print(f"📄 Timing: {report_path}")
+
+
+if __name__ == "__main__":
+    main()
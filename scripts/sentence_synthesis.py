@@ -0,0 +1,368 @@
+"""
+Sentence Synthesis - Parallel, Ordered Multi-Sentence Inference
+===============================================================
+Replacement for model.inference(..., enable_text_splitting=True), which
+synthesizes the sentences of a long text one after another:
+- the text is split into sentences that fit the XTTS tokenizer limit for the
+  language (224 characters for Hungarian); over-long sentences are split at
+  ; : , and then between words
+- the sentences are synthesized concurrently, so a paragraph takes about as
+  long as its longest sentence instead of the sum of all of them
+- the results are stitched back in the original order with a configurable
+  pause (short fade out / fade in around the silence) or, without a pause,
+  an equal-power crossfade
+
+Backends:
+- thread: workers share the loaded model (GPU, or a CPU with spare cores);
+  the GPT prefix that XTTS caches on the model is made thread-local
+- process: every worker loads its own model copy and gets cores / workers
+  threads (CPU; costs one model of RAM per worker)
+
+Usage:
+  from sentence_synthesis import SentenceSynthesizer
+  synth = SentenceSynthesizer(model, workers=3, pause_ms=250, crossfade_ms=20)
+  wav = synth.synthesize(text, "hu", gpt_cond_latent, speaker_embedding, **PARAMS)
+
+  python scripts/sentence_synthesis.py split "Első mondat. Második mondat!"   # show the split
+  python scripts/sentence_synthesis.py check                                  # splitter regression cases
+"""
+
+import argparse
+import multiprocessing
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import torch
+
+SAMPLE_RATE = 24000  # XTTS output rate
+DEFAULT_CHAR_LIMIT = 224  # tokenizer char_limits["hu"]
+
+SENTENCE_END = re.compile(r"([.!?…][\"'”»«)]*)\s+")  # the captured end (closing quotes too) stays with its sentence
+# A "." after these is not a sentence end (Dr. Kiss, pl. ez, stb.)
+ABBREVIATIONS = {"dr", "prof", "id", "ifj", "özv", "pl", "stb", "ill", "kb", "ún", "vö", "ld", "sz", "u", "st",
+                 "mr", "mrs", "jr", "br", "gr", "krt", "zrt", "kft", "ny", "ford", "szerk"}
+CLAUSE_END = re.compile(r"(?<=[;:,])\s+")
+
+
+# ----------------------------------------
+# Splitting
+# ----------------------------------------
+
+def char_limit(model, language):
+    """Tokenizer character limit for the language (what enable_text_splitting uses)"""
+    limits = getattr(getattr(model, "tokenizer", None), "char_limits", None) or {}
+    return limits.get(language.split("-")[0], DEFAULT_CHAR_LIMIT if language.startswith("hu") else 250)
+
+
+def _pack(parts, max_chars, separator=" "):
+    """Greedily join consecutive parts while they fit in max_chars"""
+    chunks = []
+    for part in parts:
+        if chunks and len(chunks[-1]) + len(separator) + len(part) <= max_chars:
+            chunks[-1] += separator + part
+        else:
+            chunks.append(part)
+    return chunks
+
+
+def _split_long(sentence, max_chars):
+    if len(sentence) <= max_chars:
+        return [sentence]
+    chunks = []
+    for clause in _pack(CLAUSE_END.split(sentence), max_chars):
+        if len(clause) <= max_chars:
+            chunks.append(clause)
+        else:
+            chunks.extend(_pack(clause.split(), max_chars))
+    return chunks
+
+
+def split_sentences(text, max_chars=DEFAULT_CHAR_LIMIT, merge=False):
+    """
+    Sentences of text, none longer than max_chars (single words excepted).
+    merge=True packs short neighbours together like XTTS's own splitter
+    (fewer, longer jobs - better when there are fewer workers than sentences).
+    """
+    text = " ".join(text.split())
+    if not text:
+        return []
+    parts = SENTENCE_END.split(text)  # [sentence, end, sentence, end, ..., last]
+    sentences, current = [], ""
+    for i in range(0, len(parts), 2):
+        current += parts[i] + (parts[i + 1] if i + 1 < len(parts) else "")
+        if i + 2 < len(parts) and not _is_sentence_end(current, parts[i + 1], parts[i + 2]):
+            current += " "
+            continue
+        if current:
+            sentences.append(current)
+        current = ""
+    pieces = [piece for sentence in sentences for piece in _split_long(sentence, max_chars)]
+    return _pack(pieces, max_chars) if merge else pieces
+
+
+def _is_sentence_end(sentence, end, following):
+    """
+    A bare "." ends a sentence unless it closes an ordinal or date (1848.
+    március, a 3. helyezett), an abbreviation or initial (Dr. Kiss, Kiss J.
+    Péter), or the next word starts lower-case.
+    """
+    if end != ".":
+        return True
+    token = sentence[:-1].rsplit(" ", 1)[-1].lstrip("(\"'„“«»")
+    if token[-1:].isdigit() or token.lower() in ABBREVIATIONS or (len(token) == 1 and token.isalpha()):
+        return False
+    return not following.lstrip("(\"'„“«»")[:1].islower()
+
+
+# ----------------------------------------
+# Stitching
+# ----------------------------------------
+
+def _fade(length, fade_in):
+    ramp = np.sin(np.linspace(0.0, np.pi / 2, length, dtype=np.float32)) if length else np.zeros(0, np.float32)
+    return ramp if fade_in else ramp[::-1]
+
+
+def stitch(segments, sample_rate=SAMPLE_RATE, pause_ms=200, crossfade_ms=20):
+    """
+    Join the segments in order.
+    pause_ms > 0: crossfade_ms fade out, silence, fade in (no clicks at the cuts).
+    pause_ms == 0: equal-power crossfade of crossfade_ms between neighbours.
+    """
+    segments = [np.asarray(s, dtype=np.float32).reshape(-1) for s in segments]
+    if not segments:
+        return np.zeros(0, dtype=np.float32)
+    fade = int(sample_rate * crossfade_ms / 1000)
+    pause = np.zeros(int(sample_rate * pause_ms / 1000), dtype=np.float32)
+    out = [segments[0].copy()]
+    for segment in segments[1:]:
+        previous, segment = out[-1], segment.copy()
+        n = min(fade, len(previous), len(segment))
+        if len(pause):
+            previous[len(previous) - n:] *= _fade(n, fade_in=False)
+            segment[:n] *= _fade(n, fade_in=True)
+            out.extend([pause, segment])
+        else:
+            overlap = previous[len(previous) - n:] * _fade(n, fade_in=False) + segment[:n] * _fade(n, fade_in=True)
+            out[-1] = previous[:len(previous) - n]
+            out.extend([overlap, segment[n:]])
+    return np.concatenate(out)
+
+
+# ----------------------------------------
+# Workers
+# ----------------------------------------
+
+def make_prefix_thread_local(model):
+    """
+    GPT.compute_embeddings stores the text/conditioning prefix on the shared
+    GPT2InferenceModel (cached_prefix_emb) and generate() reads it back - with
+    concurrent threads one sentence would decode another's text. Give every
+    thread its own slot.
+    """
+    inference_model = model.gpt.gpt_inference
+    cls = type(inference_model)
+    if getattr(cls, "_thread_local_prefix", False):
+        return model
+    local = threading.local()
+
+    class ThreadLocalPrefix(cls):
+        _thread_local_prefix = True
+        cached_prefix_emb = property(lambda self: getattr(local, "prefix", None),
+                                     lambda self, value: setattr(local, "prefix", value))
+
+    inference_model.__dict__.pop("cached_prefix_emb", None)
+    inference_model.__class__ = ThreadLocalPrefix
+    return model
+
+
+def synthesize_sentence(model, sentence, language, gpt_cond_latent, speaker_embedding, **params):
+    """One sentence -> float32 numpy waveform"""
+    out = model.inference(text=sentence, language=language, gpt_cond_latent=gpt_cond_latent,
+                          speaker_embedding=speaker_embedding, enable_text_splitting=False, **params)
+    wav = out["wav"]
+    return wav.cpu().numpy() if isinstance(wav, torch.Tensor) else np.asarray(wav, dtype=np.float32)
+
+
+_worker_model = None
+_worker_adapter = None
+
+
+def _use_worker_adapter(adapter_path):
+    """Swap the worker's LoRA adapter when a job asks for a different one (None = base model)"""
+    global _worker_adapter
+    if adapter_path == _worker_adapter:
+        return
+    from gpt_lora import find_gpt2, load_adapter, set_adapter_enabled
+    gpt2 = find_gpt2(_worker_model)
+    if adapter_path is None:
+        set_adapter_enabled(gpt2, False)
+    else:
+        load_adapter(gpt2, adapter_path)
+    _worker_adapter = adapter_path
+
+
+def _init_process_worker(model_dir, checkpoint_path, adapter_path, threads):
+    """Process backend: load a private model copy once per worker"""
+    global _worker_model
+    torch.set_num_threads(threads)
+    _worker_model = load_xtts(model_dir, checkpoint_path, device="cpu")
+    _use_worker_adapter(adapter_path)
+
+
+def _process_job(sentence, language, gpt_cond_latent, speaker_embedding, params, adapter_path):
+    start = time.perf_counter()
+    _use_worker_adapter(adapter_path)
+    wav = synthesize_sentence(_worker_model, sentence, language, gpt_cond_latent, speaker_embedding, **params)
+    return wav, time.perf_counter() - start
+
+
+def load_xtts(model_dir, checkpoint_path, device="cpu"):
+    """Load an XTTS model (full or delta checkpoint) the way the generator does"""
+    from TTS.tts.configs.xtts_config import XttsConfig
+    from TTS.tts.models.xtts import Xtts
+
+    from artifact_store import resolve_model_file
+    from delta_checkpoint import load_xtts_with_delta
+
+    model_dir = Path(model_dir)
+    config = XttsConfig()
+    config.load_json(str(model_dir / "config.json"))
+    model = Xtts.init_from_config(config)
+    load_xtts_with_delta(model, config, checkpoint_dir=str(model_dir), checkpoint_path=checkpoint_path,
+                         vocab_path=str(resolve_model_file("vocab.json", model_dir)), eval=True,
+                         use_deepspeed=False)
+    return model.to(device)
+
+
+class SentenceSynthesizer:
+    """Split, synthesize concurrently, stitch in order"""
+
+    def __init__(self, model=None, workers=2, backend="thread", pause_ms=200, crossfade_ms=20,
+                 merge_short=False, model_dir=None, checkpoint_path=None, adapter_path=None):
+        """
+        backend="thread" needs the loaded model; backend="process" loads its own
+        copies from model_dir / checkpoint_path (+ adapter_path) in every worker.
+        Assign adapter_path later to switch the process workers' adapter (the
+        thread backend uses whatever adapter the shared model has).
+        """
+        self.model = model
+        self.workers = max(1, workers)
+        self.backend = backend
+        self.pause_ms = pause_ms
+        self.crossfade_ms = crossfade_ms
+        self.merge_short = merge_short
+        self.adapter_path = adapter_path and str(adapter_path)
+        self.last_report = None
+        if backend == "thread":
+            if model is None:
+                raise ValueError("thread backend needs a loaded model")
+            make_prefix_thread_local(model)
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="sentence")
+        elif backend == "process":
+            if model_dir is None or checkpoint_path is None:
+                raise ValueError("process backend needs model_dir and checkpoint_path")
+            threads = max(1, (os.cpu_count() or 1) // self.workers)
+            self._executor = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_process_worker,
+                initargs=(str(model_dir), str(checkpoint_path), self.adapter_path, threads))
+        else:
+            raise ValueError(f"unknown backend: {backend}")
+
+    def _timed_job(self, sentence, language, gpt_cond_latent, speaker_embedding, params):
+        start = time.perf_counter()
+        wav = synthesize_sentence(self.model, sentence, language, gpt_cond_latent, speaker_embedding, **params)
+        return wav, time.perf_counter() - start
+
+    def synthesize(self, text, language, gpt_cond_latent, speaker_embedding, **params):
+        """Waveform of the whole text; params are model.inference sampling arguments"""
+        limit = char_limit(self.model, language) if self.model is not None else DEFAULT_CHAR_LIMIT
+        sentences = split_sentences(text, limit, merge=self.merge_short)
+        start = time.perf_counter()
+        if self.backend == "thread":
+            futures = [self._executor.submit(self._timed_job, s, language, gpt_cond_latent, speaker_embedding, params)
+                       for s in sentences]
+        else:
+            latent, embedding = gpt_cond_latent.cpu(), speaker_embedding.cpu()
+            futures = [self._executor.submit(_process_job, s, language, latent, embedding, params, self.adapter_path)
+                       for s in sentences]
+        # Collected by position - completion order does not matter
+        results = [f.result() for f in futures]
+        wall = time.perf_counter() - start
+        wav = stitch([w for w, _ in results], SAMPLE_RATE, self.pause_ms, self.crossfade_ms)
+        seconds = [t for _, t in results]
+        self.last_report = {
+            "sentences": len(sentences),
+            "wall_seconds": round(wall, 3),
+            "longest_sentence_seconds": round(max(seconds, default=0.0), 3),
+            "serial_seconds": round(sum(seconds), 3),
+            "audio_seconds": round(len(wav) / SAMPLE_RATE, 3),
+        }
+        return wav
+
+    def close(self):
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def print_report(report):
+    print(f"   ⏱️  {report['sentences']} sentences: {report['wall_seconds']:.1f}s wall "
+          f"(longest sentence {report['longest_sentence_seconds']:.1f}s, "
+          f"serial sum {report['serial_seconds']:.1f}s) for {report['audio_seconds']:.1f}s of audio")
+
+
+# Regression cases for the splitter: text -> sentences
+SPLIT_CASES = [
+    ("Első mondat. Második mondat!", ["Első mondat.", "Második mondat!"]),
+    ("Azt mondta: „Igen.” Aztán elment.", ["Azt mondta: „Igen.”", "Aztán elment."]),
+    ("(Ez zárójeles.) Ez nem.", ["(Ez zárójeles.)", "Ez nem."]),
+    # ordinals, dates and abbreviations are not sentence ends
+    ("Dr. Kiss János 1848. március 15-én beszélt. Ő lett a 3. helyezett.",
+     ["Dr. Kiss János 1848. március 15-én beszélt.", "Ő lett a 3. helyezett."]),
+    ("Kiss J. Péter nyert. Gratulálunk!", ["Kiss J. Péter nyert.", "Gratulálunk!"]),
+    ("Gyümölcsök, pl. alma, körte stb. kerültek elő. Mind friss.",
+     ["Gyümölcsök, pl. alma, körte stb. kerültek elő.", "Mind friss."]),
+    ("Ez a vége. de ez folytatja.", ["Ez a vége. de ez folytatja."]),
+    ("Mikor volt? 1848.", ["Mikor volt?", "1848."]),
+]
+
+
+def run_checks():
+    """[(text, expected, got)] of the SPLIT_CASES that fail"""
+    return [(text, expected, got) for text, expected in SPLIT_CASES
+            if (got := split_sentences(text)) != expected]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sentence splitting for parallel XTTS synthesis")
+    sub = parser.add_subparsers(dest="command", required=True)
+    split = sub.add_parser("split", help="Show how a text is split")
+    split.add_argument("text")
+    split.add_argument("--max-chars", type=int, default=DEFAULT_CHAR_LIMIT)
+    split.add_argument("--merge", action="store_true", help="Pack short sentences together")
+    sub.add_parser("check", help="Run the splitter regression cases")
+    args = parser.parse_args()
+
+    if args.command == "check":
+        failures = run_checks()
+        for text, expected, got in failures:
+            print(f"❌ {text!r}: expected {expected!r}, got {got!r}")
+        print(f"{'✅' if not failures else '❌'} {len(SPLIT_CASES) - len(failures)}/{len(SPLIT_CASES)} cases passed")
+        raise SystemExit(1 if failures else 0)
+
+    for i, sentence in enumerate(split_sentences(args.text, args.max_chars, args.merge), 1):
+        print(f"{i:>3}. ({len(sentence):>3} chars) {sentence}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+Synthesis Jobs - Priority Queue and Request Coalescing (asyncio)
+================================================================
+Job layer in front of the inference path:
+- two priority classes: "interactive" (single questions, someone is waiting)
+  always goes before "bulk" (episode / batch renders); within a class, FIFO
+- identical requests in flight - same (text, profile, params) - are coalesced:
+  the second caller awaits the first caller's job instead of synthesizing again
+- cancellation: cancelling the awaiting task drops the caller; when the last
+  caller of a job is gone, a queued job is skipped and a running job's result
+  is discarded (inference itself is not interruptible)
+- queue wait (enqueue -> start) is tracked per priority class
+
+The synthesis callable is blocking and runs in worker threads - a plain
+model.inference wrapper (inference_backend) or MicroBatchScheduler.synthesize
+with workers > 1, so concurrent jobs are batched.
+
+Usage:
+  jobs = SynthesisJobs(inference_backend(model, {"vago": (gpt_cond_latent, speaker_embedding)}))
+  await jobs.start()
+  wav = await jobs.submit("Melyik ország fővárosa Budapest?", "vago", priority="interactive", temperature=0.35)
+  print(jobs.stats())
+  await jobs.close()
+
+Demo (bulk render with interactive requests arriving in between):
+  python scripts/synthesis_jobs.py demo --model-dir <run> --checkpoint <pth> --reference <wav>
+"""
+
+import argparse
+import asyncio
+import itertools
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+PRIORITIES = {"interactive": 0, "bulk": 1}
+WAIT_WINDOW = 10000  # wait times kept per class for the percentiles
+
+
+class Job:
+    def __init__(self, key, text, profile, params, priority):
+        self.key = key
+        self.text = text
+        self.profile = profile
+        self.params = params
+        self.priority = priority
+        self.future = asyncio.get_running_loop().create_future()
+        self.waiters = 0
+        self.enqueued = time.perf_counter()
+        self.started = None
+
+    @property
+    def abandoned(self):
+        return self.waiters == 0
+
+
+def request_key(text, profile, params):
+    return " ".join(text.split()), profile, tuple(sorted(params.items()))
+
+
+class SynthesisJobs:
+    """Priority classes, in-flight deduplication and cancellation around a blocking synthesize()"""
+
+    def __init__(self, synthesize, workers=1):
+        """synthesize(text, profile, **params) -> waveform, called from worker threads"""
+        self.synthesize = synthesize
+        self.workers = workers
+        self._queue = None
+        self._inflight = {}
+        self._sequence = itertools.count()
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="synthesis-job")
+        self._tasks = []
+        self._counts = {p: {"submitted": 0, "coalesced": 0, "cancelled": 0, "completed": 0, "failed": 0}
+                        for p in PRIORITIES}
+        self._waits = {p: deque(maxlen=WAIT_WINDOW) for p in PRIORITIES}
+
+    async def start(self):
+        self._queue = asyncio.PriorityQueue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        return self
+
+    async def submit(self, text, profile, priority="bulk", **params):
+        """Synthesize (or join an identical in-flight request); cancel the awaiting task to drop it"""
+        if priority not in PRIORITIES:
+            raise ValueError(f"unknown priority: {priority} (expected {', '.join(PRIORITIES)})")
+        key = request_key(text, profile, params)
+        job = self._inflight.get(key)
+        if job is None:
+            job = Job(key, text, profile, params, priority)
+            self._inflight[key] = job
+            self._counts[priority]["submitted"] += 1
+            await self._queue.put((PRIORITIES[priority], next(self._sequence), job))
+        else:
+            self._counts[priority]["coalesced"] += 1
+            if PRIORITIES[priority] < PRIORITIES[job.priority] and job.started is None:
+                # An interactive caller joined a queued bulk job - queue it again at the higher priority
+                job.priority = priority
+                await self._queue.put((PRIORITIES[priority], next(self._sequence), job))
+        job.waiters += 1
+        try:
+            return await asyncio.shield(job.future)
+        except asyncio.CancelledError:
+            job.waiters -= 1
+            if job.abandoned and not job.future.done():
+                self._counts[job.priority]["cancelled"] += 1
+                self._inflight.pop(job.key, None)
+                job.future.cancel()
+            raise
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            _, _, job = await self._queue.get()
+            try:
+                if job.future.done() or job.started is not None:
+                    continue  # cancelled while queued, or a duplicate entry after a priority upgrade
+                job.started = time.perf_counter()
+                self._waits[job.priority].append(job.started - job.enqueued)
+                try:
+                    result = await loop.run_in_executor(
+                        self._executor, lambda: self.synthesize(job.text, job.profile, **job.params))
+                except Exception as e:
+                    self._counts[job.priority]["failed"] += 1
+                    if not job.future.done():
+                        job.future.set_exception(e)
+                else:
+                    if not job.future.done():  # nobody is waiting any more - result discarded
+                        self._counts[job.priority]["completed"] += 1
+                        job.future.set_result(result)
+                finally:
+                    if self._inflight.get(job.key) is job:
+                        del self._inflight[job.key]
+            finally:
+                self._queue.task_done()
+
+    def stats(self):
+        queued = {p: 0 for p in PRIORITIES}
+        for job in self._inflight.values():
+            if job.started is None:
+                queued[job.priority] += 1
+        result = {}
+        for priority in PRIORITIES:
+            waits = sorted(self._waits[priority])
+
+            def percentile(q):
+                return round(waits[min(len(waits) - 1, int(q * len(waits)))], 3) if waits else None
+
+            result[priority] = {
+                **self._counts[priority],
+                "queued": queued[priority],
+                "wait_p50_s": percentile(0.50),
+                "wait_p95_s": percentile(0.95),
+                "wait_max_s": round(waits[-1], 3) if waits else None,
+            }
+        return result
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._executor.shutdown()
+
+
+def inference_backend(model, profiles, language="hu"):
+    """Blocking synthesize() over model.inference; profiles: {name: (gpt_cond_latent, speaker_embedding)}"""
+    from sentence_synthesis import make_prefix_thread_local, synthesize_sentence
+
+    make_prefix_thread_local(model)
+
+    def synthesize(text, profile, **params):
+        gpt_cond_latent, speaker_embedding = profiles[profile]
+        return synthesize_sentence(model, text, language, gpt_cond_latent, speaker_embedding, **params)
+
+    return synthesize
+
+
+def print_stats(stats):
+    for priority, s in stats.items():
+        waits = f"wait p50 {s['wait_p50_s']}s, p95 {s['wait_p95_s']}s, max {s['wait_max_s']}s"
+        print(f"   • {priority:<12} {s['completed']} done, {s['coalesced']} coalesced, {s['cancelled']} cancelled, "
+              f"{s['queued']} queued - {waits}")
+
+
+async def _demo(synthesize, bulk_texts, interactive_texts, params):
+    jobs = await SynthesisJobs(synthesize).start()
+    bulk = [asyncio.create_task(jobs.submit(t, "default", "bulk", **params)) for t in bulk_texts]
+    # The same texts again while the first copies are in flight - coalesced
+    bulk += [asyncio.create_task(jobs.submit(t, "default", "bulk", **params)) for t in bulk_texts[:3]]
+    await asyncio.sleep(0)
+    bulk[-1].cancel()  # one caller drops out
+    interactive = []
+    for text in interactive_texts:
+        await asyncio.sleep(0.5)
+        interactive.append(asyncio.create_task(jobs.submit(text, "default", "interactive", **params)))
+    await asyncio.gather(*interactive, *bulk, return_exceptions=True)
+    stats = jobs.stats()
+    await jobs.close()
+    return stats
+
+
+def main():
+    from question_bank import load_templates
+    from sentence_synthesis import load_xtts
+
+    parser = argparse.ArgumentParser(description="Priority synthesis jobs with request coalescing")
+    sub = parser.add_subparsers(dest="command", required=True)
+    demo = sub.add_parser("demo", help="Bulk render with interactive requests arriving in between")
+    demo.add_argument("--model-dir", required=True)
+    demo.add_argument("--checkpoint", required=True)
+    demo.add_argument("--reference", required=True, nargs="+", help="Speaker reference WAV(s)")
+    demo.add_argument("--bulk", type=int, default=12)
+    demo.add_argument("--interactive", type=int, default=3)
+    args = parser.parse_args()
+
+    import audio_io
+    import torch
+    audio_io.install()
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    model = load_xtts(Path(args.model_dir), Path(args.checkpoint), device=device)
+    latents = model.get_conditioning_latents(audio_path=args.reference, gpt_cond_len=30, gpt_cond_chunk_len=4,
+                                             max_ref_length=60)
+    texts = [t.split("?")[0] + "?" for ts in load_templates().values() for t in ts]
+
+    print("=" * 80)
+    print(f"🎟️  SYNTHESIS JOBS DEMO ({args.bulk} bulk, {args.interactive} interactive)")
+    print("=" * 80)
+    stats = asyncio.run(_demo(inference_backend(model, {"default": latents}), texts[:args.bulk],
+                              texts[-args.interactive:], {"temperature": 0.35}))
+    print_stats(stats)
+
+
+if __name__ == "__main__":
+    main()
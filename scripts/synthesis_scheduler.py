@@ -0,0 +1,361 @@
+"""
+Synthesis Scheduler - Dynamic Micro-Batching Around a Loaded XTTS Model
+=======================================================================
+Concurrent callers submit texts and get futures back. A single scheduler
+thread owns the model:
+- requests arriving within a short window (window_ms) are collected, up to
+  max_batch, and grouped by speaker profile + sampling parameters
+- each group runs the autoregressive GPT decoding as ONE batched generate
+  call (the expensive part); texts are right-padded with the stop-text token
+- the GPT latent pass and the HiFi-GAN decoder then run per request, and each
+  future is resolved as soon as its own audio is ready
+- queue depth, batch size distribution and p50/p99 latency (submit -> audio)
+  are exposed through stats()
+
+Batched sampling gives different (not worse) random draws than one-at-a-time
+inference; the stop-token padding is only seen by the shorter texts of a batch.
+
+Usage:
+  scheduler = MicroBatchScheduler(model, window_ms=25, max_batch=8)
+  scheduler.add_profile("vago", latents=(gpt_cond_latent, speaker_embedding))
+  future = scheduler.submit("Melyik ország fővárosa Budapest?", profile="vago", temperature=0.35)
+  wav = future.result()
+  print(scheduler.stats())
+
+Benchmark (serial model.inference loop vs the scheduler, N concurrent clients):
+  python scripts/synthesis_scheduler.py benchmark --clients 8 --requests 32
+"""
+
+import argparse
+import queue
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import torch
+import torch.nn.functional as F
+
+from conditioning import compute_conditioning_latents
+from sentence_synthesis import make_prefix_thread_local
+
+DEFAULT_PARAMS = {
+    "temperature": 0.75,
+    "length_penalty": 1.0,
+    "repetition_penalty": 10.0,
+    "top_k": 50,
+    "top_p": 0.85,
+    "speed": 1.0,
+}
+LATENCY_WINDOW = 10000  # latencies kept for the percentiles
+
+
+@dataclass
+class SynthesisRequest:
+    text: str
+    profile: str
+    params: tuple  # sorted (name, value) pairs - part of the batching key
+    future: Future = field(default_factory=Future)
+    submitted: float = field(default_factory=time.perf_counter)
+
+
+# ----------------------------------------
+# Batched inference
+# ----------------------------------------
+
+@torch.inference_mode()
+def generate_codes(model, texts, language, gpt_cond_latent, temperature, length_penalty, repetition_penalty,
+                   top_k, top_p):
+    """One GPT generate call for several texts; returns (token lists, codes (batch, T))"""
+    device = model.device
+    tokens = [model.tokenizer.encode(text.strip().lower(), lang=language) for text in texts]
+    text_inputs = torch.full((len(tokens), max(len(t) for t in tokens)), model.gpt.stop_text_token,
+                             dtype=torch.int32, device=device)
+    for i, t in enumerate(tokens):
+        text_inputs[i, :len(t)] = torch.tensor(t, dtype=torch.int32)
+    codes = model.gpt.generate(
+        cond_latents=gpt_cond_latent.to(device).expand(len(tokens), -1, -1),
+        text_inputs=text_inputs,
+        input_tokens=None,
+        do_sample=True,
+        top_p=top_p,
+        top_k=top_k,
+        temperature=temperature,
+        num_return_sequences=1,
+        num_beams=1,
+        length_penalty=length_penalty,
+        repetition_penalty=repetition_penalty,
+        output_attentions=False,
+    )
+    return tokens, codes
+
+
+@torch.inference_mode()
+def decode_codes(model, tokens, codes, gpt_cond_latent, speaker_embedding, speed=1.0):
+    """GPT latents + HiFi-GAN for one request of a batch (as in Xtts.inference)"""
+    device = model.device
+    stop = (codes == model.gpt.stop_audio_token).nonzero()
+    if len(stop):
+        codes = codes[: int(stop[0]) + 1]  # batch padding after the stop token
+    codes = codes.unsqueeze(0)
+    text_tokens = torch.tensor(tokens, dtype=torch.int32, device=device).unsqueeze(0)
+    gpt_cond_latent = gpt_cond_latent.to(device)
+    latents = model.gpt(
+        text_tokens,
+        torch.tensor([text_tokens.shape[-1]], device=device),
+        codes,
+        torch.tensor([codes.shape[-1] * model.gpt.code_stride_len], device=device),
+        cond_latents=gpt_cond_latent,
+        return_attentions=False,
+        return_latent=True,
+    )
+    length_scale = 1.0 / max(speed, 0.05)
+    if length_scale != 1.0:
+        latents = F.interpolate(latents.transpose(1, 2), scale_factor=length_scale, mode="linear").transpose(1, 2)
+    return model.hifigan_decoder(latents, g=speaker_embedding.to(device)).cpu().squeeze().numpy()
+
+
+# ----------------------------------------
+# Scheduler
+# ----------------------------------------
+
+class MicroBatchScheduler:
+    """Collects concurrent requests into batches for one loaded model"""
+
+    def __init__(self, model, language="hu", window_ms=20, max_batch=8, params=None):
+        self.model = make_prefix_thread_local(model)
+        self.language = language
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.params = {**DEFAULT_PARAMS, **(params or {})}
+        self.profiles = {}
+        self._queue = queue.Queue()
+        self._closed = False
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._batch_sizes = Counter()
+        self._max_queue_depth = 0
+        self._completed = 0
+        self._failed = 0
+        self._busy_seconds = 0.0
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="synthesis-scheduler", daemon=True)
+        self._thread.start()
+
+    def add_profile(self, name, references=None, latents=None):
+        """Register a speaker profile from reference WAVs or precomputed (gpt_cond_latent, speaker_embedding)"""
+        if latents is None:
+            latents = compute_conditioning_latents(
+                self.model, [str(r) for r in references], gpt_cond_len=30, gpt_cond_chunk_len=4, max_ref_length=60)
+        self.profiles[name] = latents
+        return latents
+
+    def submit(self, text, profile="default", **params):
+        """Queue a text; the future resolves to a float32 numpy waveform (24 kHz)"""
+        if self._closed:
+            raise RuntimeError("scheduler is closed")
+        if profile not in self.profiles:
+            raise KeyError(f"unknown speaker profile: {profile}")
+        unknown = set(params) - set(DEFAULT_PARAMS)
+        if unknown:
+            raise TypeError(f"unsupported parameters: {', '.join(sorted(unknown))}")
+        request = SynthesisRequest(text, profile, tuple(sorted({**self.params, **params}.items())))
+        self._queue.put(request)
+        with self._lock:
+            self._max_queue_depth = max(self._max_queue_depth, self._queue.qsize())
+        return request.future
+
+    def synthesize(self, text, profile="default", **params):
+        return self.submit(text, profile, **params).result()
+
+    # ---------- scheduler thread ----------
+
+    def _collect(self):
+        """Block for the first request, then gather more until the window closes or the batch is full"""
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                self._queue.put(None)  # let the loop see the shutdown after this batch
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            groups = {}
+            for request in batch:
+                groups.setdefault((request.profile, request.params), []).append(request)
+            for (profile, params), requests in groups.items():
+                self._run_group(profile, dict(params), requests)
+
+    def _run_group(self, profile, params, requests):
+        start = time.perf_counter()
+        gpt_cond_latent, speaker_embedding = self.profiles[profile]
+        speed = params.pop("speed")
+        with self._lock:
+            self._batch_sizes[len(requests)] += 1
+        try:
+            tokens, codes = generate_codes(self.model, [r.text for r in requests], self.language,
+                                           gpt_cond_latent, **params)
+        except Exception as e:
+            for request in requests:
+                request.future.set_exception(e)
+            self._finish(requests, start, failed=True)
+            return
+        for i, request in enumerate(requests):
+            try:
+                wav = decode_codes(self.model, tokens[i], codes[i], gpt_cond_latent, speaker_embedding, speed)
+            except Exception as e:
+                request.future.set_exception(e)
+                self._finish([request], None, failed=True)
+                continue
+            request.future.set_result(wav)  # resolved now, not when the whole batch is done
+            self._finish([request], None)
+        with self._lock:
+            self._busy_seconds += time.perf_counter() - start
+
+    def _finish(self, requests, start, failed=False):
+        now = time.perf_counter()
+        with self._lock:
+            for request in requests:
+                if failed:
+                    self._failed += 1
+                else:
+                    self._completed += 1
+                    self._latencies.append(now - request.submitted)
+            if start is not None:
+                self._busy_seconds += now - start
+
+    # ---------- stats ----------
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            sizes = dict(sorted(self._batch_sizes.items()))
+            batches = sum(sizes.values())
+
+            def percentile(q):
+                return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))], 3) if latencies else None
+
+            elapsed = time.perf_counter() - self._started
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self._max_queue_depth,
+                "completed": self._completed,
+                "failed": self._failed,
+                "batches": batches,
+                "batch_sizes": sizes,
+                "mean_batch_size": round(sum(k * v for k, v in sizes.items()) / batches, 2) if batches else None,
+                "latency_p50_s": percentile(0.50),
+                "latency_p99_s": percentile(0.99),
+                "utilization": round(self._busy_seconds / elapsed, 3) if elapsed > 0 else 0.0,
+            }
+
+    def close(self):
+        """Finish the queued requests and stop the scheduler thread"""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def print_stats(stats):
+    print(f"   • Requests: {stats['completed']} done, {stats['failed']} failed, "
+          f"queue depth {stats['queue_depth']} (max {stats['max_queue_depth']})")
+    print(f"   • Batches: {stats['batches']}, mean size {stats['mean_batch_size']}, "
+          f"sizes {stats['batch_sizes']}")
+    print(f"   • Latency: p50 {stats['latency_p50_s']}s, p99 {stats['latency_p99_s']}s, "
+          f"utilization {stats['utilization']:.0%}")
+
+
+# ----------------------------------------
+# Benchmark
+# ----------------------------------------
+
+def _run_clients(clients, texts, call):
+    """Every client sends its share of texts one after another; returns (wall, latencies)"""
+    latencies = []
+    lock = threading.Lock()
+
+    def client(share):
+        for text in share:
+            start = time.perf_counter()
+            call(text)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(clients) as pool:
+        list(pool.map(client, [texts[i::clients] for i in range(clients)]))
+    return time.perf_counter() - start, sorted(latencies)
+
+
+def main():
+    from question_bank import load_templates
+    from sentence_synthesis import load_xtts
+
+    parser = argparse.ArgumentParser(description="Micro-batching synthesis scheduler")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench = sub.add_parser("benchmark", help="Serial inference loop vs micro-batching under concurrent clients")
+    bench.add_argument("--model-dir", required=True)
+    bench.add_argument("--checkpoint", required=True)
+    bench.add_argument("--reference", required=True, nargs="+", help="Speaker reference WAV(s)")
+    bench.add_argument("--clients", type=int, default=8)
+    bench.add_argument("--requests", type=int, default=32)
+    bench.add_argument("--window-ms", type=float, default=25)
+    bench.add_argument("--max-batch", type=int, default=8)
+    args = parser.parse_args()
+
+    import audio_io
+    audio_io.install()
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    model = load_xtts(Path(args.model_dir), Path(args.checkpoint), device=device)
+    texts = [t.split("?")[0] + "?" for ts in load_templates().values() for t in ts]
+    texts = (texts * (args.requests // len(texts) + 1))[:args.requests]
+
+    print("=" * 80)
+    print(f"🧮 MICRO-BATCHING BENCHMARK ({args.clients} clients, {args.requests} requests, {device.upper()})")
+    print("=" * 80)
+    with MicroBatchScheduler(model, window_ms=args.window_ms, max_batch=args.max_batch) as scheduler:
+        latents = scheduler.add_profile("default", references=args.reference)
+        serial_lock = threading.Lock()
+
+        def serial(text):
+            with serial_lock:  # one-at-a-time model.inference loop
+                model.inference(text, "hu", *latents, **DEFAULT_PARAMS)
+
+        results = {"serial": _run_clients(args.clients, texts, serial),
+                   "micro-batched": _run_clients(args.clients, texts, scheduler.synthesize)}
+        print(f"{'Mode':<16}{'req/s':>8}{'p50 s':>9}{'p99 s':>9}")
+        for name, (wall, latencies) in results.items():
+            p50 = latencies[len(latencies) // 2]
+            p99 = latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))]
+            print(f"{name:<16}{len(latencies) / wall:>8.2f}{p50:>9.2f}{p99:>9.2f}")
+        print()
+        print_stats(scheduler.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,548 @@
+"""
+Text Frontend - Hungarian Text Normalization Before Inference
+=============================================================
+Runs ahead of model.inference so the model always gets the same spoken form
+no matter how a question was typed:
+- foreign names through a phonetic lexicon (lexicon/hu_foreign_names.tsv),
+  matched on a word trie, longest entry first and case-insensitively:
+  "George Washington" -> "Dzsórdzsz Vósingtön", "Mozarttal" -> "Móczárttal"
+- Hungarian numbers spelled out by rule: 1914 -> ezerkilencszáztizennégy,
+  2002 -> kétezer-kettő, 1914-ben -> ezerkilencszáztizennégyben,
+  12,5 -> tizenkét egész öt tized, 50% -> ötven százalék, 12,5% -> tizenkét
+  egész öt tized százalék, 10 000 -> tízezer (space-grouped thousands)
+- két before a word, kettő on its own: 2 alma -> két alma, but 2 és 3 -> kettő
+  és három
+- times: 12.30-kor / 12:30-kor -> tizenkét óra harminckor, 8:00 -> nyolc óra
+- ordinals (15. század -> tizenötödik század) and dates
+  (2025.10.09. / 2025. október 9. -> kétezer-huszonöt október kilencedike,
+  október 9-én -> október kilencedikén)
+- a spelled-out number at the start of a sentence is capitalized when the
+  original token was (or was a digit): "5 fő" -> "Öt fő", but a lower-case
+  fragment such as "október 1-jén" stays lower-case
+- results are memoized; every call reports which tokens changed
+
+Anything not matched (e.g. numbers with vowel-initial suffixes like 3-at) is
+left to the XTTS tokenizer's own cleaners.
+
+Usage:
+  from text_frontend import TextFrontend
+  frontend = TextFrontend.load()
+  text = frontend.normalize("Ki volt George Washington 1789-ben?")
+
+  python scripts/text_frontend.py normalize "1914. július 28-án tört ki."
+  python scripts/text_frontend.py manifest questions.jsonl --output questions_normalized.jsonl
+  python scripts/text_frontend.py benchmark --count 100000
+  python scripts/text_frontend.py check        # known inputs -> expected spoken forms
+"""
+
+import argparse
+import csv
+import functools
+import json
+import random
+import re
+import time
+from collections import Counter
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+LEXICON_PATH = PROJECT_ROOT / "lexicon" / "hu_foreign_names.tsv"
+CACHE_SIZE = 1 << 17
+
+# ----------------------------------------
+# Numbers
+# ----------------------------------------
+
+UNITS = ["", "egy", "kettő", "három", "négy", "öt", "hat", "hét", "nyolc", "kilenc"]
+UNITS_BEFORE_SCALE = ["", "egy", "két", "három", "négy", "öt", "hat", "hét", "nyolc", "kilenc"]  # kétszáz, kétezer
+TENS = ["", "tíz", "húsz", "harminc", "negyven", "ötven", "hatvan", "hetven", "nyolcvan", "kilencven"]
+TENS_WITH_UNITS = ["", "tizen", "huszon", "harminc", "negyven", "ötven", "hatvan", "hetven", "nyolcvan", "kilencven"]
+SCALES = ["", "ezer", "millió", "milliárd", "billió"]
+
+ORDINAL_ENDINGS = sorted({
+    "egy": "egyedik", "kettő": "kettedik", "három": "harmadik", "négy": "negyedik", "öt": "ötödik",
+    "hat": "hatodik", "hét": "hetedik", "nyolc": "nyolcadik", "kilenc": "kilencedik", "tíz": "tizedik",
+    "húsz": "huszadik", "harminc": "harmincadik", "negyven": "negyvenedik", "ötven": "ötvenedik",
+    "hatvan": "hatvanadik", "hetven": "hetvenedik", "nyolcvan": "nyolcvanadik", "kilencven": "kilencvenedik",
+    "száz": "századik", "ezer": "ezredik", "millió": "milliomodik", "milliárd": "milliárdodik",
+    "billió": "billiomodik",
+}.items(), key=lambda item: -len(item[0]))
+
+MONTHS = ["január", "február", "március", "április", "május", "június", "július", "augusztus", "szeptember",
+          "október", "november", "december"]
+FRACTIONS = {1: "tized", 2: "század", 3: "ezred"}
+
+
+def _below_thousand(n, before_scale):
+    hundreds, rest = divmod(n, 100)
+    words = ""
+    if hundreds:
+        words += ("" if hundreds == 1 else UNITS_BEFORE_SCALE[hundreds]) + "száz"
+    tens, unit = divmod(rest, 10)
+    if tens:
+        words += (TENS_WITH_UNITS if unit else TENS)[tens]
+    if unit:
+        words += (UNITS_BEFORE_SCALE if before_scale else UNITS)[unit]
+    return words
+
+
+def number_to_words(n, attributive=False):
+    """
+    Hungarian cardinal: 1914 -> ezerkilencszáztizennégy, 2002 -> kétezer-kettő.
+    attributive: the form before a noun, 2 alma -> két alma, 12 fő -> tizenkét fő
+    """
+    if attributive:
+        words = number_to_words(n)
+        return words[:-len("kettő")] + "két" if words.endswith("kettő") else words
+    if n == 0:
+        return "nulla"
+    if n < 0:
+        return "mínusz " + number_to_words(-n)
+    groups = []
+    while n and len(groups) < len(SCALES):
+        n, group = divmod(n, 1000)
+        groups.append(group)
+    if n:
+        return " ".join(UNITS[int(d)] or "nulla" for d in str(n * 1000 ** len(SCALES) + sum(
+            g * 1000 ** i for i, g in enumerate(groups))))  # beyond billió: digit by digit
+    parts = []
+    for scale in range(len(groups) - 1, -1, -1):
+        group = groups[scale]
+        if not group:
+            continue
+        if group == 1 and scale == 1 and len(groups) == 2:
+            parts.append("ezer")  # 1000-1999: ezer, not egyezer
+        else:
+            parts.append(_below_thousand(group, before_scale=scale > 0) + SCALES[scale])
+    value = sum(g * 1000 ** i for i, g in enumerate(groups))
+    # Above 2000 the thousand groups are hyphenated: kétezer-kettő, but ezerkilencszáz
+    return "-".join(parts) if value > 2000 else "".join(parts)
+
+
+def ordinal_to_words(n):
+    """1 -> első, 2 -> második, 15 -> tizenötödik, 1000 -> ezredik"""
+    if n == 1:
+        return "első"
+    if n == 2:
+        return "második"
+    words = number_to_words(n)
+    for ending, ordinal in ORDINAL_ENDINGS:
+        if words.endswith(ending):
+            return words[: -len(ending)] + ordinal
+    return words + "-adik"
+
+
+def day_to_words(n, suffix=""):
+    """Day of month: 9 -> kilencedike, with suffix 'én' -> kilencedikén, 1 + 'jén' -> elsején"""
+    ordinal = {1: "elseje", 2: "másodika"}.get(n)
+    if ordinal is None:
+        base = ordinal_to_words(n)
+        ordinal = base + ("a" if base.endswith(("adik", "odik")) else "e")
+    if not suffix:
+        return ordinal
+    # The written suffix may or may not repeat the possessive: 9-én, 9-ig, 1-jén, 1-jétől
+    rest = re.sub(r"^j?[áé]?", "", suffix)
+    return ordinal[:-1] + ("á" if ordinal.endswith("a") else "é") + rest
+
+
+# ----------------------------------------
+# Lexicon trie
+# ----------------------------------------
+
+# Case endings that may follow a name without a hyphen (Mozarttal, Shakespeare-rel)
+NAME_SUFFIXES = tuple(sorted({
+    "nak", "nek", "ban", "ben", "ba", "be", "ra", "re", "ról", "ről", "tól", "től", "ból", "ből", "hoz", "hez",
+    "höz", "nál", "nél", "val", "vel", "tal", "tel", "ral", "rel", "ért", "ig", "ként", "t", "ot", "et", "öt",
+    "at", "on", "en", "ön", "n", "é", "ék", "ja", "je", "jának", "jének",
+}, key=len, reverse=True))
+
+WORD = re.compile(r"[^\W\d_]+(?:['’][^\W\d_]+)*")
+
+
+def load_lexicon(path=LEXICON_PATH):
+    """{source: spoken} from a TSV file (# comments allowed)"""
+    entries = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.rstrip("\n")
+            if not line.strip() or line.lstrip().startswith("#"):
+                continue
+            source, sep, spoken = line.partition("\t")
+            if not sep or not spoken.strip():
+                raise ValueError(f"{Path(path).name}:{line_no}: expected 'source<TAB>spoken'")
+            entries[source.strip()] = spoken.strip()
+    return entries
+
+
+def build_trie(entries):
+    """Word trie: {word: {word: ..., None: spoken}} with lower-cased keys"""
+    root = {}
+    for source, spoken in entries.items():
+        node = root
+        for word in WORD.findall(source.lower()):
+            node = node.setdefault(word, {})
+        node[None] = spoken
+    return root
+
+
+# ----------------------------------------
+# Frontend
+# ----------------------------------------
+
+_MONTHS = "|".join(MONTHS)
+_SUFFIX = r"[a-záéíóöőúüű]+"
+# After a number these keep the standalone form: 2 és 3 -> kettő és három
+STANDALONE_BEFORE = {"és", "vagy", "meg", "is", "sem", "se", "plusz", "mínusz", "szor", "per"}
+NEXT_WORD = re.compile(r"\s+([^\W\d_]+)")
+# 10 000 / 1 250 000 (plain, no-break or narrow no-break spaces) - joined before the rules run
+GROUPED_NUMBER = re.compile(r"\b\d{1,3}(?:[ \u00a0\u202f]\d{3})+\b")
+NUMBER_RULES = [
+    # 2025.10.09. / 2025. 10. 09.
+    ("date", re.compile(r"\b(\d{4})\.\s?(\d{1,2})\.\s?(\d{1,2})\b\.?")),
+    # (2025.) október 9. / október 9-én
+    ("date", re.compile(rf"(?:\b(\d{{4}})\.?\s+)?\b({_MONTHS})\s+(\d{{1,2}})(?:\.|-({_SUFFIX}))?", re.IGNORECASE)),
+    # 12.30-kor / 8:05 (hour 0-23, two-digit minutes)
+    ("time", re.compile(rf"(?<![\d.,:])\b([01]?\d|2[0-3])[.:]([0-5]\d)\b(?![.:,]\d)(?:-({_SUFFIX}))?")),
+    ("decimal", re.compile(r"\b(\d+),(\d{1,3})\b(\s?%)?")),
+    ("percent", re.compile(r"\b(\d+)\s?%")),
+    # 15. század (an ordinal is followed by a lower-case word)
+    ("ordinal", re.compile(r"\b(\d+)\.(?=\s+[a-záéíóöőúüű])")),
+    # 1914-ben, 5-ször (consonant-initial suffixes attach as they are)
+    ("number", re.compile(rf"\b(\d+)-([^\Waáeéiíoóöőuúüű\d_]{_SUFFIX}|[^\Waáeéiíoóöőuúüű\d_])\b")),
+    ("number", re.compile(r"(?<![\d,.])\b(\d+)\b(?![,.]\d|-\w)")),
+]
+SENTENCE_START = re.compile(r"(?:^|[.!?;:]\s+)$")
+
+
+class TextFrontend:
+    """Lexicon + number normalization with memoized results"""
+
+    def __init__(self, lexicon=None):
+        self.trie = build_trie(lexicon or {})
+        self.totals = Counter()
+        self._normalize_cached = functools.lru_cache(maxsize=CACHE_SIZE)(self._normalize)
+
+    @classmethod
+    def load(cls, path=LEXICON_PATH):
+        return cls(load_lexicon(path) if Path(path).exists() else {})
+
+    def normalize(self, text):
+        """Spoken form of text (memoized)"""
+        return self.normalize_with_changes(text)[0]
+
+    def normalize_with_changes(self, text):
+        """(spoken form, ((kind, count), ...)); also added to self.totals"""
+        result, changes = self._normalize_cached(text)
+        self.totals["texts"] += 1
+        if changes:
+            self.totals["changed_texts"] += 1
+            for kind, count in changes:
+                self.totals[kind] += count
+        return result, changes
+
+    def cache_info(self):
+        return self._normalize_cached.cache_info()
+
+    def _normalize(self, text):
+        changes = Counter()
+        text = self._apply_lexicon(text, changes)
+        if any(c.isdigit() for c in text):
+            text = GROUPED_NUMBER.sub(lambda m: re.sub(r"\D", "", m.group()), text)
+            for kind, pattern in NUMBER_RULES:
+                text = pattern.sub(lambda m, kind=kind: self._expand(kind, m, changes), text)
+        return text, tuple(sorted(changes.items()))
+
+    # ---------- lexicon ----------
+
+    def _strip_suffix(self, word, node):
+        """Entry word of node that `word` is followed by a case ending of (Mozarttal), or (None, "")"""
+        lower = word.lower()
+        for suffix in NAME_SUFFIXES:
+            if len(lower) > len(suffix) + 2 and lower.endswith(suffix):
+                child = node.get(lower[: -len(suffix)])
+                if child is not None and None in child:
+                    return child[None], word[-len(suffix):]
+        # -val/-vel and -vá/-vé assimilate to the last consonant: Twainnel, Mozarttá
+        for ending in ("al", "el", "á", "é"):
+            cut = len(ending) + 1
+            if lower.endswith(ending) and len(lower) > cut + 2 and lower[-cut] == lower[-cut - 1]:
+                child = node.get(lower[:-cut])
+                if child is not None and None in child:
+                    return child[None], word[-cut:]
+        return None, ""
+
+    def _longest_match(self, text, words, i):
+        """(last word index, spoken, suffix, end offset) of the longest entry starting at words[i]"""
+        node, match = self.trie, None
+        for j in range(i, len(words)):
+            if j > i and text[words[j - 1].end():words[j].start()] not in (" ", "-"):
+                break
+            word = words[j].group()
+            child = node.get(word.lower())
+            if child is None:
+                # Only names take a case ending; most words are rejected by the capital check
+                if j > i or word[:1].isupper():
+                    spoken, suffix = self._strip_suffix(word, node)
+                    if spoken is not None:
+                        match = (j, spoken, suffix, words[j].end())
+                break
+            if None in child:
+                match = (j, child[None], "", words[j].end())
+            node = child
+        if match is not None and not match[2]:
+            # A hyphenated ending (Shakespeare-rel) joins the spoken form directly
+            hyphen = re.match(r"-([^\W\d_]+)", text[match[3]:])
+            if hyphen:
+                match = (match[0] + 1, match[1], hyphen.group(1), match[3] + hyphen.end())
+        return match
+
+    def _apply_lexicon(self, text, changes):
+        if not self.trie:
+            return text
+        words = list(WORD.finditer(text))
+        out, last, i = [], 0, 0
+        while i < len(words):
+            match = self._longest_match(text, words, i)
+            if match is None:
+                i += 1
+                continue
+            end, spoken, suffix, end_pos = match
+            out.append(text[last:words[i].start()])
+            out.append(spoken + suffix)
+            changes["lexicon"] += end - i + 1
+            last = end_pos
+            i = end + 1
+        if not out:
+            return text
+        out.append(text[last:])
+        return "".join(out)
+
+    # ---------- numbers ----------
+
+    def _expand(self, kind, m, changes):
+        if kind == "date":
+            year, month, day, suffix = (m.groups() + (None,))[:4]
+            if month.isdigit():
+                month_number = int(month)
+                if not 1 <= month_number <= 12 or not 1 <= int(day) <= 31:
+                    return m.group()
+                month_name = MONTHS[month_number - 1]
+            else:
+                month_name = month.lower()
+            if not 1 <= int(day) <= 31:
+                return m.group()
+            words = [number_to_words(int(year))] if year else []
+            words += [month_name, day_to_words(int(day), suffix or "")]
+            changes["date"] += 1
+            spoken = " ".join(words)
+        elif kind == "time":
+            hour, minute, suffix = m.groups()
+            changes["time"] += 1
+            spoken = number_to_words(int(hour), attributive=True) + " óra"
+            if int(minute):
+                spoken += " " + number_to_words(int(minute)) + (suffix or "")
+            elif suffix:
+                # órakor, but órától / óráig
+                spoken = spoken[:-1] + ("a" if suffix == "kor" else "á") + suffix
+        elif kind == "decimal":
+            whole, fraction, percent = m.groups()
+            changes["number"] += 1
+            spoken = (f"{number_to_words(int(whole), attributive=True)} egész "
+                      f"{number_to_words(int(fraction), attributive=True)} "
+                      f"{FRACTIONS[len(fraction)]}" + (" százalék" if percent else ""))
+        elif kind == "percent":
+            changes["number"] += 1
+            spoken = number_to_words(int(m.group(1)), attributive=True) + " százalék"
+        elif kind == "ordinal":
+            changes["ordinal"] += 1
+            spoken = ordinal_to_words(int(m.group(1)))
+        elif m.lastindex == 2:
+            changes["number"] += 1
+            spoken = number_to_words(int(m.group(1))) + m.group(2)
+        else:
+            changes["number"] += 1
+            following = NEXT_WORD.match(m.string, m.end())
+            attributive = following is not None and following.group(1).lower() not in STANDALONE_BEFORE
+            spoken = number_to_words(int(m.group(1)), attributive=attributive)
+        first = m.group()[:1]
+        if (first.isdigit() or first.isupper()) and SENTENCE_START.search(m.string[:m.start()]):
+            spoken = spoken[:1].upper() + spoken[1:]
+        return spoken
+
+
+# ----------------------------------------
+# Manifests
+# ----------------------------------------
+
+def read_manifest(path):
+    """Yield (record, text): .txt (one text per line), .jsonl ("text" field) or pipe CSV with a text column"""
+    path = Path(path)
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        if path.suffix == ".jsonl":
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    yield record, record["text"]
+        elif path.suffix == ".csv":
+            for record in csv.DictReader(f, delimiter="|"):
+                yield record, record["text"]
+        else:
+            for line in f:
+                line = line.rstrip("\n")
+                if line.strip():
+                    yield line, line
+
+
+def normalize_manifest(frontend, path, output=None):
+    """Normalize every text of a manifest, writing the same format to output; returns the report"""
+    path = Path(path)
+    start = time.perf_counter()
+    out = None
+    writer = None
+    try:
+        if output is not None:
+            out = open(output, 'w', encoding='utf-8', newline='')
+        for record, text in read_manifest(path):
+            normalized = frontend.normalize(text)
+            if out is None:
+                continue
+            if path.suffix == ".jsonl":
+                out.write(json.dumps({**record, "text": normalized}, ensure_ascii=False) + "\n")
+            elif path.suffix == ".csv":
+                if writer is None:
+                    writer = csv.DictWriter(out, fieldnames=list(record), delimiter="|")
+                    writer.writeheader()
+                writer.writerow({**record, "text": normalized})
+            else:
+                out.write(normalized + "\n")
+    finally:
+        if out is not None:
+            out.close()
+    return report(frontend, time.perf_counter() - start)
+
+
+def report(frontend, seconds):
+    totals = frontend.totals
+    info = frontend.cache_info()
+    return {
+        "texts": totals["texts"],
+        "changed_texts": totals["changed_texts"],
+        "tokens_changed": {kind: totals[kind] for kind in ("lexicon", "number", "ordinal", "date", "time") if totals[kind]},
+        "seconds": round(seconds, 3),
+        "texts_per_sec": round(totals["texts"] / seconds) if seconds > 0 else None,
+        "cache_hits": info.hits,
+    }
+
+
+def print_report(result):
+    print(f"   • Texts: {result['texts']} ({result['changed_texts']} changed) in {result['seconds']:.2f}s "
+          f"({result['texts_per_sec']}/s, {result['cache_hits']} cache hits)")
+    changed = ", ".join(f"{kind} {count}" for kind, count in result["tokens_changed"].items()) or "none"
+    print(f"   • Tokens changed: {changed}")
+
+
+# Regression cases for the number rules: input -> spoken form (no lexicon involved)
+CHECK_CASES = [
+    ("1914-ben", "Ezerkilencszáztizennégyben"),
+    ("2002", "Kétezer-kettő"),
+    ("A 15. században", "A tizenötödik században"),
+    ("október 9-én", "október kilencedikén"),
+    ("2025.10.09.", "Kétezer-huszonöt október kilencedike"),
+    ("50% esély", "Ötven százalék esély"),
+    ("12,5", "Tizenkét egész öt tized"),
+    # decimal percentages keep the percent
+    ("12,5%", "Tizenkét egész öt tized százalék"),
+    ("Az infláció 3,25 % volt.", "Az infláció három egész huszonöt század százalék volt."),
+    # space-grouped thousands are one number
+    ("10 000 forint", "Tízezer forint"),
+    ("A díj 1 250 000 forint.", "A díj egymillió-kétszázötvenezer forint."),
+    ("10 000-ben", "Tízezerben"),
+    # only capitalized (or digit) sentence starts are capitalized
+    ("október 1-jén", "október elsején"),
+    ("Október 1-jén", "Október elsején"),
+    ("Vége. 3 alma", "Vége. Három alma"),
+    # két before a word, kettő on its own
+    ("2 alma és 2 körte", "Két alma és két körte"),
+    ("Hány lába van 2 kutyának?", "Hány lába van két kutyának?"),
+    ("12 fő", "Tizenkét fő"),
+    ("2 és 3", "Kettő és három"),
+    ("Az eredmény 2.", "Az eredmény kettő."),
+    ("2002 alma", "Kétezer-két alma"),
+    ("2% esély", "Két százalék esély"),
+    # times
+    ("12.30-kor", "Tizenkét óra harminckor"),
+    ("Indulás 8:05-kor.", "Indulás nyolc óra ötkor."),
+    ("22:00-tól", "Huszonkét órától"),
+    ("14.00-kor", "Tizennégy órakor"),
+]
+
+
+def run_checks(frontend=None):
+    """[(text, expected, got)] of the CHECK_CASES that fail"""
+    frontend = frontend or TextFrontend()
+    return [(text, expected, got) for text, expected in CHECK_CASES
+            if (got := frontend.normalize(text)) != expected]
+
+
+def synthetic_texts(count, seed=0):
+    """Question-like texts with names, years, dates and ordinals - mostly distinct"""
+    from question_bank import load_templates
+
+    rng = random.Random(seed)
+    templates = [t for texts in load_templates().values() for t in texts]
+    extras = ["Mozart {}-ben született?", "Ki nyert {}. október {}-én?", "A {}. században élt George Washington.",
+              "Mennyi {} és {} összege?", "Melyik napon volt {}.{:02d}.{:02d}.?"]
+    for i in range(count):
+        if i % 3 == 0:
+            yield rng.choice(templates)
+        else:
+            extra = rng.choice(extras)
+            yield extra.format(*(rng.randint(1, 2030) if j == 0 else rng.randint(1, 12)
+                                 for j in range(extra.count("{"))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hungarian text normalization")
+    parser.add_argument("--lexicon", default=str(LEXICON_PATH))
+    sub = parser.add_subparsers(dest="command", required=True)
+    norm = sub.add_parser("normalize", help="Normalize one text")
+    norm.add_argument("text")
+    manifest = sub.add_parser("manifest", help="Normalize a .txt / .jsonl / pipe .csv manifest")
+    manifest.add_argument("path")
+    manifest.add_argument("--output", help="Write the normalized manifest here (same format)")
+    bench = sub.add_parser("benchmark", help="Normalize synthetic question texts")
+    bench.add_argument("--count", type=int, default=100000)
+    sub.add_parser("check", help="Run the number-rule regression cases")
+    args = parser.parse_args()
+
+    if args.command == "check":
+        failures = run_checks()
+        for text, expected, got in failures:
+            print(f"❌ {text!r}: expected {expected!r}, got {got!r}")
+        print(f"{'✅' if not failures else '❌'} {len(CHECK_CASES) - len(failures)}/{len(CHECK_CASES)} cases passed")
+        raise SystemExit(1 if failures else 0)
+
+    frontend = TextFrontend.load(args.lexicon)
+    if args.command == "normalize":
+        text, changes = frontend.normalize_with_changes(args.text)
+        print(text)
+        print(f"   ({', '.join(f'{kind} {count}' for kind, count in changes) or 'unchanged'})")
+        return
+
+    print("=" * 80)
+    print("🔤 TEXT FRONTEND")
+    print("=" * 80)
+    if args.command == "manifest":
+        result = normalize_manifest(frontend, args.path, args.output)
+        if args.output:
+            print(f"✅ Wrote {args.output}")
+    else:
+        start = time.perf_counter()
+        for text in synthetic_texts(args.count):
+            frontend.normalize(text)
+        result = report(frontend, time.perf_counter() - start)
+    print_report(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,11 +6,23 @@ Target: Mel CE < 2.5 (excellent quality)
 
 import os
 from pathlib import Path
+
+import audio_io
+audio_io.install()  # soundfile instead of torchaudio/torchcodec (broken on Windows with PyTorch nightly)
+
 from trainer import Trainer, TrainerArgs
 from TTS.config.shared_configs import BaseDatasetConfig
 from TTS.tts.datasets import load_tts_samples
 from TTS.tts.layers.xtts.trainer.gpt_trainer import GPTArgs, GPTTrainer, GPTTrainerConfig, XttsAudioConfig
 
+from artifact_store import ArtifactStore
+from batch_size_finder import apply_batch_plan, find_batch_plan, print_batch_plan
+from checkpoint_writer import RetentionPolicy, install_async_checkpointing
+from delta_checkpoint import ensure_full_checkpoint
+from eval_service import monitor_eval_service, start_eval_service, stop_eval_service
+from training_metrics import ThroughputMonitor
+from training_options import describe_options, enable_gradient_checkpointing, parse_training_options, precision_config
+
 # Configuration
 OUTPUT_PATH = "run/training_combined_phase2"
 DATASET_PATH = "prepared_sources"  # Combined Milliomos + Blikk
@@ -18,9 +30,20 @@ RESUME_CHECKPOINT = "run/training_combined_phase2/XTTS_Combined_Phase2-October-0
 
 # Training parameters - PHASE 2 (more aggressive)
 BATCH_SIZE = 3  # Keep same for memory
+PRECISION = "fp32"  # "bf16" autocast (CUDA + modern CPUs) or "fp16" (CUDA) - override with --precision
+GRADIENT_CHECKPOINTING = False  # Recompute GPT activations in backward - override with --grad-checkpointing
 NUM_EPOCHS = 30  # Additional 30 epochs
 LEARNING_RATE = 1e-6  # Even lower for fine-tuning (was 1.5e-6)
 EVAL_SPLIT_SIZE = 0.15
+CHECKPOINT_MODE = "delta"  # "delta": GPT weights + optimizer only (base = RESUME_CHECKPOINT), "full": whole model
+EVAL_SERVICE = True  # Score checkpoints on the holdout set in a separate process (eval_leaderboard.json)
+EVAL_SERVICE_DEVICE = "cpu"  # Keep the GPU for training
+
+# Command-line overrides (--precision, --grad-checkpointing, --batch-size)
+OPTIONS = parse_training_options(BATCH_SIZE, PRECISION, GRADIENT_CHECKPOINTING, description="Phase 2 training")
+BATCH_SIZE = OPTIONS.batch_size
+AUTO_BATCH_SIZE = True  # Probe the largest batch that fits, reach EFFECTIVE_BATCH_SIZE with gradient accumulation
+EFFECTIVE_BATCH_SIZE = BATCH_SIZE  # Samples per optimizer step
 
 print("=" * 70)
 print("🎯 COMBINED TRAINING - PHASE 2 (RESUMED)")
@@ -38,6 +61,7 @@ print(f"   • Learning Rate: {LEARNING_RATE} (ultra-low for fine refinement)")
 print(f"   • Additional Epochs: {NUM_EPOCHS}")
 print(f"   • Focus: Ultra-smooth audio (Mel CE)")
 print(f"   • Auto-cleanup: Enabled (saves disk space)")
+print(f"   • Memory/speed: {describe_options(OPTIONS)}")
 print()
 print("=" * 70)
 print()
@@ -49,36 +73,19 @@ if not Path(RESUME_CHECKPOINT).exists():
     exit(1)
 
 print(f"✅ Found checkpoint: {Path(RESUME_CHECKPOINT).name}")
+RESTORE_PATH = str(ensure_full_checkpoint(RESUME_CHECKPOINT))
 print()
 
 # RUN_NAME for this session
 RUN_NAME = "XTTS_Combined_Phase2"
 
-# DVAE checkpoint
-DVAE_CHECKPOINT_LINK = "https://coqui.gateway.scarf.sh/hf-coqui/XTTS-v2/main/dvae.pth"
-MEL_NORM_LINK = "https://coqui.gateway.scarf.sh/hf-coqui/XTTS-v2/main/mel_stats.pth"
-
-# Download manager
-CHECKPOINTS_OUT_PATH = Path("models/")
-CHECKPOINTS_OUT_PATH.mkdir(parents=True, exist_ok=True)
-
-def download_if_needed(url, filename):
-    filepath = CHECKPOINTS_OUT_PATH / filename
-    if not filepath.exists():
-        print(f"   Downloading {filename}...")
-        import requests
-        response = requests.get(url)
-        filepath.write_bytes(response.content)
-        print(f"   ✅ Downloaded: {filename}")
-    else:
-        print(f"   ✅ Found: {filename}")
-    return str(filepath)
-
-# Download if needed
+# XTTS base files (DVAE, mel stats, tokenizer) - streamed + sha256-verified, see artifact_store.py
 print("📥 Checking DVAE checkpoint...")
-
-DVAE_CHECKPOINT = download_if_needed(DVAE_CHECKPOINT_LINK, "dvae.pth")
-MEL_NORM_FILE = download_if_needed(MEL_NORM_LINK, "mel_stats.pth")
+store = ArtifactStore()
+DVAE_CHECKPOINT = str(store.path("dvae.pth"))
+MEL_NORM_FILE = str(store.path("mel_stats.pth"))
+TOKENIZER_FILE = str(store.path("vocab.json"))
+print("   ✅ dvae.pth, mel_stats.pth, vocab.json")
 
 print()
 
@@ -92,9 +99,6 @@ config_dataset = BaseDatasetConfig(
     language="hu",
 )
 
-# Model paths from original training
-model_path = "C:\\Users\\szolzol\\AppData\\Local\\tts\\tts_models--multilingual--multi-dataset--xtts_v2"
-
 # Audio config
 audio_config = XttsAudioConfig(sample_rate=22050, dvae_sample_rate=22050, output_sample_rate=24000)
 
@@ -109,7 +113,7 @@ model_args = GPTArgs(
     mel_norm_file=MEL_NORM_FILE,
     dvae_checkpoint=DVAE_CHECKPOINT,
     xtts_checkpoint=None,  # Will be loaded from resume
-    tokenizer_file=f"{model_path}\\vocab.json",
+    tokenizer_file=TOKENIZER_FILE,
     gpt_num_audio_tokens=1026,
     gpt_start_audio_token=1024,
     gpt_stop_audio_token=1025,
@@ -127,9 +131,11 @@ config = GPTTrainerConfig(
     dashboard_logger="tensorboard",
     logger_uri=None,
     audio=audio_config,
+    datasets=[config_dataset],  # Saved to config.json - eval_service.py rebuilds the holdout split from it
     batch_size=BATCH_SIZE,
     batch_group_size=0,
     eval_batch_size=BATCH_SIZE,
+    **precision_config(OPTIONS.precision),
     num_loader_workers=0,
     eval_split_max_size=256,
     eval_split_size=EVAL_SPLIT_SIZE,
@@ -143,8 +149,8 @@ config = GPTTrainerConfig(
     save_best_after=100,
     target_loss="loss",
     print_eval=True,
-    run_eval=True,
-    run_eval_steps=100,
+    run_eval=not EVAL_SERVICE,  # In-loop eval blocks training - eval_service.py scores checkpoints instead
+    run_eval_steps=None if EVAL_SERVICE else 100,
     test_sentences=[],
     
     # Phase 2: Ultra-low learning rate for fine refinement
@@ -172,15 +178,18 @@ print()
 print("🤖 Initializing model...")
 model = GPTTrainer.init_from_config(config)
 print("   ✅ Model initialized")
+if OPTIONS.gradient_checkpointing:
+    n_blocks = enable_gradient_checkpointing(model)
+    print(f"   ✅ Gradient checkpointing enabled ({n_blocks} GPT blocks)")
 print()
 
 # Trainer - will restore from checkpoint
 print("🎓 Setting up trainer (will restore from checkpoint)...")
 trainer = Trainer(
     TrainerArgs(
-        restore_path=RESUME_CHECKPOINT,  # Resume from Phase 1 checkpoint
+        restore_path=RESTORE_PATH,  # Resume from Phase 1 checkpoint
         skip_train_epoch=False,
-        start_with_eval=True,
+        start_with_eval=not EVAL_SERVICE,
         grad_accum_steps=1,
     ),
     config,
@@ -193,42 +202,22 @@ trainer = Trainer(
 print("   ✅ Checkpoint loaded successfully")
 print()
 
-# Add automatic checkpoint cleanup to save disk space
-print("🧹 Setting up automatic checkpoint cleanup...")
-original_save_checkpoint = trainer.save_checkpoint
-
-def save_checkpoint_with_cleanup():
-    """Save checkpoint and immediately cleanup old ones to save disk space"""
-    original_save_checkpoint()
-    
-    # Find and delete old checkpoints (keep only the latest)
-    from pathlib import Path
-    output_folder = Path(OUTPUT_PATH) / RUN_NAME
-    if output_folder.exists():
-        checkpoints = sorted(output_folder.glob("checkpoint_*.pth"))
-        # Keep only the most recent checkpoint
-        if len(checkpoints) > 1:
-            for old_checkpoint in checkpoints[:-1]:
-                try:
-                    size_mb = old_checkpoint.stat().st_size / (1024**2)
-                    old_checkpoint.unlink()
-                    print(f"  🗑️  Deleted old checkpoint: {old_checkpoint.name} ({size_mb:.0f} MB freed)")
-                except Exception as e:
-                    print(f"  ⚠️  Could not delete {old_checkpoint.name}: {e}")
-        
-        # Keep only the latest best_model (delete older best_model_*.pth files)
-        best_models = sorted(output_folder.glob("best_model_*.pth"))
-        if len(best_models) > 1:
-            for old_best in best_models[:-1]:
-                try:
-                    size_mb = old_best.stat().st_size / (1024**2)
-                    old_best.unlink()
-                    print(f"  🗑️  Deleted old best model: {old_best.name} ({size_mb:.0f} MB freed)")
-                except Exception as e:
-                    print(f"  ⚠️  Could not delete {old_best.name}: {e}")
+if AUTO_BATCH_SIZE:
+    print("📏 Finding the largest batch size that fits...")
+    batch_plan = find_batch_plan(trainer, train_samples, EFFECTIVE_BATCH_SIZE)
+    apply_batch_plan(trainer, batch_plan)
+    print_batch_plan(batch_plan)
+    print()
 
-trainer.save_checkpoint = save_checkpoint_with_cleanup
-print("   ✅ Automatic cleanup enabled (keeps only latest checkpoint + best model)")
+# Background checkpoint writer: saves no longer stop the training loop
+print("💾 Setting up background checkpoint writer...")
+checkpoint_writer = install_async_checkpointing(
+    trainer,
+    RetentionPolicy(keep_last=1, keep_best=1),
+    save_best_after=config.save_best_after,
+    delta_base=RESTORE_PATH if CHECKPOINT_MODE == "delta" else None,
+)
+print("   ✅ Async saves enabled (keeps only latest checkpoint + best model by Mel CE)")
 print()
 
 print()
@@ -253,8 +242,25 @@ print()
 print("=" * 70)
 print()
 
+throughput_monitor = ThroughputMonitor.install(
+    trainer,
+    settings=dict(vars(OPTIONS), phase="phase2"),
+    log_every=config.print_step,
+    step_log_path=Path(OUTPUT_PATH) / "step_times.jsonl",
+)
+eval_process = None
+if EVAL_SERVICE:
+    eval_process = start_eval_service(trainer.output_path, EVAL_SERVICE_DEVICE)
+    print(f"📊 Eval service started (PID {eval_process.pid}) - leaderboard: eval_leaderboard.json")
+    monitor_eval_service(trainer, eval_process)
+
 # Train!
 trainer.fit()
+checkpoint_writer.close()
+throughput_monitor.finish(Path(OUTPUT_PATH) / "throughput_log.jsonl")
+if eval_process is not None:
+    print("📊 Waiting for the eval service to score the last checkpoints...")
+    stop_eval_service(eval_process)
 
 print()
 print("=" * 70)
@@ -12,42 +12,13 @@ New dataset: 40 high-quality samples with distinct characteristics
 """
 
 import os
+import sys
 from pathlib import Path
 
-# ⚠️ CRITICAL FIX: Monkey-patch TTS load_audio to use soundfile instead of torchcodec
-# PyTorch nightly + torchcodec is broken on Windows, use soundfile directly
-import soundfile as sf
-import torch
-import numpy as np
-
-def load_audio_soundfile(audiopath, sample_rate=22050):
-    """Load audio using soundfile instead of torchaudio/torchcodec"""
-    audio, sr = sf.read(audiopath)
-    # Convert to torch tensor
-    audio = torch.FloatTensor(audio)
-    # Soundfile returns shape: (samples,) for mono or (samples, channels) for stereo
-    # We need shape: (channels, samples) for TTS compatibility
-    if audio.dim() == 1:
-        # Mono audio - add channel dimension: (samples,) -> (1, samples)
-        audio = audio.unsqueeze(0)
-    else:
-        # Stereo - transpose: (samples, channels) -> (channels, samples)
-        audio = audio.transpose(0, 1)
-        # Convert to mono by averaging channels
-        if audio.shape[0] > 1:
-            audio = audio.mean(dim=0, keepdim=True)
-    
-    # Resample if needed
-    if sr != sample_rate:
-        import torchaudio.transforms as T
-        resampler = T.Resample(sr, sample_rate)
-        audio = resampler(audio)
-    
-    return audio  # Shape: (1, samples) for mono audio
-
-# Monkey-patch the load_audio function in TTS
-import TTS.tts.models.xtts
-TTS.tts.models.xtts.load_audio = load_audio_soundfile
+# ⚠️ CRITICAL FIX: TTS load_audio uses torchaudio/torchcodec, which is broken on Windows
+# with PyTorch nightly - route all audio loading through soundfile (see audio_io.py)
+import audio_io
+audio_io.install()
 print("✅ Audio loading patched to use soundfile (avoiding torchcodec issues)")
 
 from trainer import Trainer, TrainerArgs
@@ -55,6 +26,18 @@ from TTS.config.shared_configs import BaseDatasetConfig
 from TTS.tts.datasets import load_tts_samples
 from TTS.tts.layers.xtts.trainer.gpt_trainer import GPTArgs, GPTTrainer, GPTTrainerConfig, XttsAudioConfig
 
+from build_training_index import EVAL_FILE_NAME, TRAIN_FILE_NAME, build_training_index, print_index_summary
+from artifact_store import ArtifactStore
+from batch_size_finder import apply_batch_plan, find_batch_plan, print_batch_plan
+from checkpoint_writer import RetentionPolicy, install_async_checkpointing
+from delta_checkpoint import ensure_full_checkpoint
+from distributed_training import barrier, broadcast_object, cleanup_distributed, init_distributed, install_distributed, print_reducer_report, shard_samples
+from early_stopping import EarlyStopping, StoppingPolicy
+from eval_service import monitor_eval_service, start_eval_service, stop_eval_service
+from training_metrics import ThroughputMonitor
+from training_options import describe_options, enable_gradient_checkpointing, parse_training_options, precision_config
+from gpt_lora import enable_lora_training, find_gpt2, save_adapter
+
 # Configuration
 OUTPUT_PATH = "run/training_phase4_continuation"
 DATASET_PATH = "dataset_phase4"  # New 40 selected samples
@@ -62,9 +45,39 @@ RESUME_CHECKPOINT = "run/training_combined_phase2/XTTS_Combined_Phase2-October-0
 
 # Training parameters - PHASE 4 (focused fine-tuning)
 BATCH_SIZE = 2  # Smaller batch for focused learning
+PRECISION = "fp32"  # "bf16" autocast (CUDA + modern CPUs) or "fp16" (CUDA) - override with --precision
+GRADIENT_CHECKPOINTING = False  # Recompute GPT activations in backward - override with --grad-checkpointing
 NUM_EPOCHS = 50  # Extended training for deeper learning
 LEARNING_RATE = 5e-7  # Very low for fine refinement from 2.971
-EVAL_SPLIT_SIZE = 0.15  # 15% for evaluation (~6 samples, ensures valid eval set)
+EVAL_SPLIT_SIZE = 0.15  # 15% for evaluation (~6 samples, never empty - see build_training_index.py)
+MAX_WAV_LENGTH = 530000  # ~24 seconds (increased for longer samples)
+MAX_TEXT_LENGTH = 400  # Increased for longer transcriptions
+CHECKPOINT_MODE = "delta"  # "delta": GPT weights + optimizer only (base = RESUME_CHECKPOINT), "full": whole model
+EVAL_SERVICE = True  # Score checkpoints on the holdout set in a separate process (eval_leaderboard.json)
+EVAL_SERVICE_DEVICE = "cpu"  # Keep the GPU for training
+EARLY_STOPPING = True  # Stop on target / Text CE guardrail / Mel CE plateau instead of always running NUM_EPOCHS
+TARGET_MEL_CE = 2.5
+TEXT_CE_LIMIT = 0.03
+PLATEAU_PATIENCE = 5  # Evaluations (saves, every save_step) without smoothed Mel CE improvement
+
+# Adapter mode: "lora" freezes the GPT and trains low-rank adapters only (see gpt_lora.py)
+TRAINING_MODE = "full"  # "full" or "lora"
+LORA_RANK = 8
+LORA_ALPHA = 16
+LORA_LEARNING_RATE = 1e-4  # Adapters start at zero - they need a much higher LR than full fine-tuning
+
+# Command-line overrides (--precision, --grad-checkpointing, --batch-size)
+OPTIONS = parse_training_options(BATCH_SIZE, PRECISION, GRADIENT_CHECKPOINTING, description="Phase 4 training")
+BATCH_SIZE = OPTIONS.batch_size
+AUTO_BATCH_SIZE = True  # Probe the largest batch that fits, reach EFFECTIVE_BATCH_SIZE with gradient accumulation
+EFFECTIVE_BATCH_SIZE = BATCH_SIZE  # Samples per optimizer step
+
+# Data-parallel mode when launched with torchrun (gloo, see distributed_training.py)
+DIST = init_distributed()
+IS_MAIN = DIST is None or DIST.is_main
+WORLD_SIZE = DIST.world_size if DIST else 1
+if not IS_MAIN:
+    sys.stdout = open(os.devnull, "w", encoding="utf-8")  # rank 0 does the talking
 
 print("=" * 80)
 print("🎯 PHASE 4 TRAINING - CONTINUATION FROM CHECKPOINT 1901")
@@ -84,6 +97,9 @@ print("🔧 Phase 4 Configuration:")
 print(f"   • Resuming from: best_model_1901.pth")
 print(f"   • Learning Rate: {LEARNING_RATE} (ultra-low)")
 print(f"   • Batch Size: {BATCH_SIZE} (focused learning)")
+print(f"   • Memory/speed: {describe_options(OPTIONS)}")
+if DIST:
+    print(f"   • Data parallel: {WORLD_SIZE} processes x batch {BATCH_SIZE} = global batch {WORLD_SIZE * BATCH_SIZE}")
 print(f"   • Epochs: {NUM_EPOCHS}")
 print(f"   • Focus: Mel CE improvement + prosody diversity")
 print()
@@ -97,6 +113,13 @@ if not Path(RESUME_CHECKPOINT).exists():
     exit(1)
 
 print(f"✅ Found checkpoint: {Path(RESUME_CHECKPOINT).name}")
+# A delta checkpoint can't be restored by the Trainer directly - rebuild it once (rank 0 only)
+if IS_MAIN:
+    ensure_full_checkpoint(RESUME_CHECKPOINT)
+barrier(DIST)
+RESTORE_PATH = str(ensure_full_checkpoint(RESUME_CHECKPOINT))
+if RESTORE_PATH != RESUME_CHECKPOINT:
+    print(f"   ✅ Delta materialized: {Path(RESTORE_PATH).name}")
 print()
 
 # Verify dataset exists
@@ -105,7 +128,7 @@ if not Path(DATASET_PATH).exists():
     print(f"   Looking for: {DATASET_PATH}")
     print()
     print("💡 Run this first:")
-    print("   python scripts/prepare_phase4_dataset.py")
+    print("   python scripts/build_phase4_dataset.py")
     exit(1)
 
 print(f"✅ Found dataset: {DATASET_PATH}")
@@ -114,47 +137,46 @@ print()
 # RUN_NAME for this session
 RUN_NAME = "XTTS_Phase4_Continuation"
 
-# DVAE checkpoint
-DVAE_CHECKPOINT_LINK = "https://coqui.gateway.scarf.sh/hf-coqui/XTTS-v2/main/dvae.pth"
-MEL_NORM_LINK = "https://coqui.gateway.scarf.sh/hf-coqui/XTTS-v2/main/mel_stats.pth"
-
-# Download manager
-CHECKPOINTS_OUT_PATH = Path("models/")
-CHECKPOINTS_OUT_PATH.mkdir(parents=True, exist_ok=True)
-
-def download_if_needed(url, filename):
-    filepath = CHECKPOINTS_OUT_PATH / filename
-    if not filepath.exists():
-        print(f"   Downloading {filename}...")
-        import requests
-        response = requests.get(url)
-        filepath.write_bytes(response.content)
-        print(f"   ✅ Downloaded: {filename}")
-    else:
-        print(f"   ✅ Found: {filename}")
-    return str(filepath)
-
-# Download if needed
+# XTTS base files (DVAE, mel stats, tokenizer) - streamed + sha256-verified, see artifact_store.py
 print("📥 Checking DVAE checkpoint...")
+if IS_MAIN:
+    for name in ("dvae.pth", "mel_stats.pth", "vocab.json"):
+        ArtifactStore().path(name)  # rank 0 downloads, the others read the store afterwards
+barrier(DIST)
+store = ArtifactStore()
+DVAE_CHECKPOINT = str(store.path("dvae.pth"))
+MEL_NORM_FILE = str(store.path("mel_stats.pth"))
+TOKENIZER_FILE = str(store.path("vocab.json"))
+print("   ✅ dvae.pth, mel_stats.pth, vocab.json")
 
-DVAE_CHECKPOINT = download_if_needed(DVAE_CHECKPOINT_LINK, "dvae.pth")
-MEL_NORM_FILE = download_if_needed(MEL_NORM_LINK, "mel_stats.pth")
+print()
 
+# Length/token pre-pass: the loader would silently drop these samples later
+print("📇 Building training index (length + token filtering)...")
+if IS_MAIN:
+    training_index = build_training_index(
+        DATASET_PATH,
+        TOKENIZER_FILE,
+        max_wav_length=MAX_WAV_LENGTH,
+        max_text_length=MAX_TEXT_LENGTH,
+        eval_split_size=EVAL_SPLIT_SIZE,
+        language="hu",
+    )
+    print_index_summary(training_index)
+barrier(DIST)  # other ranks read the index files written by rank 0
 print()
 
-# Dataset configuration
+# Dataset configuration - only samples that pass the index
 print("📂 Loading dataset...")
 config_dataset = BaseDatasetConfig(
     formatter="coqui",
     dataset_name="phase4_selected_vago",
     path=DATASET_PATH,
-    meta_file_train="metadata.csv",
+    meta_file_train=TRAIN_FILE_NAME,
+    meta_file_val=EVAL_FILE_NAME,
     language="hu",
 )
 
-# Model paths from original training
-model_path = "C:\\Users\\szolzol\\AppData\\Local\\tts\\tts_models--multilingual--multi-dataset--xtts_v2"
-
 # Audio config
 audio_config = XttsAudioConfig(sample_rate=22050, dvae_sample_rate=22050, output_sample_rate=24000)
 
@@ -164,12 +186,12 @@ model_args = GPTArgs(
     max_conditioning_length=143677,  # 6 secs
     min_conditioning_length=66150,   # 3 secs
     debug_loading_failures=False,
-    max_wav_length=530000,  # ~24 seconds (increased for longer samples)
-    max_text_length=400,  # Increased for longer transcriptions
+    max_wav_length=MAX_WAV_LENGTH,
+    max_text_length=MAX_TEXT_LENGTH,
     mel_norm_file=MEL_NORM_FILE,
     dvae_checkpoint=DVAE_CHECKPOINT,
     xtts_checkpoint=None,  # Will be loaded from resume
-    tokenizer_file=f"{model_path}\\vocab.json",
+    tokenizer_file=TOKENIZER_FILE,
     gpt_num_audio_tokens=1026,
     gpt_start_audio_token=1024,
     gpt_stop_audio_token=1025,
@@ -187,9 +209,11 @@ config = GPTTrainerConfig(
     dashboard_logger="tensorboard",
     logger_uri=None,
     audio=audio_config,
+    datasets=[config_dataset],  # Saved to config.json - eval_service.py rebuilds the holdout split from it
     batch_size=BATCH_SIZE,
     batch_group_size=0,
     eval_batch_size=BATCH_SIZE,
+    **precision_config(OPTIONS.precision),
     num_loader_workers=0,
     eval_split_max_size=256,
     eval_split_size=EVAL_SPLIT_SIZE,
@@ -202,9 +226,9 @@ config = GPTTrainerConfig(
     save_all_best=True,
     save_best_after=50,
     target_loss="loss",
-    print_eval=False,  # Disable eval printing
-    run_eval=False,  # Disable evaluation (samples being filtered out)
-    run_eval_steps=None,  # No eval steps
+    print_eval=True,
+    run_eval=not EVAL_SERVICE,  # Eval split is pre-filtered by the training index; scored out of process if EVAL_SERVICE
+    run_eval_steps=None,  # Eval at the end of each epoch
     test_sentences=[],
     
     # Phase 4: Ultra-low learning rate for gentle refinement
@@ -215,7 +239,7 @@ config = GPTTrainerConfig(
     lr_scheduler_params={"milestones": [50000 * 18, 150000 * 18], "gamma": 0.5},
 )
 
-# Load samples
+# Load samples (train/eval come from the pre-filtered index files)
 print("📊 Loading samples...")
 train_samples, eval_samples = load_tts_samples(
     config_dataset,
@@ -226,6 +250,9 @@ train_samples, eval_samples = load_tts_samples(
 
 print(f"   Training samples: {len(train_samples)}")
 print(f"   Evaluation samples: {len(eval_samples)}")
+if DIST:
+    train_samples = shard_samples(train_samples, DIST)
+    print(f"   Samples per process: {len(train_samples)} ({WORLD_SIZE} shards)")
 print()
 
 # Validate dataset size
@@ -238,16 +265,20 @@ if len(train_samples) < 20:
 print("🤖 Initializing model...")
 model = GPTTrainer.init_from_config(config)
 print("   ✅ Model initialized")
+if OPTIONS.gradient_checkpointing:
+    n_blocks = enable_gradient_checkpointing(model)
+    print(f"   ✅ Gradient checkpointing enabled ({n_blocks} GPT blocks)")
 print()
 
 # Trainer - will restore from checkpoint
 print("🎓 Setting up trainer (will restore from checkpoint 1901)...")
 trainer = Trainer(
     TrainerArgs(
-        restore_path=RESUME_CHECKPOINT,  # Resume from best_model_1901
+        restore_path=RESTORE_PATH,  # Resume from best_model_1901
         skip_train_epoch=False,
-        start_with_eval=False,  # Skip initial eval to avoid filtering issues
+        start_with_eval=False,
         grad_accum_steps=1,
+        rank=DIST.rank if DIST else 0,  # Only rank 0 logs and saves
     ),
     config,
     output_path=OUTPUT_PATH,
@@ -259,31 +290,43 @@ trainer = Trainer(
 print("   ✅ Checkpoint 1901 loaded successfully")
 print()
 
-# Add automatic checkpoint cleanup
-print("🧹 Setting up automatic checkpoint cleanup...")
-original_save_checkpoint = trainer.save_checkpoint
+if TRAINING_MODE == "lora":
+    print(f"🧩 Switching to LoRA adapter training (rank {LORA_RANK}, alpha {LORA_ALPHA})...")
+    lora_info = enable_lora_training(trainer, rank=LORA_RANK, alpha=LORA_ALPHA, lr=LORA_LEARNING_RATE)
+    print(f"   ✅ {lora_info['layers']} adapted layers, "
+          f"{lora_info['trainable']:,} / {lora_info['total']:,} parameters trainable "
+          f"(LR {LORA_LEARNING_RATE})")
+    print()
 
-def save_checkpoint_with_cleanup():
-    """Save checkpoint and cleanup old ones"""
-    original_save_checkpoint()
-    
-    from pathlib import Path
-    output_folder = Path(OUTPUT_PATH) / RUN_NAME
-    if output_folder.exists():
-        # Keep only last 3 checkpoints
-        checkpoints = sorted(output_folder.glob("checkpoint_*.pth"))
-        if len(checkpoints) > 3:
-            for old_checkpoint in checkpoints[:-3]:
-                try:
-                    size_mb = old_checkpoint.stat().st_size / (1024**2)
-                    old_checkpoint.unlink()
-                    print(f"  🗑️  Deleted: {old_checkpoint.name} ({size_mb:.0f} MB freed)")
-                except Exception as e:
-                    print(f"  ⚠️  Could not delete {old_checkpoint.name}: {e}")
-
-trainer.save_checkpoint = save_checkpoint_with_cleanup
-print("   ✅ Auto-cleanup enabled (keeps last 3 checkpoints)")
-print()
+if AUTO_BATCH_SIZE:
+    print("📏 Finding the largest batch size that fits...")
+    batch_plan = find_batch_plan(trainer, train_samples, EFFECTIVE_BATCH_SIZE) if IS_MAIN else None
+    batch_plan = broadcast_object(batch_plan, DIST)  # every rank must run the same number of steps
+    apply_batch_plan(trainer, batch_plan)
+    print_batch_plan(batch_plan)
+    print()
+
+gradient_reducer = None
+if DIST:
+    print(f"🔗 Synchronizing {WORLD_SIZE} processes (gloo)...")
+    gradient_reducer = install_distributed(trainer, DIST)
+    print("   ✅ Weights broadcast from rank 0, gradients all-reduced every step")
+    print()
+
+# Background checkpoint writer: saves no longer stop the training loop (rank 0 only)
+checkpoint_writer = None
+if IS_MAIN:
+    print("💾 Setting up background checkpoint writer...")
+    checkpoint_writer = install_async_checkpointing(
+        trainer,
+        RetentionPolicy(keep_last=3, keep_best=2),
+        save_best_after=config.save_best_after,
+        delta_base=RESTORE_PATH if CHECKPOINT_MODE == "delta" else None,
+    )
+    print("   ✅ Async saves enabled (keeps last 3 checkpoints + best 2 by Mel CE)")
+    if CHECKPOINT_MODE == "delta":
+        print(f"   ✅ Delta checkpoints against {Path(RESTORE_PATH).name} (materialize with scripts/delta_checkpoint.py)")
+    print()
 
 print()
 print("=" * 80)
@@ -315,8 +358,46 @@ print()
 print("=" * 80)
 print()
 
+throughput_monitor = ThroughputMonitor.install(
+    trainer,
+    settings=dict(vars(OPTIONS), phase="phase4", mode=TRAINING_MODE, world_size=WORLD_SIZE),
+    log_every=config.print_step,
+    world_size=WORLD_SIZE,
+    step_log_path=Path(OUTPUT_PATH) / "step_times.jsonl" if IS_MAIN else None,
+    gradient_reducer=gradient_reducer,
+)
+eval_process = None
+if EVAL_SERVICE and IS_MAIN:
+    eval_process = start_eval_service(trainer.output_path, EVAL_SERVICE_DEVICE)
+    print(f"📊 Eval service started (PID {eval_process.pid}) - leaderboard: eval_leaderboard.json")
+    monitor_eval_service(trainer, eval_process)
+early_stopping = None
+if EARLY_STOPPING:
+    early_stopping = EarlyStopping.install(
+        trainer, StoppingPolicy(target_mel_ce=TARGET_MEL_CE, text_ce_limit=TEXT_CE_LIMIT, patience=PLATEAU_PATIENCE),
+        eval_process=eval_process,
+    )
+    print(f"📉 Early stopping: target Mel CE {TARGET_MEL_CE}, Text CE guardrail {TEXT_CE_LIMIT}, "
+          f"plateau after {PLATEAU_PATIENCE} evaluations")
+
 # Train!
 trainer.fit()
+if checkpoint_writer is not None:
+    checkpoint_writer.close()
+if IS_MAIN:
+    throughput_monitor.finish(Path(OUTPUT_PATH) / "throughput_log.jsonl")
+if gradient_reducer is not None:
+    print_reducer_report(gradient_reducer, DIST)
+cleanup_distributed(DIST)
+if eval_process is not None:
+    print("📊 Waiting for the eval service to score the last checkpoints...")
+    stop_eval_service(eval_process)
+if early_stopping is not None and IS_MAIN:
+    early_stopping.finish()
+if TRAINING_MODE == "lora" and IS_MAIN:
+    adapter_path = save_adapter(find_gpt2(trainer.model), Path(trainer.output_path) / "adapter_final.pt",
+                                step=trainer.total_steps_done)
+    print(f"🧩 Adapter saved: {adapter_path} (best model: python scripts/gpt_lora.py export best_model.pth adapter.pt)")
 
 print()
 print("=" * 80)
@@ -0,0 +1,279 @@
+"""
+Training Metrics
+================
+Small, dependency-free helpers for measuring training runs.
+
+ThroughputMonitor hooks into the Trainer callbacks and reports steps/sec,
+samples/sec, audio-seconds/sec and peak memory while training, plus where each
+step's time goes:
+- data_wait: waiting for the data loader (between two steps)
+- format_batch: moving the batch to the device + DVAE codes / conditioning mels
+- forward: model forward pass and losses
+- backward: backward pass, gradient clipping and all-reduce
+- optimizer: optimizer.step
+- checkpoint: time the loop is blocked by checkpoint saves
+- other: logging, LR scheduler, zero_grad
+
+Every log_every steps the window is printed, written to TensorBoard
+(Throughput/*, StepTime/*) and optionally appended to a per-window JSONL log.
+At the end, one summary row per run is appended to a JSONL log together with
+the run's settings (phase, precision, gradient checkpointing, batch size), so
+phases and settings can be compared across runs.
+
+Usage:
+  monitor = ThroughputMonitor.install(trainer, settings={"phase": "phase4", "precision": "bf16"},
+                                      step_log_path="run/training_phase4_continuation/step_times.jsonl")
+  trainer.fit()
+  monitor.finish("run/training_phase4_continuation/throughput_log.jsonl")
+"""
+
+import json
+import sys
+import time
+from pathlib import Path
+
+import torch
+
+PHASES = ("data_wait", "format_batch", "forward", "backward", "optimizer", "checkpoint", "other")
+
+
+def peak_memory_mb(device=None):
+    """
+    Peak memory of this process in MB.
+    CUDA: peak allocated tensor memory. CPU: peak resident set size.
+    """
+    if device is not None and torch.device(device).type == "cuda":
+        return torch.cuda.max_memory_allocated(device) / 1024**2
+
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports KB, macOS bytes
+        return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        # peak_wset is the Windows peak working set
+        return getattr(info, "peak_wset", info.rss) / 1024**2
+    except ImportError:
+        return float("nan")
+
+
+class ThroughputMonitor:
+    """Steps/sec, audio-seconds/sec, step-time breakdown and peak memory of a Trainer run"""
+
+    def __init__(self, batch_size, device=None, settings=None, log_every=50, sample_rate=22050, world_size=1,
+                 step_log_path=None):
+        self.batch_size = batch_size
+        self.device = device
+        self.settings = dict(settings or {})
+        self.log_every = log_every
+        self.sample_rate = sample_rate
+        self.world_size = world_size  # audio seconds are measured on this process only
+        self.step_log_path = Path(step_log_path) if step_log_path else None
+        self.steps = 0
+        self.compute_seconds = 0.0  # time inside train_step (excludes data loading)
+        self.audio_seconds = 0.0
+        self.totals = dict.fromkeys(PHASES, 0.0)
+        self.first_step_start = None
+        self.last_step_end = None
+        self._step_start = None
+        self._step = None  # phase times of the running step
+        self._forward_end = None
+        self._sync_seconds = 0.0  # gradient all-reduce inside the running optimizer.step
+        self._loader_start = None
+        self._window = None
+
+    @classmethod
+    def install(cls, trainer, settings=None, log_every=50, world_size=1, step_log_path=None,
+                gradient_reducer=None):
+        """
+        Attach to an initialized Trainer. Install after the checkpoint writer and
+        install_distributed, so their wrappers are timed too.
+        world_size > 1: data-parallel run, samples/sec counts every process's batch
+        gradient_reducer: install_distributed's reducer. Without clipping under
+        mixed precision its all-reduce runs inside optimizer.step - it is moved
+        to backward, where the clipping hook puts it otherwise.
+        """
+        device = "cuda" if trainer.use_cuda else None
+        if device is not None:
+            torch.cuda.reset_peak_memory_stats()
+        audio = getattr(trainer.config, "audio", None)
+        monitor = cls(trainer.config.batch_size * world_size, device=device, settings=settings, log_every=log_every,
+                      sample_rate=getattr(audio, "sample_rate", 22050), world_size=world_size,
+                      step_log_path=step_log_path)
+        trainer.callbacks.callbacks_on_train_epoch_start.append(monitor.on_epoch_start)
+        trainer.callbacks.callbacks_on_train_step_start.append(monitor.on_step_start)
+        trainer.callbacks.callbacks_on_train_step_end.append(monitor.on_step_end)
+
+        model = trainer.model.module if hasattr(trainer.model, "module") else trainer.model
+        trainer.format_batch = monitor._timed(trainer.format_batch, "format_batch", count_audio=True)
+        model.train_step = monitor._timed(model.train_step, "forward", training_only=model)
+        trainer.save_checkpoint = monitor._timed(trainer.save_checkpoint, "checkpoint")
+        trainer.save_best_model = monitor._timed(trainer.save_best_model, "checkpoint")
+        trainer.eval_epoch = monitor._after(trainer.eval_epoch, monitor.on_epoch_start)
+        optimizers = trainer.optimizer if isinstance(trainer.optimizer, list) else [trainer.optimizer]
+        for optimizer in optimizers:
+            optimizer.step = monitor._timed(optimizer.step, "optimizer")
+        if gradient_reducer is not None:
+            gradient_reducer.reduce = monitor._timed_sync(gradient_reducer.reduce)
+        return monitor
+
+    def _now(self):
+        # CUDA kernels run asynchronously - wait for them or the GPU time lands in the wrong phase
+        if self.device is not None:
+            torch.cuda.synchronize(self.device)
+        return time.perf_counter()
+
+    def _timed(self, fn, phase, count_audio=False, training_only=None):
+        """Wrap fn so its duration is added to phase (of the running step, or the totals between steps)"""
+
+        def wrapper(*args, **kwargs):
+            if training_only is not None and not training_only.training:
+                return fn(*args, **kwargs)  # eval_step reuses train_step
+            start = self._now()
+            if phase == "optimizer" and self._forward_end is not None and self._step is not None:
+                self._step["backward"] += start - self._forward_end
+                self._forward_end = None
+            self._sync_seconds = 0.0
+            result = fn(*args, **kwargs)
+            end = self._now()
+            if self._step is not None:
+                sync = self._sync_seconds if phase == "optimizer" else 0.0
+                self._step[phase] += end - start - sync
+                self._step["backward"] += sync
+                if phase == "forward":
+                    self._forward_end = end
+                if count_audio and isinstance(result, dict) and "wav_lengths" in result:
+                    self._step["audio_seconds"] = float(result["wav_lengths"].sum()) / self.sample_rate
+            elif phase == "checkpoint":  # end-of-epoch best model saves
+                self.totals[phase] += end - start
+            return result
+
+        return wrapper
+
+    def _timed_sync(self, fn):
+        """Wrap the gradient all-reduce so the optimizer wrapper can hand its time to backward"""
+
+        def wrapper(*args, **kwargs):
+            start = self._now()
+            result = fn(*args, **kwargs)
+            self._sync_seconds += self._now() - start
+            return result
+
+        return wrapper
+
+    def _after(self, fn, callback):
+        def wrapper(*args, **kwargs):
+            result = fn(*args, **kwargs)
+            callback(None)
+            return result
+
+        return wrapper
+
+    def _new_window(self, start):
+        return {"start": start, "steps": 0, "audio_seconds": 0.0, **dict.fromkeys(PHASES, 0.0)}
+
+    def on_epoch_start(self, trainer):
+        # Data wait restarts here: the gap to the previous step is epoch end / in-loop eval
+        self._loader_start = self._now()
+
+    def on_step_start(self, trainer):
+        self._step_start = self._now()
+        if self.first_step_start is None:
+            self.first_step_start = self._step_start
+        if self._window is None:
+            self._window = self._new_window(self._step_start)
+        loader_start = max((t for t in (self.last_step_end, self._loader_start) if t is not None), default=None)
+        self._step = dict.fromkeys(PHASES, 0.0)
+        self._step["audio_seconds"] = 0.0
+        self._step["data_wait"] = self._step_start - loader_start if loader_start is not None else 0.0
+        self._forward_end = None
+
+    def on_step_end(self, trainer):
+        now = self._now()
+        step, self._step = self._step, None
+        if self._forward_end is not None:  # no optimizer step (gradient accumulation)
+            step["backward"] += now - self._forward_end
+        busy = now - self._step_start
+        step["other"] = max(0.0, busy - sum(step[p] for p in PHASES if p != "data_wait"))
+        self.compute_seconds += busy
+        self.audio_seconds += step["audio_seconds"]
+        self.last_step_end = now
+        self.steps += 1
+        for key in (*PHASES, "audio_seconds"):
+            if key in self.totals:
+                self.totals[key] += step[key]
+            self._window[key] += step[key]
+        self._window["steps"] += 1
+        if self._window["steps"] >= self.log_every:
+            self._log_window(trainer, now)
+            self._window = self._new_window(now)
+
+    def _log_window(self, trainer, now):
+        window = self._window
+        steps = window["steps"]
+        steps_per_sec = steps / (now - window["start"])
+        audio_per_sec = window["audio_seconds"] * self.world_size / (now - window["start"])
+        peak = peak_memory_mb(self.device)
+        step_ms = {phase: window[phase] / steps * 1000 for phase in PHASES}
+        total_ms = sum(step_ms.values()) or 1.0
+        print(f"   ⚡ {steps_per_sec:.2f} steps/s ({steps_per_sec * self.batch_size:.1f} samples/s, "
+              f"{audio_per_sec:.1f} audio-s/s), peak memory {peak:.0f} MB")
+        print("      " + " | ".join(f"{phase} {step_ms[phase] / total_ms:.0%}" for phase in PHASES))
+        if trainer.args.rank == 0:
+            trainer.dashboard_logger.add_scalars(
+                "Throughput",
+                {"steps_per_sec": steps_per_sec, "samples_per_sec": steps_per_sec * self.batch_size,
+                 "audio_seconds_per_sec": audio_per_sec, "peak_memory_mb": peak},
+                trainer.total_steps_done,
+            )
+            trainer.dashboard_logger.add_scalars("StepTime", {f"{p}_ms": v for p, v in step_ms.items()},
+                                                 trainer.total_steps_done)
+        if self.step_log_path is not None:
+            row = {"step": trainer.total_steps_done, "steps": steps, "steps_per_sec": round(steps_per_sec, 4),
+                   "samples_per_sec": round(steps_per_sec * self.batch_size, 4),
+                   "audio_seconds_per_sec": round(audio_per_sec, 3), "peak_memory_mb": round(peak, 1),
+                   "step_ms": {p: round(v, 2) for p, v in step_ms.items()}, "settings": self.settings}
+            self.step_log_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.step_log_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(row) + "\n")
+
+    def summary(self):
+        wall = (self.last_step_end - self.first_step_start) if self.steps else 0.0
+        steps_per_sec = self.steps / wall if wall > 0 else 0.0
+        step_total = sum(self.totals.values()) or 1.0
+        return {
+            "settings": self.settings,
+            "steps": self.steps,
+            "steps_per_sec": round(steps_per_sec, 4),
+            "samples_per_sec": round(steps_per_sec * self.batch_size, 4),
+            "audio_seconds_per_sec": round(self.audio_seconds * self.world_size / wall, 3) if wall > 0 else 0.0,
+            "compute_seconds_per_step": round(self.compute_seconds / self.steps, 4) if self.steps else None,
+            "step_ms": {p: round(v / self.steps * 1000, 2) for p, v in self.totals.items()} if self.steps else {},
+            "step_fraction": {p: round(v / step_total, 4) for p, v in self.totals.items()},
+            "peak_memory_mb": round(peak_memory_mb(self.device), 1),
+            "device": self.device or "cpu",
+        }
+
+    def finish(self, log_path=None):
+        """Print the run summary and append it to log_path (JSONL)"""
+        summary = self.summary()
+        print()
+        print("⚡ Throughput report:")
+        print(f"   • Settings: {', '.join(f'{k}={v}' for k, v in summary['settings'].items())}")
+        print(f"   • Steps: {summary['steps']} at {summary['steps_per_sec']:.2f} steps/s "
+              f"({summary['samples_per_sec']:.1f} samples/s, {summary['audio_seconds_per_sec']:.1f} audio-s/s)")
+        print(f"   • Peak memory: {summary['peak_memory_mb']:.0f} MB ({summary['device']})")
+        if summary["step_ms"]:
+            print("   • Time per step:")
+            for phase in PHASES:
+                print(f"     - {phase:<13} {summary['step_ms'][phase]:>9.1f} ms  ({summary['step_fraction'][phase]:.0%})")
+        if log_path is not None:
+            log_path = Path(log_path)
+            log_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(log_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(summary) + "\n")
+        return summary
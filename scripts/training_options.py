@@ -0,0 +1,55 @@
+"""
+Training Options - Precision, Gradient Checkpointing, Batch Size
+================================================================
+Shared command-line options for the training entry points.
+
+- --precision bf16     autocast in bfloat16 (CUDA and modern CPUs, no loss scaling)
+- --precision fp16     autocast in float16 with a GradScaler (CUDA only; CPUs fall back to bf16)
+- --grad-checkpointing recompute GPT block activations in backward instead of storing them
+- --batch-size N       override the script's BATCH_SIZE
+
+Our options are removed from sys.argv before the Trainer parses the rest,
+so Trainer/Coqpit overrides keep working.
+
+Usage:
+  python scripts/train_phase4_continuation.py --precision bf16 --grad-checkpointing --batch-size 6
+"""
+
+import argparse
+import sys
+
+PRECISIONS = ("fp32", "bf16", "fp16")
+
+
+def parse_training_options(batch_size, precision="fp32", gradient_checkpointing=False, description=None):
+    """Parse our options (defaults = the script constants) and strip them from sys.argv"""
+    parser = argparse.ArgumentParser(description=description, add_help=False)
+    parser.add_argument("--precision", choices=PRECISIONS, default=precision)
+    parser.add_argument("--grad-checkpointing", dest="gradient_checkpointing", action="store_true",
+                        default=gradient_checkpointing)
+    parser.add_argument("--no-grad-checkpointing", dest="gradient_checkpointing", action="store_false")
+    parser.add_argument("--batch-size", type=int, default=batch_size)
+    options, remaining = parser.parse_known_args()
+    sys.argv = [sys.argv[0]] + remaining
+    return options
+
+
+def precision_config(precision):
+    """GPTTrainerConfig fields for a precision setting"""
+    if precision == "fp32":
+        return {"mixed_precision": False, "precision": "fp16"}
+    return {"mixed_precision": True, "precision": precision}
+
+
+def enable_gradient_checkpointing(model):
+    """Checkpoint every GPT-2 block of a GPTTrainer (the transformer is shared with gpt_inference)"""
+    gpt2 = model.xtts.gpt.gpt
+    # Non-reentrant checkpointing also works when the block inputs don't require grad (frozen embeddings, LoRA)
+    gpt2.gradient_checkpointing_enable(gradient_checkpointing_kwargs={"use_reentrant": False})
+    gpt2.config.use_cache = False
+    return len(gpt2.h)
+
+
+def describe_options(options):
+    checkpointing = "on" if options.gradient_checkpointing else "off"
+    return f"precision={options.precision}, grad_checkpointing={checkpointing}, batch_size={options.batch_size}"
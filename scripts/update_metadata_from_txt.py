@@ -1,5 +1,7 @@
 """
 Extract transcriptions from .txt files and update metadata.csv
+
+Superseded by build_phase4_dataset.py (incremental, non-interactive).
 """
 
 import re